@@ -0,0 +1,94 @@
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from src.backend.services.dataset import (
+    TracksDataset,
+    CATEGORICAL_FEATURES,
+    NUMERICAL_FEATURES,
+    categorical_codes_dtype,
+)
+
+# The real dataset has 114 genres
+NUMBER_GENRES = 114
+# The songs are generated around this many "styles", so the clusters look like the real ones
+NUMBER_STYLES = 40
+
+# (min, max) of every numerical feature on spotify_tracks_dataset.csv
+NUMERICAL_RANGES = {
+    "popularity": (0.0, 100.0),
+    "longness": (0.0, 1.0),
+    "danceability": (0.0, 1.0),
+    "energy": (0.0, 1.0),
+    "loudness": (-50.0, 5.0),
+    "speechiness": (0.0, 1.0),
+    "acousticness": (0.0, 1.0),
+    "instrumentalness": (0.0, 1.0),
+    "liveness": (0.0, 1.0),
+    "valence": (0.0, 1.0),
+    "tempo": (0.0, 250.0),
+}
+
+CATEGORIES: Dict[str, List[Any]] = {
+    "time_signature": [0, 1, 3, 4, 5],
+    "mode": [0, 1],
+    "explicit": [False, True],
+    "key": list(range(12)),
+    "track_genre": [f"genre{genre:03d}" for genre in range(NUMBER_GENRES)],
+}
+
+
+def synthetic_dataset(rows: int, seed: int = 0) -> TracksDataset:
+    """
+    Catalog with the schema of spotify_tracks_dataset.csv: every song is a noisy copy of one
+    of NUMBER_STYLES random styles, and its genre depends on the style.
+    It's generated straight as numpy arrays, so we can build catalogs of millions of rows.
+    """
+    random = np.random.default_rng(seed)
+    low = np.array([NUMERICAL_RANGES[feature][0] for feature in NUMERICAL_FEATURES])
+    high = np.array([NUMERICAL_RANGES[feature][1] for feature in NUMERICAL_FEATURES])
+    styles = random.random((NUMBER_STYLES, len(NUMERICAL_FEATURES)))
+    song_styles = random.integers(0, NUMBER_STYLES, rows)
+    numerical = np.empty((rows, len(NUMERICAL_FEATURES)), dtype=np.float32)
+    # By chunks, so we never have a float64 copy of the whole matrix
+    chunk = 1 << 20
+    for start in range(0, rows, chunk):
+        end = min(start + chunk, rows)
+        noise = random.normal(0, 0.08, (end - start, len(NUMERICAL_FEATURES)))
+        unit = np.clip(styles[song_styles[start:end]] + noise, 0, 1)
+        numerical[start:end] = low + unit * (high - low)
+    codes_dtype = categorical_codes_dtype(
+        max(len(values) for values in CATEGORIES.values())
+    )
+    categorical = np.empty((rows, len(CATEGORICAL_FEATURES)), dtype=codes_dtype)
+    for column, feature in enumerate(CATEGORICAL_FEATURES):
+        if feature == "track_genre":
+            genres = (song_styles * 3 + random.integers(0, 3, rows)) % NUMBER_GENRES
+            categorical[:, column] = genres
+        else:
+            categorical[:, column] = random.integers(0, len(CATEGORIES[feature]), rows)
+    track_ids = np.char.add(
+        b"t", np.char.zfill(np.arange(rows).astype(np.bytes_), 21)
+    ).astype("S22")
+    return TracksDataset(
+        track_ids=track_ids,
+        numerical=numerical,
+        categorical=categorical,
+        categories={feature: list(CATEGORIES[feature]) for feature in CATEGORIES},
+    )
+
+
+def to_dataframe(dataset: TracksDataset) -> pd.DataFrame:
+    """
+    The csv rows of the dataset, so we can also time parsing the csv
+    """
+    columns: Dict[str, Any] = {"track_id": list(dataset.iter_track_ids())}
+    columns["artists"] = "artist"
+    columns["track_name"] = "name"
+    for column, feature in enumerate(NUMERICAL_FEATURES):
+        columns[feature] = dataset.numerical[:, column]
+    for column, feature in enumerate(CATEGORICAL_FEATURES):
+        values = np.array(dataset.categories[feature], dtype=object)
+        columns[feature] = values[dataset.categorical[:, column]]
+    return pd.DataFrame(columns)
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from benchmark.catalog import synthetic_dataset, to_dataframe
+from src.backend.services.antirecommender import AntiRecommenderService
+from src.backend.services.dataset import TracksDataset
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_USERS = 50
+# Parsing the csv is only timed up to this size, bigger csvs take minutes (and GBs) to write
+DEFAULT_CSV_MAX_ROWS = 1_000_000
+DEFAULT_TOLERANCE = 0.25
+# Slowdowns smaller than this are noise, even if they're a big percentage
+DEFAULT_MIN_DELTA_MS = 0.1
+MAX_USER_TRACKS = 50
+
+Results = Dict[str, Dict[str, Dict[str, float]]]
+
+
+def _summary(times: List[float]) -> Dict[str, float]:
+    milliseconds = np.array(times) * 1000
+    return {
+        "median_ms": float(np.median(milliseconds)),
+        "p95_ms": float(np.percentile(milliseconds, 95)),
+        "runs": len(times),
+    }
+
+
+def _time_once(function: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def _random_users(track_ids: List[str], users: int, seed: int) -> List[List[str]]:
+    generator = random.Random(seed)
+    return [
+        generator.sample(track_ids, generator.randint(1, MAX_USER_TRACKS))
+        + ["not-in-the-catalog"]
+        for _ in range(users)
+    ]
+
+
+def benchmark_size(
+    rows: int, users: int, csv_max_rows: int, directory: str, seed: int = 0
+) -> Dict[str, Dict[str, float]]:
+    """
+    Times every stage of AntiRecommenderService on a synthetic catalog of `rows` songs.
+    The stages of a request are timed for `users` random users.
+    """
+    data_path = os.path.join(directory, f"tracks_{rows}")
+    dataset = synthetic_dataset(rows, seed)
+    dataset.save(data_path)
+    stages: Dict[str, Dict[str, float]] = {}
+    if rows <= csv_max_rows:
+        csv_path = os.path.join(directory, f"tracks_{rows}.csv")
+        to_dataframe(dataset).to_csv(csv_path, index=False)
+        stages["load_csv"] = _summary(
+            [_time_once(lambda: TracksDataset.from_csv(csv_path))]
+        )
+    del dataset
+
+    AntiRecommenderService.reset()
+    service = AntiRecommenderService(data_path=data_path)
+    stages["load"] = _summary([_time_once(lambda: (service.data, service.catalog))])
+    stages["_initialize_clusters"] = _summary(
+        [_time_once(service._initialize_clusters)]
+    )
+
+    track_ids = list(service.catalog.index)
+    histories = _random_users(track_ids, users, seed)
+    alpha = 0.6
+    times: Dict[str, List[float]] = {
+        stage: []
+        for stage in (
+            "filter_existing_tracks",
+            "_calculate_profiles",
+            "_find_furthest_cluster",
+            "_get_most_similar_song_in_cluster",
+            "antirecommend",
+        )
+    }
+    for history in histories:
+        times["filter_existing_tracks"].append(
+            _time_once(lambda: service.filter_existing_tracks(history))
+        )
+        times["_calculate_profiles"].append(
+            _time_once(lambda: service._calculate_profiles(history))
+        )
+        numerical_profile, categorical_profile = service._calculate_profiles(history)
+        user_cluster = service._get_cluster_of_tracks(history)
+        times["_find_furthest_cluster"].append(
+            _time_once(lambda: service._find_furthest_cluster(user_cluster))
+        )
+        furthest_cluster = service._find_furthest_cluster(user_cluster)
+        times["_get_most_similar_song_in_cluster"].append(
+            _time_once(
+                lambda: service._get_most_similar_song_in_cluster(
+                    furthest_cluster, numerical_profile, categorical_profile, alpha
+                )
+            )
+        )
+        # Without the cache, we want the time of computing the recommendation
+        service.recommendations_cache.clear()
+        times["antirecommend"].append(
+            _time_once(lambda: service.antirecommend(history, alpha))
+        )
+    stages.update({stage: _summary(values) for stage, values in times.items()})
+    AntiRecommenderService.reset()
+    return stages
+
+
+def run(sizes: List[int], users: int, csv_max_rows: int) -> Dict[str, Any]:
+    results: Results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            print(f"Benchmarking {rows} rows...", file=sys.stderr)
+            results[str(rows)] = benchmark_size(rows, users, csv_max_rows, directory)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "users": users,
+        },
+        "results": results,
+    }
+
+
+def compare(
+    results: Results,
+    baseline: Results,
+    tolerance: float = DEFAULT_TOLERANCE,
+    min_delta_ms: float = DEFAULT_MIN_DELTA_MS,
+) -> List[str]:
+    """
+    Stages (of the sizes on both results) whose median is more than `tolerance` slower
+    than on the baseline (and at least min_delta_ms slower).
+
+    Returns:
+        List[str]: A description of every regression.
+    """
+    regressions = []
+    for size, stages in results.items():
+        for stage, summary in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is None:
+                continue
+            current_ms, base_ms = summary["median_ms"], base["median_ms"]
+            if (
+                current_ms > base_ms * (1 + tolerance)
+                and current_ms - base_ms > min_delta_ms
+            ):
+                regressions.append(
+                    f"{stage} with {size} rows: {base_ms:.3f} ms -> {current_ms:.3f} ms "
+                    f"({current_ms / base_ms - 1:+.0%})"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time every stage of the antirecommender on synthetic catalogs"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Rows of every catalog (up to 10M works, with a few GBs of RAM)",
+    )
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS)
+    parser.add_argument("--csv-max-rows", type=int, default=DEFAULT_CSV_MAX_ROWS)
+    parser.add_argument("--output", default=None, help="Save the results (json) here")
+    parser.add_argument(
+        "--compare", default=None, help="Baseline results (json) to find regressions"
+    )
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS)
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.users, args.csv_max_rows)
+    output = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            file.write(output)
+    print(output)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(
+            report["results"], baseline["results"], args.tolerance, args.min_delta_ms
+        )
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
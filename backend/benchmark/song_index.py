@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmark.catalog import synthetic_dataset
+from benchmark.run import _random_users, _summary, _time_once
+from src.backend.services.antirecommender import AntiRecommenderService
+from src.backend.services.song_index import SongIndex, SongIndexConfig
+
+DEFAULT_SIZES = [100_000, 1_000_000]
+DEFAULT_USERS = 50
+DEFAULT_K = 10
+DEFAULT_ALPHA = 0.6
+DEFAULT_CANDIDATES = [16, 64, 256]
+
+
+def _configs(candidates: List[int]) -> Dict[str, Optional[SongIndexConfig]]:
+    configs: Dict[str, Optional[SongIndexConfig]] = {
+        "brute_force": None,
+        "exact": SongIndexConfig(mode="exact"),
+    }
+    for count in candidates:
+        configs[f"approximate_{count}"] = SongIndexConfig(
+            mode="approximate", candidates=count
+        )
+    return configs
+
+
+def benchmark_index(
+    rows: int,
+    users: int,
+    k: int,
+    alpha: float,
+    candidates: List[int],
+    directory: str,
+    seed: int = 0,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Times scoring the k best songs of the furthest cluster of `users` random users, scoring
+    every song of the cluster and with every mode of the song index, on a synthetic catalog
+    of `rows` songs. The recall is the fraction of the k best songs (of scoring every song)
+    that every mode finds.
+    """
+    data_path = os.path.join(directory, f"tracks_{rows}")
+    synthetic_dataset(rows, seed).save(data_path)
+    AntiRecommenderService.reset()
+    service = AntiRecommenderService(data_path=data_path)
+    service.load()
+
+    track_ids = list(service.catalog.index)
+    queries = []
+    for history in _random_users(track_ids, users, seed):
+        numerical_profile, categorical_profile = service._calculate_profiles(history)
+        cluster = service._find_furthest_cluster(
+            service._get_cluster_of_tracks(history)
+        )
+        queries.append((cluster, numerical_profile, categorical_profile))
+
+    results: Dict[str, Dict[str, Any]] = {}
+    expected: List[set[str]] = []
+    for name, config in _configs(candidates).items():
+        build_seconds = 0.0
+        if config is not None:
+            build_seconds = _time_once(
+                lambda: setattr(
+                    service, "_song_index", SongIndex.build(service.layout, config)
+                )
+            )
+        times, recalls = [], []
+        for query, (cluster, numerical_profile, categorical_profile) in enumerate(
+            queries
+        ):
+            times.append(
+                _time_once(
+                    lambda: service._get_most_similar_song_in_cluster(
+                        cluster, numerical_profile, categorical_profile, alpha, k
+                    )
+                )
+            )
+            found = {
+                track.track_id
+                for track in service._get_most_similar_song_in_cluster(
+                    cluster, numerical_profile, categorical_profile, alpha, k
+                )
+            }
+            if config is None:
+                expected.append(found)
+            recalls.append(len(found & expected[query]) / len(expected[query]))
+        results[name] = {
+            **_summary(times),
+            "recall": float(np.mean(recalls)),
+            "build_ms": build_seconds * 1000,
+        }
+    service._song_index = None
+    AntiRecommenderService.reset()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare the recall and latency of the song index modes"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS)
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA)
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        nargs="+",
+        default=DEFAULT_CANDIDATES,
+        help="Candidates of every approximate mode we compare",
+    )
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.sizes:
+            print(f"Benchmarking the song index with {rows} rows...", file=sys.stderr)
+            results[str(rows)] = benchmark_index(
+                rows, args.users, args.k, args.alpha, args.candidates, directory
+            )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,270 @@
-from typing import List
+import asyncio
+import contextlib
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import (
+    AsyncContextManager,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Tuple,
+)
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import (
+    APIRouter,
+    FastAPI,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, PlainTextResponse
 
+from src.backend import metrics
+from src.backend.profiling import (
+    RequestProfiler,
+    Profile,
+    get_request_profiler,
+    PROFILE_HEADER,
+    ADMIN_TOKEN_HEADER,
+)
 from src.backend.schemas.auth import UserToken, MailPetition
-from src.backend.schemas.recommend import RecommendedSong
-from src.backend.services.spotipy_client import SpotifyClient
+from src.backend.schemas.recommend import (
+    RecommendedSong,
+    BatchRecommendPetition,
+    BatchRecommendedTracks,
+    RecommendedTrack,
+    ScoredSong,
+)
+from src.backend.services.async_spotify_client import AsyncSpotifyClient
+from src.backend.services.warm_up import WarmUp, WarmUpState, get_warm_up
 from src.backend.spotify.app import (
     SpotifyApp,
     MailError,
     FetchUsersError,
-    DuplicatedUserInDatabaseError,
     DeletingUserError,
     CreatingUserError,
     TokenExpired,
 )
-from src.backend.spotify.dependencies import get_spotify_app
+from src.backend.spotify.dependencies import (
+    create_spotify_dependencies,
+    get_spotify_app,
+    get_token_refresher,
+    get_whitelist_worker,
+)
+from src.backend.spotify.domain import WhitelistJob
+from src.backend.spotify.infra.http import get_http_pool
+from src.backend.spotify.token_refresher import TokenRefresherState, TokenRefresher
+from src.backend.spotify.whitelist_worker import WhitelistWorker
 
 from src.backend.schemas.recommend import Song
 from src.backend.services.antirecommender import (
     AntiRecommenderService,
+    create_anti_recommender,
     get_anti_recommender,
 )
 
-app = FastAPI(
-    title="AntiRecommender API",
-    description="Recommend you different songs",
-    docs_url="/docs",
-    redoc_url="/redoc",
-    version="0.1.0",
-    swagger_ui_parameters={"syntaxHighlight.theme": "obsidian"},
-)
+MAX_RECOMMENDATIONS = 50
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Wires the services of the server (importing main doesn't open any file or connection)
+    """
+    anti_recommender = create_anti_recommender()
+    warm_up = WarmUp(anti_recommender=anti_recommender)
+    spotify = create_spotify_dependencies()
+    app.state.anti_recommender = anti_recommender
+    app.state.warm_up = warm_up
+    app.state.spotify = spotify
+    background_tasks = [
+        asyncio.create_task(warm_up.run()),
+        asyncio.create_task(spotify.token_refresher.run()),
+        asyncio.create_task(spotify.whitelist_worker.run()),
+    ]
+    yield
+    for task in background_tasks:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await get_http_pool().aclose()
+    spotify.close()
+
+
+router = APIRouter()
+
+
+async def record_request_metrics(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # The template of the path, so /user/jobs/{job_id} is a single route
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unknown"),
+            status=str(status),
+        )
+
+
+async def profile_request(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    """
+    Runs the request under the profiler if profiling is enabled and it has the X-Profile
+    header with the admin token. The response says the id of its profile on X-Profile-Id.
+    """
+    profiler = await get_request_profiler(request)
+    if not profiler.is_admin(request.headers.get(PROFILE_HEADER)):
+        return await call_next(request)
+    profile_id = profiler.profile_id(request.headers.get("X-Request-ID"))
+    with profiler.profile(profile_id) as profiled:
+        response = await call_next(request)
+    if profiled:
+        response.headers["X-Profile-Id"] = profile_id
+    return response
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["*"],
-)
 
+def profiling_admin(
+    admin_token: str | None = Header(default=None, alias=ADMIN_TOKEN_HEADER),
+    profiler: RequestProfiler = Depends(get_request_profiler),
+) -> RequestProfiler:
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not profiler.is_admin(admin_token):
+        raise HTTPException(status_code=403, detail="You need the admin token")
+    return profiler
 
-@app.get("/")
+
+@router.get("/")
 def root() -> str:
     return "Hello world!"
 
 
-@app.post(
+@router.get("/health/live")
+def liveness() -> Dict[str, str]:
+    return {"status": "alive"}
+
+
+@router.get(
+    "/health/ready",
+    response_model=WarmUpState,
+    responses={503: {"model": WarmUpState}},
+)
+async def readiness(
+    response: Response, warm_up: WarmUp = Depends(get_warm_up)
+) -> WarmUpState:
+    """
+    Ready (200) once the antirecommender is loaded and warmed up, 503 until then (or if it failed).
+    Has how long every step of the warm up took.
+    """
+    if not warm_up.ready:
+        response.status_code = 503
+    return warm_up.state
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics() -> PlainTextResponse:
+    """
+    All the metrics of this process, in the prometheus text format
+    """
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@router.get("/admin/profiles", response_model=List[Profile])
+def list_profiles(
+    profiler: RequestProfiler = Depends(profiling_admin),
+) -> List[Profile]:
+    """
+    Profiles of the requests that asked for it, from the newest to the oldest
+    """
+    return profiler.profiles()
+
+
+@router.get("/admin/profiles/{profile_id}", response_class=FileResponse)
+def download_profile(
+    profile_id: str, profiler: RequestProfiler = Depends(profiling_admin)
+) -> FileResponse:
+    """
+    The profile in the pstats format, see it with `python -m pstats` or snakeviz
+    """
+    path = profiler.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(
+            status_code=404, detail="There isn't any profile with this id"
+        )
+    return FileResponse(
+        path, media_type="application/octet-stream", filename=os.path.basename(path)
+    )
+
+
+@router.get("/stats/http")
+def http_connection_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Requests, and new and reused connections, of every host we call
+    """
+    return {
+        host: {
+            "requests": stats.requests,
+            "new_connections": stats.new_connections,
+            "reused_connections": stats.reused_connections,
+        }
+        for host, stats in get_http_pool().stats().items()
+    }
+
+
+@router.get("/stats/token", response_model=TokenRefresherState)
+async def token_refresher_state(
+    token_refresher: TokenRefresher = Depends(get_token_refresher),
+) -> TokenRefresherState:
+    return token_refresher.state
+
+
+@router.post(
     path="/user",
     status_code=200,
+    responses={202: {"model": WhitelistJob}},
 )
 def add_user_to_spotify_project(
-    data: MailPetition, spotify_app: SpotifyApp = Depends(get_spotify_app)
-) -> str:
+    data: MailPetition,
+    response: Response,
+    queue: bool = Query(
+        default=False,
+        description="Add the user in the background: returns 202 with the job, see /user/jobs/{id}",
+    ),
+    spotify_app: SpotifyApp = Depends(get_spotify_app),
+    whitelist_worker: WhitelistWorker = Depends(get_whitelist_worker),
+) -> str | WhitelistJob:
+    if queue:
+        job = whitelist_worker.enqueue(data.mail)
+        if job.is_error:
+            match job.error_value:
+                case MailError():
+                    raise HTTPException(status_code=400, detail=job.error_value.message)
+                case _:
+                    raise HTTPException(status_code=500, detail=job.error_value.message)
+        response.status_code = 202
+        return job.success_value
     result = spotify_app.add_user(data.mail)
     if result.is_error:
         match result.error_value:
             case MailError():
                 raise HTTPException(status_code=400, detail=result.error_value.message)
-            case DuplicatedUserInDatabaseError():
-                raise HTTPException(
-                    status_code=409,
-                    detail="You're saved twice on our database. Please contact the admins",
-                )
             case (
                 FetchUsersError()
                 | DeletingUserError()
@@ -76,34 +277,133 @@ def add_user_to_spotify_project(
     return "ok"
 
 
-@app.post(
+@router.get(path="/user/jobs/{job_id}", response_model=WhitelistJob)
+def whitelist_job_status(
+    job_id: str, whitelist_worker: WhitelistWorker = Depends(get_whitelist_worker)
+) -> WhitelistJob:
+    job = whitelist_worker.jobs.job(job_id)
+    if job.is_error:
+        raise HTTPException(status_code=500, detail=job.error_value.message)
+    if job.success_value is None:
+        raise HTTPException(status_code=404, detail="There isn't any job with this id")
+    return job.success_value
+
+
+def _song_or_placeholder(song: Song | None, track_id: str) -> Song:
+    if song is None:
+        return Song(id=track_id, name="Couldn't fetch name, click to go to the song")
+    return song
+
+
+@router.post(
     path="/recommend",
     response_model=RecommendedSong,
     status_code=200,
 )
-def recommend_songs_for_user_with_token(
+async def recommend_songs_for_user_with_token(
     data: UserToken,
+    k: int = Query(default=1, ge=1, le=MAX_RECOMMENDATIONS),
     anti_recommender: AntiRecommenderService = Depends(get_anti_recommender),
 ) -> RecommendedSong:
-    spotify = SpotifyClient(access_token=data.access_token)
-    songs: List[Song] = spotify.recently_played
+    stage_seconds = metrics.RECOMMEND_STAGE_SECONDS
+    spotify = AsyncSpotifyClient(access_token=data.access_token)
+    with stage_seconds.time(stage="recently_played"):
+        songs: List[Song] = await spotify.recently_played()
     songs_ids = [song.id for song in songs]
-    real_ids_in_dataset = anti_recommender.filter_existing_tracks(songs_ids)
+    # Everything that uses the dataset goes to a thread: while warming up, it waits for the load
+    with stage_seconds.time(stage="filter_existing_tracks"):
+        real_ids_in_dataset = await run_in_threadpool(
+            anti_recommender.filter_existing_tracks, songs_ids
+        )
     is_random = not real_ids_in_dataset
-    track_id = (
-        anti_recommender.get_random_track()
-        if is_random
-        else anti_recommender.antirecommend(songs_ids)
-    )
-    song = spotify.get_song_from_id(song_id=track_id)
-    from_songs = [song for song in songs if song.id in real_ids_in_dataset]
-    if song is None:
-        could_not_fetch_name_and_image = Song(
-            id=track_id, name="Couldn't fetch name, click to go to the song"
+    with stage_seconds.time(stage="random" if is_random else "antirecommend"):
+        scored_tracks: List[Tuple[str, float | None]] = (
+            [
+                (track_id, None)
+                for track_id in await run_in_threadpool(
+                    anti_recommender.get_random_tracks, k
+                )
+            ]
+            if is_random
+            else [
+                (track.track_id, track.score)
+                for track in await run_in_threadpool(
+                    anti_recommender.antirecommend, songs_ids, k=k
+                )
+            ]
         )
-        return RecommendedSong(
-            isRandom=is_random,
-            fromSongs=from_songs,
-            recommended=could_not_fetch_name_and_image,
+    with stage_seconds.time(stage="fetch_songs"):
+        fetched_songs = await spotify.get_songs_from_ids(
+            [track_id for track_id, _ in scored_tracks]
         )
-    return RecommendedSong(isRandom=is_random, fromSongs=from_songs, recommended=song)
+    recommendations = [
+        ScoredSong(**_song_or_placeholder(song, track_id).model_dump(), score=score)
+        for song, (track_id, score) in zip(fetched_songs, scored_tracks)
+    ]
+    from_songs = [song for song in songs if song.id in real_ids_in_dataset]
+    return RecommendedSong(
+        isRandom=is_random,
+        fromSongs=from_songs,
+        recommended=Song(**recommendations[0].model_dump(exclude={"score"})),
+        recommendations=recommendations,
+    )
+
+
+@router.post(
+    path="/recommend/batch",
+    response_model=BatchRecommendedTracks,
+    status_code=200,
+)
+def recommend_tracks_for_many_users(
+    data: BatchRecommendPetition,
+    anti_recommender: AntiRecommenderService = Depends(get_anti_recommender),
+) -> BatchRecommendedTracks:
+    real_ids_in_dataset = [
+        anti_recommender.filter_existing_tracks(user.trackIds) for user in data.users
+    ]
+    track_ids = anti_recommender.antirecommend_many(
+        real_ids_in_dataset, [user.alpha for user in data.users]
+    )
+    return BatchRecommendedTracks(
+        recommendations=[
+            RecommendedTrack(
+                isRandom=track_id is None,
+                fromTracks=from_tracks,
+                recommended=track_id or anti_recommender.get_random_track(),
+            )
+            for track_id, from_tracks in zip(track_ids, real_ids_in_dataset)
+        ]
+    )
+
+
+def create_app(
+    lifespan: Callable[[FastAPI], AsyncContextManager[None]] = lifespan,
+) -> FastAPI:
+    """
+    The server, lifespan wires its services (the tests wire their own ones)
+    """
+    app = FastAPI(
+        lifespan=lifespan,
+        title="AntiRecommender API",
+        description="Recommend you different songs",
+        docs_url="/docs",
+        redoc_url="/redoc",
+        version="0.1.0",
+        swagger_ui_parameters={"syntaxHighlight.theme": "obsidian"},
+    )
+    app.state.profiler = RequestProfiler()
+    app.include_router(router)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["*"],
+    )
+    app.middleware("http")(record_request_metrics)
+    app.middleware("http")(profile_request)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,319 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, TypeVar
+
+from src.backend.services.cache import TTLCache
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, from a sub millisecond recommendation to a slow call to spotify
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@dataclass
+class Metric:
+    """
+    A metric of some type, with a value for every combination of its labels.
+    They're thread safe, so handlers running on the threadpool can use them too.
+    """
+
+    name: str
+    documentation: str
+    label_names: Tuple[str, ...] = ()
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    @property
+    def type(self) -> str:
+        raise NotImplementedError
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f"{self.name} has the labels {self.label_names}, not {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.label_names, key))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+@dataclass
+class Counter(Metric):
+    _values: Dict[LabelValues, float] = field(default_factory=dict, init=False)
+
+    @property
+    def type(self) -> str:
+        return "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self._labels(key), value) for key, value in values]
+
+
+@dataclass
+class Gauge(Metric):
+    _values: Dict[LabelValues, float] = field(default_factory=dict, init=False)
+
+    @property
+    def type(self) -> str:
+        return "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self._labels(key), value) for key, value in values]
+
+
+@dataclass
+class Histogram(Metric):
+    """
+    Counts of the observed values for every bucket (values <= bucket), and their sum.
+    """
+
+    buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    _counts: Dict[LabelValues, List[int]] = field(default_factory=dict, init=False)
+    _sums: Dict[LabelValues, float] = field(default_factory=dict, init=False)
+
+    @property
+    def type(self) -> str:
+        return "histogram"
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                # The last one is +Inf, so it's the count of all the values
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            for position, bucket in enumerate(self.buckets):
+                if value <= bucket:
+                    counts[position] += 1
+            counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        Observes the seconds that the block takes (even if it raises)
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        counts = self._counts.get(self._key(labels))
+        return 0 if counts is None else counts[-1]
+
+    def sum(self, **labels: str) -> float:
+        return self._sums.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            counts = {key: list(values) for key, values in self._counts.items()}
+            sums = dict(self._sums)
+        samples: List[Sample] = []
+        for key, bucket_counts in counts.items():
+            labels = self._labels(key)
+            for bucket, count in zip(self.buckets + (math.inf,), bucket_counts):
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        {**labels, "le": _format_value(bucket)},
+                        count,
+                    )
+                )
+            samples.append((f"{self.name}_sum", labels, sums[key]))
+            samples.append((f"{self.name}_count", labels, bucket_counts[-1]))
+        return samples
+
+
+M = TypeVar("M", bound=Metric)
+
+
+@dataclass
+class Registry:
+    """
+    The metrics of this process. Besides the metrics we update while serving, collectors
+    build metrics on every scrape from stats that other objects already keep (like the hits
+    of a cache), so we don't have to update them twice.
+    """
+
+    _metrics: Dict[str, Metric] = field(default_factory=dict, init=False)
+    _collectors: Dict[str, Callable[[], Iterable[Metric]]] = field(
+        default_factory=dict, init=False
+    )
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def _register(self, metric: M) -> M:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"There's already a metric called {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, label_names: Tuple[str, ...] = ()
+    ) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(
+        self, name: str, documentation: str, label_names: Tuple[str, ...] = ()
+    ) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def add_collector(
+        self, name: str, collector: Callable[[], Iterable[Metric]]
+    ) -> None:
+        """
+        Adds (or replaces, if there's already one with this name) a collector
+        """
+        with self._lock:
+            self._collectors[name] = collector
+
+    def collect(self) -> List[Metric]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+        for collector in collectors:
+            metrics.extend(collector())
+        return metrics
+
+    def render(self) -> str:
+        """
+        All the metrics, in the prometheus text format. Metrics with the same name (like the
+        ones of every cache) are rendered together.
+        """
+        families: Dict[str, List[Metric]] = {}
+        for metric in self.collect():
+            families.setdefault(metric.name, []).append(metric)
+        lines = []
+        for name, metrics in families.items():
+            lines.append(f"# HELP {name} {metrics[0].documentation}")
+            lines.append(f"# TYPE {name} {metrics[0].type}")
+            for metric in metrics:
+                for sample_name, labels, value in metric.samples():
+                    if labels:
+                        rendered_labels = ",".join(
+                            f'{label}="{_escape(label_value)}"'
+                            for label, label_value in labels.items()
+                        )
+                        sample_name = f"{sample_name}{{{rendered_labels}}}"
+                    lines.append(f"{sample_name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Latency of the requests to this server",
+    ("method", "route", "status"),
+)
+RECOMMEND_STAGE_SECONDS = REGISTRY.histogram(
+    "recommend_stage_duration_seconds",
+    "Latency of every stage of POST /recommend",
+    ("stage",),
+)
+ANTIRECOMMENDER_STAGE_SECONDS = REGISTRY.histogram(
+    "antirecommender_stage_duration_seconds",
+    "Latency of every stage of the antirecommender",
+    ("stage",),
+)
+SPOTIFY_API_SECONDS = REGISTRY.histogram(
+    "spotify_api_request_duration_seconds",
+    "Latency of the calls to the spotify web api",
+    ("endpoint",),
+)
+SPOTIFY_API_RESPONSES = REGISTRY.counter(
+    "spotify_api_responses_total",
+    "Responses of the spotify web api by status code (error if there wasn't a response)",
+    ("endpoint", "status"),
+)
+UPSTREAM_RESPONSES = REGISTRY.counter(
+    "upstream_responses_total",
+    "Responses of every host we call, by status code",
+    ("host", "status"),
+)
+TOKEN_REFRESHES = REGISTRY.counter(
+    "spotify_token_refreshes_total",
+    "Refreshes of the token of the spotify app, by result (success or failure)",
+    ("result",),
+)
+TOKEN_REFRESH_SECONDS = REGISTRY.histogram(
+    "spotify_token_refresh_duration_seconds",
+    "Latency of the refreshes of the token of the spotify app",
+)
+
+
+def cache_metrics(cache_name: str, cache: TTLCache[Any, Any]) -> List[Metric]:
+    """
+    Hits, misses and entries of a cache, to add it as a collector
+    """
+    hits = Counter("cache_hits_total", "Hits of every cache", ("cache",))
+    hits.inc(cache.hits, cache=cache_name)
+    misses = Counter("cache_misses_total", "Misses of every cache", ("cache",))
+    misses.inc(cache.misses, cache=cache_name)
+    entries = Gauge("cache_entries", "Entries of every cache", ("cache",))
+    entries.set(len(cache), cache=cache_name)
+    return [hits, misses, entries]
@@ -0,0 +1,165 @@
+import cProfile
+import hmac
+import os
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, List, Mapping, Optional
+
+from pydantic import BaseModel
+from starlette.requests import Request
+
+PROFILING_ENABLED_ENV = "PROFILING_ENABLED"
+PROFILING_TOKEN_ENV = "PROFILING_TOKEN"
+PROFILES_DIRECTORY_ENV = "PROFILES_DIRECTORY"
+PROFILES_KEPT_ENV = "PROFILES_KEPT"
+
+# Requests with this header (and the admin token as value) are profiled
+PROFILE_HEADER = "X-Profile"
+# The admin endpoints of the profiles need the admin token on this header
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+PROFILE_EXTENSION = ".pstats"
+_PROFILE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+@dataclass(frozen=True)
+class ProfilingConfig:
+    """
+    enabled: if false, no request is profiled (whatever its headers) and the admin endpoints 404
+    token: admin token, requests are only profiled if they send it (profiling is disabled without it)
+    directory: where we save the profiles
+    profiles_kept: we delete the oldest profiles when there are more than this
+    """
+
+    enabled: bool = False
+    token: Optional[str] = None
+    directory: str = "./profiles"
+    profiles_kept: int = 50
+
+    @staticmethod
+    def from_env(environment: Mapping[str, str] = os.environ) -> "ProfilingConfig":
+        default = ProfilingConfig()
+        return ProfilingConfig(
+            enabled=environment.get(PROFILING_ENABLED_ENV, "").lower()
+            in ("1", "true", "yes"),
+            token=environment.get(PROFILING_TOKEN_ENV) or None,
+            directory=environment.get(PROFILES_DIRECTORY_ENV, default.directory),
+            profiles_kept=int(
+                environment.get(PROFILES_KEPT_ENV, default.profiles_kept)
+            ),
+        )
+
+
+class Profile(BaseModel):
+    id: str
+    created_at: float
+    size_bytes: int
+
+
+@dataclass
+class RequestProfiler:
+    """
+    Runs single requests under cProfile, and saves their profile (pstats) by request id.
+
+    cProfile measures every thread, so the work that the handlers send to the threadpool is on
+    the profile too. That also means that only one request can be profiled at once (the rest
+    run without profiling meanwhile), and that other requests served at the same time also show
+    up on the profile.
+    """
+
+    config: ProfilingConfig = field(default_factory=ProfilingConfig.from_env)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled and self.config.token is not None
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        if not self.enabled or token is None:
+            return False
+        assert self.config.token is not None
+        return hmac.compare_digest(token.encode(), self.config.token.encode())
+
+    @staticmethod
+    def profile_id(request_id: Optional[str]) -> str:
+        """
+        The request id if it's safe to use it as a file name, otherwise a new one
+        """
+        if request_id is not None and _PROFILE_ID.match(request_id):
+            return request_id
+        return uuid.uuid4().hex
+
+    @contextmanager
+    def profile(self, profile_id: str) -> Iterator[bool]:
+        """
+        Profiles the block and saves it as profile_id.
+
+        Yields:
+            bool: If the block is being profiled (false if there's another profile running).
+        """
+        if not self._lock.acquire(blocking=False):
+            yield False
+            return
+        try:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # There's another profiler running on this process (like a debugger)
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                profiler.disable()
+                os.makedirs(self.config.directory, exist_ok=True)
+                profiler.dump_stats(self._path(profile_id))
+                self._remove_old_profiles()
+        finally:
+            self._lock.release()
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self.config.directory, profile_id + PROFILE_EXTENSION)
+
+    def profiles(self) -> List[Profile]:
+        """
+        Saved profiles, from the newest to the oldest
+        """
+        if not os.path.isdir(self.config.directory):
+            return []
+        profiles = []
+        for entry in os.scandir(self.config.directory):
+            if not entry.name.endswith(PROFILE_EXTENSION):
+                continue
+            stat = entry.stat()
+            profiles.append(
+                Profile(
+                    id=entry.name.removesuffix(PROFILE_EXTENSION),
+                    created_at=stat.st_mtime,
+                    size_bytes=stat.st_size,
+                )
+            )
+        return sorted(profiles, key=lambda profile: profile.created_at, reverse=True)
+
+    def profile_path(self, profile_id: str) -> Optional[str]:
+        """
+        File of the profile, or None if there isn't any profile with this id
+        """
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = self._path(profile_id)
+        return path if os.path.isfile(path) else None
+
+    def _remove_old_profiles(self) -> None:
+        for profile in self.profiles()[self.config.profiles_kept :]:
+            try:
+                os.remove(self._path(profile.id))
+            except FileNotFoundError:
+                pass
+
+
+async def get_request_profiler(request: Request) -> RequestProfiler:
+    profiler: RequestProfiler = request.app.state.profiler
+    return profiler
@@ -1,6 +1,10 @@
 from typing import List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+# Limits of /recommend/batch, so a single petition can't take the whole server
+MAX_BATCH_USERS = 1000
+MAX_TRACKS_PER_USER = 500
 
 
 class Song(BaseModel):
@@ -9,7 +13,31 @@ class Song(BaseModel):
     image: str | None = None
 
 
+class ScoredSong(Song):
+    score: float | None = None
+
+
 class RecommendedSong(BaseModel):
     isRandom: bool
     fromSongs: List[Song]
     recommended: Song
+    recommendations: List[ScoredSong]
+
+
+class UserTracks(BaseModel):
+    trackIds: List[str] = Field(max_length=MAX_TRACKS_PER_USER)
+    alpha: float = Field(default=0.6, ge=0, le=1)
+
+
+class BatchRecommendPetition(BaseModel):
+    users: List[UserTracks] = Field(max_length=MAX_BATCH_USERS)
+
+
+class RecommendedTrack(BaseModel):
+    isRandom: bool
+    fromTracks: List[str]
+    recommended: str
+
+
+class BatchRecommendedTracks(BaseModel):
+    recommendations: List[RecommendedTrack]
@@ -0,0 +1,49 @@
+import argparse
+import os
+
+import uvicorn
+
+from src.backend.services.antirecommender import create_anti_recommender
+from src.backend.services.shared_catalog import SharedCatalog, SHARED_CATALOG_ENV
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Load the antirecommender once, share it, and serve it with many workers"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--name",
+        default=f"antirecommender_{os.getpid()}",
+        help="Name of the shared memory segment",
+    )
+    args = parser.parse_args()
+
+    # Loaded (or fitted) only here, the workers don't read the files
+    os.environ.pop(SHARED_CATALOG_ENV, None)
+    anti_recommender = create_anti_recommender()
+    model = anti_recommender.build_model()
+    layout = anti_recommender.build_layout(model)
+    if anti_recommender.song_index is not None:
+        # Saved next to the layout, the workers memory map it
+        anti_recommender.build_song_index(layout)
+    shared_catalog = SharedCatalog.publish(
+        args.name, anti_recommender.data, model, layout
+    )
+    print(
+        f"Catalog shared on {shared_catalog.name}, with {len(shared_catalog.dataset)} tracks"
+    )
+    # The workers inherit the environment, so their antirecommender attaches to it
+    os.environ[SHARED_CATALOG_ENV] = shared_catalog.name
+    try:
+        uvicorn.run(
+            "src.backend.main:app", host=args.host, port=args.port, workers=args.workers
+        )
+    finally:
+        shared_catalog.unlink()
+
+
+if __name__ == "__main__":
+    main()
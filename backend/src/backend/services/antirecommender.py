@@ -1,84 +1,402 @@
-from typing import List, Tuple, Any, Optional
-import pandas as pd
+import hashlib
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Tuple, Any, Optional
 import numpy as np
-from sklearn.cluster import KMeans
-from scipy.spatial.distance import cdist
+from starlette.requests import Request
+
+from src.backend import metrics
+from src.backend.services.cache import TTLCache
+from src.backend.services.catalog import TrackCatalog
+from src.backend.services.clustering import (
+    ClusteringBackend,
+    ClusteringModel,
+    ClusterLayout,
+    IngestedClusters,
+    KMeansBackend,
+    categorical_digest,
+    clustering_backend,
+    dataset_fingerprint,
+    ingested_directory,
+    layout_directory,
+)
+from src.backend.services.dataset import (
+    TracksDataset,
+    NUMERICAL_FEATURES,
+    CATEGORICAL_FEATURES,
+)
+from src.backend.services.shared_catalog import SharedCatalog, SHARED_CATALOG_ENV
+from src.backend.services.song_index import (
+    SongIndex,
+    SongIndexConfig,
+    song_index_directory,
+)
 
 DEFAULT_NUMBER_CLUSTERS = 30
+DEFAULT_DATA_PATH = "./data/spotify_tracks"
+DEFAULT_MODEL_PATH = "./data/spotify_tracks_clusters.npz"
+DEFAULT_CSV_PATH = "./data/spotify_tracks_dataset.csv"
+# kmeans (default) or minibatch, for catalogs that don't fit in memory
+CLUSTERING_BACKEND_ENV = "CLUSTERING_BACKEND"
+# Max number of (song, user) distances we compute at once when recommending in batch
+MAX_BATCH_DISTANCES = 1 << 22
+RECOMMENDATIONS_CACHE_SIZE = 10_000
+RECOMMENDATIONS_CACHE_TTL_SECONDS = 60 * 60
+
+
+@dataclass(frozen=True)
+class ScoredTrack:
+    track_id: str
+    score: float
+
+
+def top_k(
+    scores: np.ndarray[Any, np.dtype[np.float64]], k: int
+) -> np.ndarray[Any, np.dtype[np.intp]]:
+    """
+    Positions of the k smallest scores, sorted by score (and by position on ties).
+    We only partially sort the scores, so it's cheap when k is way smaller than the scores.
+    """
+    if k == 1:
+        return np.array([np.argmin(scores)])
+    if k < len(scores):
+        candidates = np.argpartition(scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((candidates, scores[candidates]))]
 
 
 class AntiRecommenderService:
     _instance: Optional["AntiRecommenderService"] = None
-    _data: pd.DataFrame = None
+    _data: Optional[TracksDataset] = None
+    _catalog: Optional[TrackCatalog] = None
+    _clusters: Optional[np.ndarray[Any, np.dtype[np.int32]]] = None
     _clusters_centers: Optional[np.ndarray[Any, np.dtype[np.float64]]] = None
+    _layout: Optional[ClusterLayout] = None
+    _model_fingerprint: Optional[str] = None
+    _shared_catalog: Optional[SharedCatalog] = None
+    _song_index: Optional[SongIndex] = None
+    # Reentrant, because loading the clusters reads the dataset (that is loaded under it too)
+    _load_lock: threading.RLock
+    recommendations_cache: TTLCache[str, Tuple[ScoredTrack, ...]]
+    # Seconds that every step of the last load took, and if it had to fit the clusters
+    load_durations: Dict[str, float]
+    model_fitted: Optional[bool] = None
     data_path: str = ""
+    csv_path: Optional[str] = None
+    model_path: Optional[str] = None
     num_clusters: int = DEFAULT_NUMBER_CLUSTERS
+    clustering_backend: ClusteringBackend = KMeansBackend()
+    # Name of the SharedCatalog to attach to, instead of loading the dataset and clusters
+    shared_catalog: Optional[str] = None
+    # Index of the songs of every cluster, without it we score all the songs of the cluster
+    song_index: Optional[SongIndexConfig] = None
 
     def __new__(
-        cls, data_path: str, num_clusters: int = DEFAULT_NUMBER_CLUSTERS
+        cls,
+        data_path: str,
+        num_clusters: int = DEFAULT_NUMBER_CLUSTERS,
+        model_path: Optional[str] = None,
+        csv_path: Optional[str] = None,
+        clustering_backend: ClusteringBackend = KMeansBackend(),
+        shared_catalog: Optional[str] = None,
+        song_index: Optional[SongIndexConfig] = None,
     ) -> "AntiRecommenderService":
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance.data_path = data_path
             cls._instance.num_clusters = num_clusters
+            cls._instance.model_path = model_path
+            cls._instance.csv_path = csv_path
+            cls._instance.clustering_backend = clustering_backend
+            cls._instance.shared_catalog = shared_catalog
+            cls._instance.song_index = song_index
+            cls._instance._load_lock = threading.RLock()
+            cls._instance.load_durations = {}
+            cls._instance.recommendations_cache = TTLCache(
+                max_size=RECOMMENDATIONS_CACHE_SIZE,
+                ttl=RECOMMENDATIONS_CACHE_TTL_SECONDS,
+            )
+            cache = cls._instance.recommendations_cache
+            metrics.REGISTRY.add_collector(
+                "recommendations_cache",
+                lambda: metrics.cache_metrics("recommendations", cache),
+            )
         return cls._instance
 
+    @classmethod
+    def reset(cls) -> None:
+        """
+        Forgets the service, so the next one is created with its own arguments
+        """
+        cls._instance = None
+
     @property
-    def data(self) -> pd.DataFrame:
+    def data(self) -> TracksDataset:
         if self._data is None:
-            self._data = pd.read_csv(self.data_path)
+            self._load_dataset()
+        assert self._data is not None, "It's loaded by _load_dataset"
         return self._data
 
+    @property
+    def catalog(self) -> TrackCatalog:
+        if self._catalog is None:
+            self._load_dataset()
+        assert self._catalog is not None, "It's loaded by _load_dataset"
+        return self._catalog
+
     @property
     def numerical_features(self) -> List[str]:
-        return [
-            "popularity",
-            "longness",
-            "danceability",
-            "energy",
-            "loudness",
-            "speechiness",
-            "acousticness",
-            "instrumentalness",
-            "liveness",
-            "valence",
-            "tempo",
-        ]
+        return NUMERICAL_FEATURES
 
     @property
     def categorical_features(self) -> List[str]:
-        return ["time_signature", "mode", "explicit", "key", "track_genre"]
+        return CATEGORICAL_FEATURES
 
-    def _get_user_tracks(self, user_track_ids: List[str]) -> pd.DataFrame:
-        return self.data[self.data["track_id"].isin(user_track_ids)]
+    @property
+    def clusters(self) -> np.ndarray[Any, np.dtype[np.int32]]:
+        assert (
+            self._clusters is not None
+        ), "You shouldn't call this if we don't have any clusters..."
+        return self._clusters
+
+    @property
+    def layout(self) -> ClusterLayout:
+        assert (
+            self._layout is not None
+        ), "You shouldn't call this if we don't have any clusters..."
+        return self._layout
+
+    def _get_user_tracks(
+        self, user_track_ids: List[str]
+    ) -> np.ndarray[Any, np.dtype[np.intp]]:
+        return self.catalog.positions(user_track_ids)
 
     def _calculate_profiles(
         self, user_track_ids: List[str]
     ) -> Tuple[
-        np.ndarray[Any, np.dtype[np.float64]], np.ndarray[Any, np.dtype[np.object_]]
+        np.ndarray[Any, np.dtype[np.float64]],
+        np.ndarray[Any, np.dtype[np.signedinteger[Any]]],
     ]:
         user_tracks = self._get_user_tracks(user_track_ids)
-        numerical_profile = user_tracks[self.numerical_features].mean(axis=0).values
-        categorical_profile = (
-            user_tracks[self.categorical_features].mode(axis=0).iloc[0].values
+        numerical_profile = self.data.numerical[user_tracks].mean(
+            axis=0, dtype=np.float64
+        )
+        categorical_profile = self._categorical_modes(
+            self.data.categorical[user_tracks]
         )
         return numerical_profile, categorical_profile
 
+    def _categorical_modes(
+        self, codes: np.ndarray[Any, np.dtype[np.signedinteger[Any]]]
+    ) -> np.ndarray[Any, np.dtype[np.signedinteger[Any]]]:
+        """
+        Mode of every categorical feature (the smallest code on ties), with a single bincount:
+        the codes of feature i are shifted to [i * max_categories, (i + 1) * max_categories)
+        """
+        num_features = codes.shape[1]
+        max_categories = self.data.max_categories
+        shifted_codes = codes + np.arange(num_features) * max_categories
+        counts = np.bincount(
+            shifted_codes.ravel(), minlength=num_features * max_categories
+        ).reshape(num_features, max_categories)
+        return counts.argmax(axis=1).astype(codes.dtype)
+
+    def _fingerprint(self, rows: Optional[int] = None) -> str:
+        """
+        The dataset_fingerprint of the first rows of the dataset (all of them by default)
+        """
+        return dataset_fingerprint(
+            track_ids=self.data.track_ids[:rows],
+            numerical_data=self.data.numerical[:rows],
+            numerical_features=self.numerical_features,
+            num_clusters=self.num_clusters,
+            backend=self.clustering_backend,
+        )
+
+    def build_model(self) -> ClusteringModel:
+        """
+        Returns the clustering of the dataset. It's read from model_path if the saved
+        one was built from this same dataset (and the tracks ingested since, see ingest),
+        otherwise we fit it again (and save it).
+        """
+        if self.model_path is not None:
+            saved_model = self._saved_model(self.model_path)
+            if saved_model is not None:
+                self.model_fitted = False
+                return saved_model
+        model = ClusteringModel.fit(
+            self.data.numerical,
+            self.num_clusters,
+            self._fingerprint(),
+            backend=self.clustering_backend,
+        )
+        self.model_fitted = True
+        if self.model_path is not None:
+            model.save(self.model_path)
+        return model
+
+    def _saved_model(self, model_path: str) -> Optional[ClusteringModel]:
+        model = ClusteringModel.load(model_path)
+        if (
+            model is None
+            or len(model.labels) > len(self.data)
+            or model.fingerprint != self._fingerprint(rows=len(model.labels))
+        ):
+            return None
+        if len(model.labels) == len(self.data):
+            return model
+        # The rows after the fitted ones were ingested
+        ingested = IngestedClusters.open(ingested_directory(model_path))
+        if ingested is None:
+            return None
+        return ingested.merge(
+            model, self.data.track_ids, self.data.numerical, self.data.categorical
+        )
+
+    def build_layout(self, model: ClusteringModel) -> ClusterLayout:
+        """
+        Returns the features of the dataset grouped by the clusters of model. Like the model,
+        it's opened (memory mapped) from next to model_path if it was built from this same
+        clustering and dataset, otherwise we build it again (and save it).
+        """
+        if self.model_path is None:
+            return ClusterLayout.build(
+                model, self.num_clusters, self.data.numerical, self.data.categorical
+            )
+        directory = layout_directory(self.model_path)
+        fingerprint = ClusterLayout.layout_fingerprint(
+            model.fingerprint,
+            categorical_digest(self.data.categorical[: model.fitted_rows]),
+        )
+        layout = ClusterLayout.open(directory)
+        if layout is not None and layout.fingerprint == fingerprint:
+            return layout
+        return ClusterLayout.write(
+            model,
+            self.num_clusters,
+            self.data.numerical,
+            self.data.categorical,
+            directory,
+        )
+
+    @contextmanager
+    def _timed(self, step: str) -> Iterator[None]:
+        start = time.perf_counter()
+        with metrics.ANTIRECOMMENDER_STAGE_SECONDS.time(stage=step):
+            yield
+        self.load_durations[step] = time.perf_counter() - start
+
     def _initialize_clusters(self) -> None:
-        numerical_data = self.data[self.numerical_features].values
-        kmeans = KMeans(n_clusters=self.num_clusters, random_state=42)
-        self.data["cluster"] = kmeans.fit_predict(numerical_data)
-        self._clusters_centers = kmeans.cluster_centers_
+        with self._timed("load_model"):
+            model = self.build_model()
+        with self._timed("load_layout"):
+            self._layout = self.build_layout(model)
+        self._build_song_index()
+        self._clusters = model.labels
+        self._clusters_centers = model.centers
+        if self._model_fingerprint != model.fingerprint:
+            # The recommendations we saved were computed with another dataset or clusters
+            self.recommendations_cache.clear()
+        self._model_fingerprint = model.fingerprint
+
+    def build_song_index(self, layout: ClusterLayout) -> SongIndex:
+        """
+        Returns the song index of layout. Like the layout, it's opened (memory mapped) from
+        next to model_path if it was built from this same layout, otherwise we build it again
+        (and save it).
+        """
+        config = self.song_index or SongIndexConfig()
+        if self.model_path is None:
+            return SongIndex.build(layout, config)
+        directory = song_index_directory(self.model_path)
+        song_index = SongIndex.open(directory, layout, config)
+        if song_index is not None:
+            return song_index
+        if self.shared_catalog is not None:
+            # serve saves it before starting the workers. Without it, they would all race to
+            # save it, so every worker builds its own in memory
+            return SongIndex.build(layout, config)
+        return SongIndex.write(layout, config, directory)
+
+    def _build_song_index(self) -> None:
+        if self.song_index is None:
+            return
+        with self._timed("load_song_index"):
+            self._song_index = self.build_song_index(self.layout)
+
+    def _attach_shared_catalog(self, name: str) -> None:
+        with self._timed("attach_shared_catalog"):
+            shared_catalog = SharedCatalog.attach(name)
+        # The arrays point to its memory, so it lives as long as the service
+        self._shared_catalog = shared_catalog
+        self._data = shared_catalog.dataset
+        # The hash index of the ids can't be shared, every process builds its own
+        with self._timed("load_catalog"):
+            self._catalog = TrackCatalog.from_track_ids(
+                shared_catalog.dataset.iter_track_ids()
+            )
+        self._layout = shared_catalog.layout
+        self._build_song_index()
+        self._clusters = shared_catalog.model.labels
+        self._clusters_centers = shared_catalog.model.centers
+        self._model_fingerprint = shared_catalog.model.fingerprint
+        self.model_fitted = False
+
+    def _load_dataset(self) -> None:
+        """
+        Loads the dataset and its catalog (without the clustering). Like load, only one thread
+        loads them, and with a shared_catalog they are attached from it.
+        """
+        with self._load_lock:
+            if self.shared_catalog is not None:
+                self.load()
+                return
+            if self._data is None:
+                with self._timed("load_dataset"):
+                    self._data = TracksDataset.load(
+                        self.data_path, csv_path=self.csv_path
+                    )
+            if self._catalog is None:
+                with self._timed("load_catalog"):
+                    self._catalog = TrackCatalog.from_track_ids(
+                        self._data.iter_track_ids()
+                    )
+
+    def load(self) -> None:
+        """
+        Loads the dataset, its catalog and its clustering, so no request has to wait for it.
+        If many threads call it at once, only one of them loads and the rest wait for it.
+        With a shared_catalog, they are attached from it instead (nothing is read or fitted).
+        """
+        if self._clusters_centers is not None:
+            return
+        with self._load_lock:
+            if self._clusters_centers is not None:
+                return
+            with self._timed("load"):
+                if self.shared_catalog is not None:
+                    self._attach_shared_catalog(self.shared_catalog)
+                    return
+                self._load_dataset()
+                self._initialize_clusters()
 
     def _get_cluster_of_tracks(self, track_ids: List[str]) -> int:
         user_tracks = self._get_user_tracks(track_ids)
-        user_cluster = user_tracks["cluster"].mode().iloc[0]
+        user_cluster = np.argmax(np.bincount(self.clusters[user_tracks]))
         return int(user_cluster)
 
     def _find_furthest_cluster(self, user_cluster: int) -> int:
         assert (
             self._clusters_centers is not None
         ), "You shouldn't call this if we don't have any clusters..."
+        # scipy is slow to import, so the server only imports it when it recommends
+        from scipy.spatial.distance import cdist
+
         distances = cdist(
             [self._clusters_centers[user_cluster]],
             self._clusters_centers,
@@ -91,9 +409,10 @@ class AntiRecommenderService:
         self,
         cluster: int,
         numerical_profile: np.ndarray[Any, np.dtype[np.float64]],
-        categorical_profile: np.ndarray[Any, np.dtype[np.object_]],
+        categorical_profile: np.ndarray[Any, np.dtype[np.signedinteger[Any]]],
         alpha: float,
-    ) -> str:
+        k: int = 1,
+    ) -> List[ScoredTrack]:
         """
         Do:
             - For each numerical value of the dataset:
@@ -119,48 +438,285 @@ class AntiRecommenderService:
                This means, if categorical are different, the rows will have more 1's
                If they are similar, they will have more 0's
 
-            Then, we combine both distances and get the minimum one for the closest song
+            Then, we combine both distances and get the k minimum ones for the closest songs
 
         """
-        cluster_songs = self.data[self.data["cluster"] == cluster]
-        numerical_distances = np.linalg.norm(
-            cluster_songs[self.numerical_features].values - numerical_profile, axis=1
+        rows, combined_distances = self._best_songs_in_cluster(
+            cluster, numerical_profile, categorical_profile, alpha, k
         )
-        categorical_distances = np.sum(
-            cluster_songs[self.categorical_features].values != categorical_profile,
-            axis=1,
-        ) / len(self.categorical_features)
-        combined_distances = (
-            alpha * numerical_distances + (1 - alpha) * categorical_distances
+        return [
+            ScoredTrack(track_id=self.data.track_id(row), score=float(score))
+            for row, score in zip(rows, combined_distances)
+        ]
+
+    def _best_songs_in_cluster(
+        self,
+        cluster: int,
+        numerical_profile: np.ndarray[Any, np.dtype[np.float64]],
+        categorical_profile: np.ndarray[Any, np.dtype[np.signedinteger[Any]]],
+        alpha: float,
+        k: int,
+    ) -> Tuple[
+        np.ndarray[Any, np.dtype[np.intp]], np.ndarray[Any, np.dtype[np.float64]]
+    ]:
+        """
+        Rows of the dataset of the k best songs of the cluster, and their scores (the best first).
+        With the song index, we only score its candidates instead of every song of the cluster.
+        """
+
+        def scores(
+            positions: slice | np.ndarray[Any, np.dtype[np.intp]],
+        ) -> np.ndarray[Any, np.dtype[np.float64]]:
+            numerical_distances = np.linalg.norm(
+                self.layout.numerical[positions] - numerical_profile, axis=1
+            )
+            categorical_distances = np.count_nonzero(
+                self.layout.categorical[positions] != categorical_profile,
+                axis=1,
+            ) / len(self.categorical_features)
+            combined_distances: np.ndarray[Any, np.dtype[np.float64]] = (
+                alpha * numerical_distances + (1 - alpha) * categorical_distances
+            )
+            return combined_distances
+
+        cluster_songs: slice | np.ndarray[Any, np.dtype[np.intp]] = (
+            self.layout.cluster(cluster)
+            if self._song_index is None
+            else self._song_index.candidates(
+                cluster, numerical_profile, alpha, k, scores
+            )
         )
-        closest_song_index = np.argmin(combined_distances)
-        return str(cluster_songs.iloc[closest_song_index]["track_id"])
+        combined_distances = scores(cluster_songs)
+        best = top_k(combined_distances, k)
+        return self.layout.rows[cluster_songs][best], combined_distances[best]
 
-    def antirecommend(self, user_track_ids: List[str], alpha: float = 0.6) -> str:
+    def antirecommend(
+        self, user_track_ids: List[str], alpha: float = 0.6, k: int = 1
+    ) -> List[ScoredTrack]:
         """
-        Finds and returns a track ID that is outside the user's comfort zone but still somewhat similar.
+        Finds and returns the track IDs that are outside the user's comfort zone but still somewhat similar.
 
         This function identifies the user's cluster, finds the furthest away cluster, and selects
-        the most similar song in that cluster to the user's profile.
+        the k most similar songs in that cluster to the user's profile.
 
         Args:
             user_track_ids (List[str]): A list of track IDs representing the user's preferences.
             alpha (float): A weighting factor for numerical versus categorical dissimilarities.
+            k (int): How many songs we should recommend.
 
         Returns:
-            str: The track ID of the recommended song.
+            List[ScoredTrack]: The (at most k) recommended tracks, from the best to the worst score.
+        """
+        self.load()
+
+        key = self._recommendation_key(user_track_ids, alpha, k)
+        cached = self.recommendations_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        stage_seconds = metrics.ANTIRECOMMENDER_STAGE_SECONDS
+        with stage_seconds.time(stage="profiles"):
+            numerical_profile, categorical_profile = self._calculate_profiles(
+                user_track_ids
+            )
+            user_cluster = self._get_cluster_of_tracks(user_track_ids)
+        with stage_seconds.time(stage="furthest_cluster"):
+            furthest_cluster = self._find_furthest_cluster(user_cluster)
+        with stage_seconds.time(stage="scoring"):
+            recommendations = self._get_most_similar_song_in_cluster(
+                furthest_cluster, numerical_profile, categorical_profile, alpha, k
+            )
+        self.recommendations_cache.put(key, tuple(recommendations))
+        return recommendations
+
+    def _recommendation_key(
+        self, user_track_ids: List[str], alpha: float, k: int
+    ) -> str:
+        """
+        Identifies a recommendation. The recommendation only depends on which tracks of the
+        user are on the dataset (neither their order nor repetitions matter), alpha, k, and
+        the dataset and clusters we're using.
+        """
+        digest = hashlib.sha256()
+        digest.update(f"{self._model_fingerprint};alpha={alpha!r};k={k};".encode())
+        tracks_on_dataset = sorted(set(self.filter_existing_tracks(user_track_ids)))
+        digest.update("\n".join(tracks_on_dataset).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _modes_by_user(
+        users: np.ndarray[Any, np.dtype[np.intp]],
+        values: np.ndarray[Any, Any],
+        num_users: int,
+        num_values: int,
+    ) -> np.ndarray[Any, np.dtype[np.intp]]:
         """
-        if self._clusters_centers is None:
-            self._initialize_clusters()
+        Mode of the values of every user (the smallest one on ties, like the single user path).
+        users[i] is the user that values[i] belongs to.
+        """
+        counts = np.bincount(
+            users * num_values + values, minlength=num_users * num_values
+        ).reshape(num_users, num_values)
+        return np.argmax(counts, axis=1)
+
+    def _calculate_many_profiles(
+        self, users_tracks: List[np.ndarray[Any, np.dtype[np.intp]]]
+    ) -> Tuple[
+        np.ndarray[Any, np.dtype[np.float64]],
+        np.ndarray[Any, np.dtype[np.signedinteger[Any]]],
+        np.ndarray[Any, np.dtype[np.intp]],
+    ]:
+        """
+        Same as _calculate_profiles and _get_cluster_of_tracks, but for all the users at once.
+        Every user should have at least one track on the dataset.
 
-        numerical_profile, categorical_profile = self._calculate_profiles(
-            user_track_ids
+        Returns:
+            The numerical profiles (users x numerical features), the categorical profiles
+            (users x categorical features) and the cluster of every user.
+        """
+        num_users = len(users_tracks)
+        lengths = np.array([len(tracks) for tracks in users_tracks])
+        tracks = np.concatenate(users_tracks)
+        users = np.repeat(np.arange(num_users), lengths)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        numerical_profiles = (
+            np.add.reduceat(
+                self.data.numerical[tracks].astype(np.float64), starts, axis=0
+            )
+            / lengths[:, None]
         )
-        user_cluster = self._get_cluster_of_tracks(user_track_ids)
-        furthest_cluster = self._find_furthest_cluster(user_cluster)
-        return self._get_most_similar_song_in_cluster(
-            furthest_cluster, numerical_profile, categorical_profile, alpha
+        categorical = self.data.categorical[tracks]
+        categorical_profiles = np.stack(
+            [
+                self._modes_by_user(
+                    users,
+                    categorical[:, column],
+                    num_users,
+                    len(self.data.categories[feature]),
+                )
+                for column, feature in enumerate(self.categorical_features)
+            ],
+            axis=1,
+        ).astype(categorical.dtype)
+        user_clusters = self._modes_by_user(
+            users, self.clusters[tracks], num_users, self.num_clusters
         )
+        return numerical_profiles, categorical_profiles, user_clusters
+
+    def _find_furthest_clusters(
+        self, user_clusters: np.ndarray[Any, np.dtype[np.intp]]
+    ) -> np.ndarray[Any, np.dtype[np.intp]]:
+        assert (
+            self._clusters_centers is not None
+        ), "You shouldn't call this if we don't have any clusters..."
+        from scipy.spatial.distance import cdist
+
+        distances = cdist(
+            self._clusters_centers[user_clusters],
+            self._clusters_centers,
+            metric="euclidean",
+        )
+        return np.argmax(distances, axis=1)
+
+    def _get_most_similar_songs_in_clusters(
+        self,
+        clusters: np.ndarray[Any, np.dtype[np.intp]],
+        numerical_profiles: np.ndarray[Any, np.dtype[np.float64]],
+        categorical_profiles: np.ndarray[Any, np.dtype[np.signedinteger[Any]]],
+        alphas: np.ndarray[Any, np.dtype[np.float64]],
+    ) -> np.ndarray[Any, np.dtype[np.intp]]:
+        """
+        Same as _get_most_similar_song_in_cluster, but for many users: the users that go to the same
+        cluster are scored together, with a (songs x users) distance matrix.
+
+        Returns:
+            The row of the dataset recommended to every user.
+        """
+        from scipy.spatial.distance import cdist
+
+        recommended = np.empty(len(clusters), dtype=np.intp)
+        if self._song_index is not None:
+            # Every user has its own candidates, so they're scored one by one
+            for user, cluster in enumerate(clusters):
+                rows, _ = self._best_songs_in_cluster(
+                    int(cluster),
+                    numerical_profiles[user],
+                    categorical_profiles[user],
+                    float(alphas[user]),
+                    k=1,
+                )
+                recommended[user] = rows[0]
+            return recommended
+        for cluster in np.unique(clusters):
+            cluster_songs = self.layout.cluster(int(cluster))
+            cluster_numerical = self.layout.numerical[cluster_songs]
+            cluster_categorical = self.layout.categorical[cluster_songs]
+            cluster_rows = self.layout.rows[cluster_songs]
+            cluster_users = np.flatnonzero(clusters == cluster)
+            chunk = max(1, MAX_BATCH_DISTANCES // len(cluster_rows))
+            for start in range(0, len(cluster_users), chunk):
+                users = cluster_users[start : start + chunk]
+                numerical_distances = cdist(
+                    cluster_numerical, numerical_profiles[users], metric="euclidean"
+                )
+                categorical_distances = np.zeros_like(numerical_distances)
+                for column in range(len(self.categorical_features)):
+                    categorical_distances += (
+                        cluster_categorical[:, column, None]
+                        != categorical_profiles[None, users, column]
+                    )
+                categorical_distances /= len(self.categorical_features)
+                combined_distances = (
+                    alphas[users] * numerical_distances
+                    + (1 - alphas[users]) * categorical_distances
+                )
+                recommended[users] = cluster_rows[np.argmin(combined_distances, axis=0)]
+        return recommended
+
+    def antirecommend_many(
+        self, users_track_ids: List[List[str]], alphas: List[float]
+    ) -> List[Optional[str]]:
+        """
+        Same as antirecommend (with k = 1), but for many users at once. All the profiles,
+        clusters and distances are computed together with matrix operations, instead of
+        user by user.
+
+        Args:
+            users_track_ids (List[List[str]]): The track IDs of every user.
+            alphas (List[float]): The alpha (see antirecommend) of every user.
+
+        Returns:
+            List[Optional[str]]: The recommended track ID of every user, or None if the user
+            doesn't have any track on the dataset.
+        """
+        assert len(users_track_ids) == len(
+            alphas
+        ), "Every user should have its own alpha"
+        self.load()
+
+        users_tracks = [self._get_user_tracks(ids) for ids in users_track_ids]
+        known_users = [user for user, tracks in enumerate(users_tracks) if len(tracks)]
+        recommendations: List[Optional[str]] = [None] * len(users_track_ids)
+        if not known_users:
+            return recommendations
+        stage_seconds = metrics.ANTIRECOMMENDER_STAGE_SECONDS
+        with stage_seconds.time(stage="batch_profiles"):
+            numerical_profiles, categorical_profiles, user_clusters = (
+                self._calculate_many_profiles(
+                    [users_tracks[user] for user in known_users]
+                )
+            )
+        with stage_seconds.time(stage="batch_furthest_clusters"):
+            furthest_clusters = self._find_furthest_clusters(user_clusters)
+        with stage_seconds.time(stage="batch_scoring"):
+            recommended = self._get_most_similar_songs_in_clusters(
+                furthest_clusters,
+                numerical_profiles,
+                categorical_profiles,
+                np.array([alphas[user] for user in known_users], dtype=np.float64),
+            )
+        for user, position in zip(known_users, recommended):
+            recommendations[user] = self.data.track_id(position)
+        return recommendations
 
     def filter_existing_tracks(self, track_ids: List[str]) -> List[str]:
         """
@@ -173,11 +729,7 @@ class AntiRecommenderService:
             List[str]: A list of track IDs that are present in the dataset.
 
         """
-        return [
-            track_id
-            for track_id in track_ids
-            if track_id in self.data["track_id"].values
-        ]
+        return self.catalog.filter_existing(track_ids)
 
     def get_random_track(self) -> str:
         """
@@ -187,13 +739,39 @@ class AntiRecommenderService:
             str: A random track ID present in the dataset.
 
         """
-        return str(self.data.sample(n=1)["track_id"].iloc[0])
+        return self.data.track_id(random.randrange(len(self.data)))
 
+    def get_random_tracks(self, k: int) -> List[str]:
+        """
+        Returns k different random track IDs (or all of them, if the dataset has less).
 
-_anti_recommender = AntiRecommenderService(
-    data_path="./data/spotify_tracks_dataset.csv"
-)
+        Args:
+            k (int): How many tracks we want.
 
+        Returns:
+            List[str]: Random track IDs present in the dataset.
 
-async def get_anti_recommender() -> AntiRecommenderService:
-    return _anti_recommender
+        """
+        positions = random.sample(range(len(self.data)), min(k, len(self.data)))
+        return [self.data.track_id(position) for position in positions]
+
+
+def create_anti_recommender() -> AntiRecommenderService:
+    """
+    The antirecommender of the server. Nothing is loaded until we call load (or recommend)
+    """
+    return AntiRecommenderService(
+        data_path=DEFAULT_DATA_PATH,
+        model_path=DEFAULT_MODEL_PATH,
+        csv_path=DEFAULT_CSV_PATH,
+        clustering_backend=clustering_backend(
+            os.environ.get(CLUSTERING_BACKEND_ENV, "kmeans")
+        ),
+        shared_catalog=os.environ.get(SHARED_CATALOG_ENV) or None,
+        song_index=SongIndexConfig.from_env(),
+    )
+
+
+async def get_anti_recommender(request: Request) -> AntiRecommenderService:
+    anti_recommender: AntiRecommenderService = request.app.state.anti_recommender
+    return anti_recommender
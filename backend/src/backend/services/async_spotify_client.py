@@ -0,0 +1,130 @@
+import time
+from typing import Any, Dict, List
+
+import httpx
+from pydantic import ValidationError
+
+from src.backend import metrics
+from src.backend.schemas.recommend import Song
+from src.backend.schemas.spotify import RecentlyPlayed, Track
+from src.backend.services.cache import TTLCache
+from src.backend.spotify.infra.http import get_http_pool
+
+SPOTIFY_API_URL = "https://api.spotify.com/v1"
+RECENTLY_PLAYED_LIMIT = 50
+# Spotify's several tracks endpoint accepts at most 50 ids
+MAX_TRACKS_PER_REQUEST = 50
+SONGS_CACHE_SIZE = 50_000
+SONGS_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Name and image of the songs, shared by all the requests
+songs_cache: TTLCache[str, Song] = TTLCache(
+    max_size=SONGS_CACHE_SIZE, ttl=SONGS_CACHE_TTL_SECONDS
+)
+metrics.REGISTRY.add_collector(
+    "songs_cache", lambda: metrics.cache_metrics("songs", songs_cache)
+)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    return get_http_pool().async_client(SPOTIFY_API_URL)
+
+
+class AsyncSpotifyClient:
+    """
+    Same as SpotifyClient, but without blocking: all the calls to spotify go
+    through the shared async connection pool of the HttpPool.
+    """
+
+    def __init__(
+        self,
+        access_token: str,
+        http: httpx.AsyncClient | None = None,
+        cache: TTLCache[str, Song] | None = None,
+    ):
+        self.http = http if http is not None else get_http_client()
+        self.cache = cache if cache is not None else songs_cache
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+
+    async def _get(self, path: str, params: Dict[str, Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            response = await self.http.get(path, params=params, headers=self.headers)
+        except httpx.HTTPError:
+            metrics.SPOTIFY_API_RESPONSES.inc(endpoint=path, status="error")
+            raise
+        finally:
+            metrics.SPOTIFY_API_SECONDS.observe(
+                time.perf_counter() - start, endpoint=path
+            )
+        metrics.SPOTIFY_API_RESPONSES.inc(
+            endpoint=path, status=str(response.status_code)
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def recently_played(self) -> List[Song]:
+        try:
+            recently_played = RecentlyPlayed(
+                **await self._get(
+                    "/me/player/recently-played", {"limit": RECENTLY_PLAYED_LIMIT}
+                )
+            )
+            songs = [
+                AsyncSpotifyClient.__to_song(played.track)
+                for played in recently_played.items
+            ]
+        except (httpx.HTTPError, ValidationError, ValueError):
+            return []
+        for song in songs:
+            self.cache.put(song.id, song)
+        return songs
+
+    async def get_song_from_id(self, song_id: str) -> Song | None:
+        return (await self.get_songs_from_ids([song_id]))[0]
+
+    async def get_songs_from_ids(self, song_ids: List[str]) -> List[Song | None]:
+        """
+        Returns the songs from the cache, and asks spotify for the rest of them with
+        the several tracks endpoint (one call for every 50 songs we don't have).
+        Songs that spotify can't give us are None.
+        """
+        songs: Dict[str, Song | None] = {
+            song_id: self.cache.get(song_id) for song_id in dict.fromkeys(song_ids)
+        }
+        missing = [song_id for song_id, song in songs.items() if song is None]
+        for start in range(0, len(missing), MAX_TRACKS_PER_REQUEST):
+            for song in await self._fetch_songs(
+                missing[start : start + MAX_TRACKS_PER_REQUEST]
+            ):
+                self.cache.put(song.id, song)
+                songs[song.id] = song
+        return [songs[song_id] for song_id in song_ids]
+
+    async def _fetch_songs(self, song_ids: List[str]) -> List[Song]:
+        try:
+            response = await self._get("/tracks", {"ids": ",".join(song_ids)})
+            tracks = response["tracks"]
+        except (httpx.HTTPError, ValueError, KeyError, TypeError):
+            return []
+        songs = []
+        for spotify_track in tracks:
+            try:
+                songs.append(AsyncSpotifyClient.__to_song(Track(**spotify_track)))
+            except (ValidationError, TypeError):
+                continue
+        return songs
+
+    @staticmethod
+    def __to_song(track: Track) -> Song:
+        return Song(
+            id=track.id,
+            name=track.name,
+            image=AsyncSpotifyClient.__get_image_url(track),
+        )
+
+    @staticmethod
+    def __get_image_url(track: Track) -> str | None:
+        if len(track.album.images) > 0:
+            return track.album.images[0].url
+        return None
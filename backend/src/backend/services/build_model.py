@@ -0,0 +1,49 @@
+import argparse
+
+from src.backend.services.antirecommender import (
+    AntiRecommenderService,
+    DEFAULT_NUMBER_CLUSTERS,
+)
+from src.backend.services.clustering import CLUSTERING_BACKENDS, clustering_backend
+from src.backend.services.dataset import TracksDataset
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Fit the clusters of the dataset and save them, so the server doesn't have to"
+    )
+    parser.add_argument("--data", default="./data/spotify_tracks")
+    parser.add_argument(
+        "--csv", default=None, help="Convert this csv to the --data directory first"
+    )
+    parser.add_argument("--model", default="./data/spotify_tracks_clusters.npz")
+    parser.add_argument("--clusters", type=int, default=DEFAULT_NUMBER_CLUSTERS)
+    parser.add_argument(
+        "--backend",
+        choices=list(CLUSTERING_BACKENDS),
+        default="kmeans",
+        help="minibatch fits the clusters by chunks, for datasets that don't fit in memory",
+    )
+    parser.add_argument(
+        "--song-index",
+        action="store_true",
+        help="Build the song index too, for the servers with SONG_INDEX",
+    )
+    args = parser.parse_args()
+    if args.csv is not None:
+        TracksDataset.from_csv(args.csv).save(args.data)
+    service = AntiRecommenderService(
+        data_path=args.data,
+        num_clusters=args.clusters,
+        model_path=args.model,
+        clustering_backend=clustering_backend(args.backend),
+    )
+    model = service.build_model()
+    layout = service.build_layout(model)
+    if args.song_index:
+        service.build_song_index(layout)
+    print(f"Clusters saved on {args.model} (fingerprint {model.fingerprint})")
+
+
+if __name__ == "__main__":
+    main()
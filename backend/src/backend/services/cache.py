@@ -0,0 +1,52 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class TTLCache(Generic[K, V]):
+    """
+    Thread safe LRU cache, where every entry also expires ttl seconds after being saved.
+    When it's full, saving a new entry evicts the least recently used one.
+    """
+
+    max_size: int
+    ttl: float
+    time_now: Callable[[], float] = lambda: time.monotonic()
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+    _entries: "OrderedDict[K, Tuple[float, V]]" = field(
+        default_factory=OrderedDict, init=False
+    )
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.time_now():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: K, value: V) -> None:
+        with self._lock:
+            self._entries[key] = (self.time_now() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class TrackCatalog:
+    """
+    Hash index over the track ids of the dataset.
+
+    The dataset can have the same track more than once (for example, one row per genre),
+    so every track id points to all the rows where it appears:
+        - index: track id -> position inside the unique ids
+        - rows: row positions of the dataset, grouped by track id
+        - offsets: rows of the unique id i are rows[offsets[i]:offsets[i + 1]]
+
+    This way, membership is O(1) and getting the rows of a user only depends on the
+    length of his history, not on the size of the dataset.
+    """
+
+    index: Dict[str, int]
+    rows: np.ndarray[Any, np.dtype[np.intp]]
+    offsets: np.ndarray[Any, np.dtype[np.intp]]
+
+    @staticmethod
+    def from_track_ids(track_ids: Iterable[str]) -> "TrackCatalog":
+        index: Dict[str, int] = {}
+        codes = np.fromiter(
+            (index.setdefault(str(track_id), len(index)) for track_id in track_ids),
+            dtype=np.intp,
+        )
+        rows = np.argsort(codes, kind="stable")
+        offsets = np.zeros(len(index) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(codes, minlength=len(index)), out=offsets[1:])
+        return TrackCatalog(index=index, rows=rows, offsets=offsets)
+
+    def __contains__(self, track_id: object) -> bool:
+        return track_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def filter_existing(self, track_ids: List[str]) -> List[str]:
+        return [track_id for track_id in track_ids if track_id in self.index]
+
+    def positions(self, track_ids: List[str]) -> np.ndarray[Any, np.dtype[np.intp]]:
+        """
+        Returns the (sorted) row positions of the dataset for the given track ids.
+        Ids that aren't on the dataset are ignored, and repeated ids are only counted once.
+        """
+        codes = {
+            self.index[track_id] for track_id in track_ids if track_id in self.index
+        }
+        if not codes:
+            return np.empty(0, dtype=np.intp)
+        positions = np.concatenate(
+            [self.rows[self.offsets[code] : self.offsets[code + 1]] for code in codes]
+        )
+        positions.sort()
+        return positions
@@ -0,0 +1,663 @@
+import hashlib
+import json
+import os
+import shutil
+import zipfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+
+from src.backend.services.dataset import append_rows
+
+# Bump it when the way we fit (or save) the clusters changes, so old artifacts get refitted
+CLUSTERING_VERSION = 3
+RANDOM_STATE = 42
+# Rows that the mini batch backend reads (and converts to float64) at once
+DEFAULT_CHUNK_ROWS = 65_536
+# Times that the mini batch backend goes over the whole dataset
+DEFAULT_EPOCHS = 3
+# Free rows that the saved layout leaves after every cluster (as a fraction of its rows), so
+# the ingested tracks are written there instead of writing the whole layout again
+DEFAULT_LAYOUT_SLACK = 0.1
+
+LAYOUT_ROWS_FILE = "rows.npy"
+LAYOUT_OFFSETS_FILE = "offsets.npy"
+LAYOUT_NUMERICAL_FILE = "numerical.npy"
+LAYOUT_CATEGORICAL_FILE = "categorical.npy"
+LAYOUT_METADATA_FILE = "metadata.json"
+INGESTED_LABELS_FILE = "labels.npy"
+INGESTED_METADATA_FILE = "metadata.json"
+
+
+def layout_directory(model_path: str) -> str:
+    """
+    Where we save the ClusterLayout of the clustering saved on model_path
+    """
+    return f"{os.path.splitext(model_path)[0]}_layout"
+
+
+def ingested_directory(model_path: str) -> str:
+    """
+    Where we save the IngestedClusters of the clustering saved on model_path
+    """
+    return f"{os.path.splitext(model_path)[0]}_ingested"
+
+
+def categorical_digest(
+    categorical: np.ndarray[Any, Any], chunk_rows: int = DEFAULT_CHUNK_ROWS
+) -> str:
+    """
+    Identifies the categorical codes of the dataset (part of the layout fingerprint)
+    """
+    digest = hashlib.sha256(str(categorical.dtype).encode())
+    # By chunks, so a memory mapped dataset is never copied whole
+    for start in range(0, len(categorical), chunk_rows):
+        digest.update(np.ascontiguousarray(categorical[start : start + chunk_rows]))
+    return digest.hexdigest()
+
+
+Labels = np.ndarray[Any, np.dtype[np.int32]]
+Centers = np.ndarray[Any, np.dtype[np.float64]]
+
+
+class ClusteringBackend(ABC):
+    """
+    How we fit the clusters. Every backend gives a label for every row of the dataset and
+    the center of every cluster (in float64), so the rest of the code doesn't care which one we use.
+    """
+
+    @property
+    @abstractmethod
+    def key(self) -> str:
+        """
+        Identifies the backend and its parameters (it's part of the dataset fingerprint)
+        """
+
+    @abstractmethod
+    def fit(
+        self, numerical_data: np.ndarray[Any, Any], num_clusters: int
+    ) -> Tuple[Labels, Centers]:
+        pass
+
+
+@dataclass(frozen=True)
+class KMeansBackend(ClusteringBackend):
+    """
+    KMeans over the whole dataset at once (in float64, so it needs twice the dataset in memory)
+    """
+
+    @property
+    def key(self) -> str:
+        return "kmeans"
+
+    def fit(
+        self, numerical_data: np.ndarray[Any, Any], num_clusters: int
+    ) -> Tuple[Labels, Centers]:
+        # sklearn is slow to import, and we only need it when there isn't a saved model
+        from sklearn.cluster import KMeans
+
+        kmeans = KMeans(n_clusters=num_clusters, random_state=RANDOM_STATE)
+        # In float64 (even if the dataset is float32), like the csv values, so we get the same clusters
+        labels = kmeans.fit_predict(numerical_data.astype(np.float64))
+        return labels.astype(np.int32), kmeans.cluster_centers_
+
+
+@dataclass(frozen=True)
+class MiniBatchKMeansBackend(ClusteringBackend):
+    """
+    MiniBatchKMeans fitted over chunks of chunk_rows rows, `epochs` times over the dataset (the
+    chunks in a different order every time). Only one chunk is in memory (in float64) at once,
+    so with a memory mapped dataset we can cluster catalogs that don't fit in memory.
+    The clusters are approximately the ones of KMeans, not the same ones.
+    """
+
+    chunk_rows: int = DEFAULT_CHUNK_ROWS
+    epochs: int = DEFAULT_EPOCHS
+
+    @property
+    def key(self) -> str:
+        return f"minibatch(chunk_rows={self.chunk_rows},epochs={self.epochs})"
+
+    def _chunks(self, rows: int) -> List[Tuple[int, int]]:
+        # Chunks of (almost) the same size, so no chunk is too small to start the clusters with
+        number_chunks = max(1, -(-rows // self.chunk_rows))
+        bounds = np.linspace(0, rows, number_chunks + 1).astype(int)
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    def fit(
+        self, numerical_data: np.ndarray[Any, Any], num_clusters: int
+    ) -> Tuple[Labels, Centers]:
+        from sklearn.cluster import MiniBatchKMeans
+
+        kmeans = MiniBatchKMeans(n_clusters=num_clusters, random_state=RANDOM_STATE)
+        chunks = self._chunks(len(numerical_data))
+        generator = np.random.default_rng(RANDOM_STATE)
+        for _ in range(self.epochs):
+            for chunk in generator.permutation(len(chunks)):
+                start, end = chunks[chunk]
+                kmeans.partial_fit(numerical_data[start:end].astype(np.float64))
+        labels = np.empty(len(numerical_data), dtype=np.int32)
+        for start, end in chunks:
+            labels[start:end] = kmeans.predict(
+                numerical_data[start:end].astype(np.float64)
+            )
+        return labels, kmeans.cluster_centers_
+
+
+CLUSTERING_BACKENDS: Dict[str, Type[ClusteringBackend]] = {
+    "kmeans": KMeansBackend,
+    "minibatch": MiniBatchKMeansBackend,
+}
+
+
+def clustering_backend(name: str) -> ClusteringBackend:
+    """
+    The backend called name (with its default parameters)
+    """
+    backend = CLUSTERING_BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(
+            f"Unknown clustering backend {name}, use one of {list(CLUSTERING_BACKENDS)}"
+        )
+    return backend()
+
+
+def dataset_fingerprint(
+    track_ids: np.ndarray[Any, Any],
+    numerical_data: np.ndarray[Any, Any],
+    numerical_features: List[str],
+    num_clusters: int,
+    backend: ClusteringBackend = KMeansBackend(),
+) -> str:
+    """
+    Identifies the clustering that we would get for this data. If anything of the dataset,
+    the feature list, the number of clusters, the backend or the clustering code changes,
+    so does the fingerprint.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"v{CLUSTERING_VERSION};k={num_clusters};{backend.key};".encode())
+    digest.update(",".join(numerical_features).encode())
+    # The arrays are hashed without copying them (they can be bigger than the memory)
+    digest.update(np.ascontiguousarray(track_ids))
+    digest.update(np.ascontiguousarray(numerical_data))
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class ClusteringModel:
+    """
+    Result of clustering the dataset:
+        - labels: cluster of every row of the dataset
+        - centers: coordinates of every cluster, in the numerical features space
+        - fingerprint: the dataset_fingerprint of the data that generated this clustering
+        - ingested_rows: the last rows of labels weren't fitted but ingested (see
+          IngestedClusters), and then the fingerprint is the one of the IngestedClusters
+    """
+
+    labels: Labels
+    centers: Centers
+    fingerprint: str
+    ingested_rows: int = 0
+
+    @property
+    def fitted_rows(self) -> int:
+        return len(self.labels) - self.ingested_rows
+
+    @staticmethod
+    def fit(
+        numerical_data: np.ndarray[Any, Any],
+        num_clusters: int,
+        fingerprint: str,
+        backend: ClusteringBackend = KMeansBackend(),
+    ) -> "ClusteringModel":
+        labels, centers = backend.fit(numerical_data, num_clusters)
+        return ClusteringModel(labels=labels, centers=centers, fingerprint=fingerprint)
+
+    def save(self, path: str) -> None:
+        assert self.ingested_rows == 0, (
+            "The ingested rows are saved by IngestedClusters"
+        )
+        # Write to a temporary file and rename it, so other processes never read half an artifact
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez(
+                file,
+                labels=self.labels,
+                centers=self.centers,
+                fingerprint=np.array(self.fingerprint),
+            )
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load(path: str) -> Optional["ClusteringModel"]:
+        try:
+            with np.load(path, allow_pickle=False) as artifact:
+                return ClusteringModel(
+                    labels=artifact["labels"],
+                    centers=artifact["centers"],
+                    fingerprint=str(artifact["fingerprint"]),
+                )
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+
+def ingested_fingerprint(
+    previous: str,
+    track_ids: np.ndarray[Any, Any],
+    numerical_data: np.ndarray[Any, Any],
+    categorical: np.ndarray[Any, Any],
+) -> str:
+    """
+    Identifies the rows of an ingest, made after the one with the fingerprint previous (or the
+    fit). Only the new rows are hashed, so an ingest doesn't read the whole dataset again.
+    """
+    digest = hashlib.sha256(previous.encode())
+    digest.update(np.ascontiguousarray(track_ids))
+    digest.update(np.ascontiguousarray(numerical_data))
+    digest.update(np.ascontiguousarray(categorical))
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class IngestedClusters:
+    """
+    Clusters of the tracks ingested since the clustering was fitted (see ingest), saved next to
+    it, so every ingest only writes its own tracks:
+        - model_fingerprint: fingerprint of the ClusteringModel they were ingested on
+        - segments: rows of every ingest, in order (they follow the fitted rows on the dataset)
+        - labels: cluster of every ingested row
+        - centers: the centers after the last ingest, that can move them
+        - fingerprint: the ingested_fingerprint of the last ingest
+    """
+
+    model_fingerprint: str
+    segments: List[int]
+    labels: Labels
+    centers: Centers
+    fingerprint: str
+
+    @property
+    def rows(self) -> int:
+        return sum(self.segments)
+
+    def merge(
+        self,
+        model: ClusteringModel,
+        track_ids: np.ndarray[Any, Any],
+        numerical_data: np.ndarray[Any, Any],
+        categorical: np.ndarray[Any, Any],
+    ) -> Optional[ClusteringModel]:
+        """
+        The clustering of the whole dataset: the fitted model and these ingested rows. None if
+        they weren't ingested on model, or the dataset doesn't have those rows.
+        """
+        assert model.ingested_rows == 0, "model has to be the fitted one"
+        if self.model_fingerprint != model.fingerprint or len(
+            model.labels
+        ) + self.rows != len(track_ids):
+            return None
+        fingerprint = model.fingerprint
+        start = len(model.labels)
+        for rows in self.segments:
+            end = start + rows
+            fingerprint = ingested_fingerprint(
+                fingerprint,
+                track_ids[start:end],
+                numerical_data[start:end],
+                categorical[start:end],
+            )
+            start = end
+        if fingerprint != self.fingerprint:
+            return None
+        return ClusteringModel(
+            labels=np.concatenate([model.labels, self.labels]),
+            centers=self.centers,
+            fingerprint=fingerprint,
+            ingested_rows=self.rows,
+        )
+
+    @staticmethod
+    def start(
+        directory: str,
+        model: ClusteringModel,
+        labels: Labels,
+        centers: Centers,
+        track_ids: np.ndarray[Any, Any],
+        numerical_data: np.ndarray[Any, Any],
+        categorical: np.ndarray[Any, Any],
+    ) -> "IngestedClusters":
+        """
+        Saves the first ingest on the fitted model (replacing the ones on another model)
+        """
+        ingested = IngestedClusters(
+            model_fingerprint=model.fingerprint,
+            segments=[len(labels)],
+            labels=labels,
+            centers=centers,
+            fingerprint=ingested_fingerprint(
+                model.fingerprint, track_ids, numerical_data, categorical
+            ),
+        )
+        temporary_directory = f"{directory.rstrip(os.sep)}.{os.getpid()}.tmp"
+        os.makedirs(temporary_directory, exist_ok=True)
+        np.save(os.path.join(temporary_directory, INGESTED_LABELS_FILE), labels)
+        ingested._save_metadata(temporary_directory)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.replace(temporary_directory, directory)
+        return ingested
+
+    def append(
+        self,
+        directory: str,
+        labels: Labels,
+        centers: Centers,
+        track_ids: np.ndarray[Any, Any],
+        numerical_data: np.ndarray[Any, Any],
+        categorical: np.ndarray[Any, Any],
+    ) -> "IngestedClusters":
+        """
+        Saves another ingest after these ones, that were opened from directory. The labels are
+        appended to its file in place and the metadata is renamed last, like the dataset.
+        """
+        appended = IngestedClusters(
+            model_fingerprint=self.model_fingerprint,
+            segments=[*self.segments, len(labels)],
+            labels=np.concatenate([self.labels, labels]),
+            centers=centers,
+            fingerprint=ingested_fingerprint(
+                self.fingerprint, track_ids, numerical_data, categorical
+            ),
+        )
+        append_rows(
+            os.path.join(directory, INGESTED_LABELS_FILE),
+            self.rows,
+            labels.astype(np.int32),
+        )
+        appended._save_metadata(directory)
+        return appended
+
+    def _save_metadata(self, directory: str) -> None:
+        temporary_path = os.path.join(
+            directory, f"{INGESTED_METADATA_FILE}.{os.getpid()}.tmp"
+        )
+        with open(temporary_path, "w") as file:
+            json.dump(
+                {
+                    "model_fingerprint": self.model_fingerprint,
+                    "segments": self.segments,
+                    "centers": self.centers.tolist(),
+                    "fingerprint": self.fingerprint,
+                },
+                file,
+            )
+        os.replace(temporary_path, os.path.join(directory, INGESTED_METADATA_FILE))
+
+    @staticmethod
+    def open(directory: str) -> Optional["IngestedClusters"]:
+        try:
+            with open(os.path.join(directory, INGESTED_METADATA_FILE)) as file:
+                metadata = json.load(file)
+            segments = [int(rows) for rows in metadata["segments"]]
+            labels = np.load(os.path.join(directory, INGESTED_LABELS_FILE))
+            if len(labels) < sum(segments):
+                return None
+            return IngestedClusters(
+                model_fingerprint=str(metadata["model_fingerprint"]),
+                segments=segments,
+                # The file can have the labels of an ingest that hasn't finished yet
+                labels=labels[: sum(segments)],
+                centers=np.array(metadata["centers"], dtype=np.float64),
+                fingerprint=str(metadata["fingerprint"]),
+            )
+        except (OSError, KeyError, TypeError, ValueError):
+            return None
+
+
+@dataclass(frozen=True)
+class ClusterLayout:
+    """
+    Copy of the features of the dataset, with the rows of every cluster one after the other:
+        - rows: the dataset row of every position, grouped by cluster
+        - offsets: the space of cluster c goes from offsets[c] to offsets[c + 1]
+        - ends: cluster c goes from offsets[c] to ends[c], the rest of its space (-1 on rows)
+          is for the tracks we ingest (see append)
+        - numerical, categorical: the features of the dataset, in the order of rows
+        - fingerprint: identifies the clustering and categorical codes it was built from
+        - categorical_digest: the categorical_digest of the fitted rows of the dataset
+
+    This way, getting the songs of a cluster is a slice (no boolean masks or copies).
+    It's saved next to the clustering and opened with memory mapping, like the dataset, so
+    the workers of a machine share it instead of having their own copy.
+    """
+
+    rows: np.ndarray[Any, np.dtype[np.intp]]
+    offsets: np.ndarray[Any, np.dtype[np.intp]]
+    ends: np.ndarray[Any, np.dtype[np.intp]]
+    numerical: np.ndarray[Any, Any]
+    categorical: np.ndarray[Any, Any]
+    fingerprint: str
+    categorical_digest: str
+
+    @staticmethod
+    def layout_fingerprint(model_fingerprint: str, categorical_digest: str) -> str:
+        # The model fingerprint already covers the track ids and the numerical features (and the
+        # categorical codes of the ingested rows)
+        return hashlib.sha256(
+            f"{model_fingerprint};{categorical_digest}".encode()
+        ).hexdigest()
+
+    @staticmethod
+    def _order(
+        model: ClusteringModel, num_clusters: int
+    ) -> Tuple[np.ndarray[Any, np.dtype[np.intp]], np.ndarray[Any, np.dtype[np.intp]]]:
+        # Stable, so inside a cluster the songs keep the order of the dataset
+        rows = np.argsort(model.labels, kind="stable")
+        offsets = np.zeros(num_clusters + 1, dtype=np.intp)
+        np.cumsum(np.bincount(model.labels, minlength=num_clusters), out=offsets[1:])
+        return rows, offsets
+
+    @staticmethod
+    def build(
+        model: ClusteringModel,
+        num_clusters: int,
+        numerical: np.ndarray[Any, Any],
+        categorical: np.ndarray[Any, Any],
+    ) -> "ClusterLayout":
+        """
+        The layout in memory, see write to build it straight to disk
+        """
+        rows, offsets = ClusterLayout._order(model, num_clusters)
+        digest = categorical_digest(categorical[: model.fitted_rows])
+        return ClusterLayout(
+            rows=rows,
+            offsets=offsets,
+            ends=offsets[1:].copy(),
+            numerical=np.ascontiguousarray(numerical[rows]),
+            categorical=np.ascontiguousarray(categorical[rows]),
+            fingerprint=ClusterLayout.layout_fingerprint(model.fingerprint, digest),
+            categorical_digest=digest,
+        )
+
+    @staticmethod
+    def write(
+        model: ClusteringModel,
+        num_clusters: int,
+        numerical: np.ndarray[Any, Any],
+        categorical: np.ndarray[Any, Any],
+        directory: str,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+        slack: float = DEFAULT_LAYOUT_SLACK,
+    ) -> "ClusterLayout":
+        """
+        Like build(...).save(directory), but the features are copied to the files chunk_rows
+        rows at a time, so only a chunk of them is in memory at once, and every cluster gets
+        `slack` times its rows of free space for the ingested tracks. Returns the layout opened
+        from directory.
+        """
+        rows, compact_offsets = ClusterLayout._order(model, num_clusters)
+        sizes = np.diff(compact_offsets)
+        offsets = np.zeros(num_clusters + 1, dtype=np.intp)
+        np.cumsum(sizes + np.ceil(sizes * slack).astype(np.intp), out=offsets[1:])
+        # Where every row of rows goes, once every cluster starts at its offset
+        positions = np.arange(len(rows)) + np.repeat(
+            offsets[:-1] - compact_offsets[:-1], sizes
+        )
+        temporary_directory = ClusterLayout._temporary_directory(directory)
+        output_rows = np.full(offsets[-1], -1, dtype=np.intp)
+        output_rows[positions] = rows
+        np.save(os.path.join(temporary_directory, LAYOUT_ROWS_FILE), output_rows)
+        np.save(os.path.join(temporary_directory, LAYOUT_OFFSETS_FILE), offsets)
+        for file_name, features in (
+            (LAYOUT_NUMERICAL_FILE, numerical),
+            (LAYOUT_CATEGORICAL_FILE, categorical),
+        ):
+            output = np.lib.format.open_memmap(
+                os.path.join(temporary_directory, file_name),
+                mode="w+",
+                dtype=features.dtype,
+                shape=(int(offsets[-1]), *features.shape[1:]),
+            )
+            for start in range(0, len(rows), chunk_rows):
+                end = start + chunk_rows
+                output[positions[start:end]] = features[rows[start:end]]
+            output.flush()
+            del output
+        digest = categorical_digest(categorical[: model.fitted_rows], chunk_rows)
+        ClusterLayout._save_metadata(
+            temporary_directory,
+            ClusterLayout.layout_fingerprint(model.fingerprint, digest),
+            digest,
+            offsets[:-1] + sizes,
+        )
+        ClusterLayout._replace_directory(temporary_directory, directory)
+        layout = ClusterLayout.open(directory)
+        assert layout is not None, f"We just saved the layout on {directory}"
+        return layout
+
+    def append(
+        self,
+        directory: str,
+        labels: Labels,
+        first_row: int,
+        numerical: np.ndarray[Any, Any],
+        categorical: np.ndarray[Any, Any],
+        model_fingerprint: str,
+    ) -> Optional["ClusterLayout"]:
+        """
+        Writes the ingested rows (from first_row on the dataset, on the clusters of labels) on
+        the free space of their clusters, of this layout that was opened from directory. The
+        workers that have it open keep their clusters, the ends are only renamed on the
+        metadata after writing the rows. model_fingerprint is the one after ingesting them.
+
+        Returns:
+            Optional[ClusterLayout]: The layout opened from directory, or None if a cluster
+                doesn't have room for its new rows (or they don't fit on the files), so it has
+                to be written again (see write).
+        """
+        sizes = np.bincount(labels, minlength=len(self.ends))
+        ends = self.ends + sizes
+        if (
+            np.any(ends > self.offsets[1:])
+            or not np.can_cast(categorical.dtype, self.categorical.dtype)
+            or not np.can_cast(numerical.dtype, self.numerical.dtype)
+        ):
+            return None
+        order = np.argsort(labels, kind="stable")
+        cluster_starts = np.zeros(len(sizes), dtype=np.intp)
+        np.cumsum(sizes[:-1], out=cluster_starts[1:])
+        positions = np.arange(len(order)) + np.repeat(self.ends - cluster_starts, sizes)
+        for file_name, values in (
+            (LAYOUT_ROWS_FILE, first_row + order),
+            (LAYOUT_NUMERICAL_FILE, numerical[order]),
+            (LAYOUT_CATEGORICAL_FILE, categorical[order]),
+        ):
+            output = np.load(os.path.join(directory, file_name), mmap_mode="r+")
+            output[positions] = values
+            output.flush()
+            del output
+        ClusterLayout._save_metadata(
+            directory,
+            ClusterLayout.layout_fingerprint(
+                model_fingerprint, self.categorical_digest
+            ),
+            self.categorical_digest,
+            ends,
+        )
+        return ClusterLayout.open(directory)
+
+    @staticmethod
+    def _temporary_directory(directory: str) -> str:
+        # Same as the dataset: write a temporary directory and rename it
+        temporary_directory = f"{directory.rstrip(os.sep)}.{os.getpid()}.tmp"
+        os.makedirs(temporary_directory, exist_ok=True)
+        return temporary_directory
+
+    @staticmethod
+    def _save_metadata(
+        directory: str,
+        fingerprint: str,
+        categorical_digest: str,
+        ends: np.ndarray[Any, np.dtype[np.intp]],
+    ) -> None:
+        # The metadata goes last, a layout without it can't be opened
+        temporary_path = os.path.join(
+            directory, f"{LAYOUT_METADATA_FILE}.{os.getpid()}.tmp"
+        )
+        with open(temporary_path, "w") as file:
+            json.dump(
+                {
+                    "fingerprint": fingerprint,
+                    "categorical_digest": categorical_digest,
+                    "ends": ends.tolist(),
+                },
+                file,
+            )
+        os.replace(temporary_path, os.path.join(directory, LAYOUT_METADATA_FILE))
+
+    @staticmethod
+    def _replace_directory(temporary_directory: str, directory: str) -> None:
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.replace(temporary_directory, directory)
+
+    def save(self, directory: str) -> None:
+        temporary_directory = ClusterLayout._temporary_directory(directory)
+        np.save(os.path.join(temporary_directory, LAYOUT_ROWS_FILE), self.rows)
+        np.save(os.path.join(temporary_directory, LAYOUT_OFFSETS_FILE), self.offsets)
+        np.save(
+            os.path.join(temporary_directory, LAYOUT_NUMERICAL_FILE), self.numerical
+        )
+        np.save(
+            os.path.join(temporary_directory, LAYOUT_CATEGORICAL_FILE), self.categorical
+        )
+        ClusterLayout._save_metadata(
+            temporary_directory, self.fingerprint, self.categorical_digest, self.ends
+        )
+        ClusterLayout._replace_directory(temporary_directory, directory)
+
+    @staticmethod
+    def open(directory: str) -> Optional["ClusterLayout"]:
+        try:
+            with open(os.path.join(directory, LAYOUT_METADATA_FILE)) as file:
+                metadata = json.load(file)
+            return ClusterLayout(
+                rows=np.load(os.path.join(directory, LAYOUT_ROWS_FILE), mmap_mode="r"),
+                offsets=np.load(os.path.join(directory, LAYOUT_OFFSETS_FILE)),
+                ends=np.array(metadata["ends"], dtype=np.intp),
+                numerical=np.load(
+                    os.path.join(directory, LAYOUT_NUMERICAL_FILE), mmap_mode="r"
+                ),
+                categorical=np.load(
+                    os.path.join(directory, LAYOUT_CATEGORICAL_FILE), mmap_mode="r"
+                ),
+                fingerprint=str(metadata["fingerprint"]),
+                categorical_digest=str(metadata["categorical_digest"]),
+            )
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def cluster(self, cluster: int) -> slice:
+        return slice(int(self.offsets[cluster]), int(self.ends[cluster]))
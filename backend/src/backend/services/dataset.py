@@ -0,0 +1,286 @@
+import argparse
+import io
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DATASET_VERSION = 2
+
+NUMERICAL_FEATURES = [
+    "popularity",
+    "longness",
+    "danceability",
+    "energy",
+    "loudness",
+    "speechiness",
+    "acousticness",
+    "instrumentalness",
+    "liveness",
+    "valence",
+    "tempo",
+]
+
+CATEGORICAL_FEATURES = ["time_signature", "mode", "explicit", "key", "track_genre"]
+
+TRACK_IDS_FILE = "track_ids.npy"
+NUMERICAL_FILE = "numerical.npy"
+CATEGORICAL_FILE = "categorical.npy"
+METADATA_FILE = "metadata.json"
+
+
+def append_rows(path: str, rows: int, new_rows: np.ndarray[Any, Any]) -> None:
+    """
+    Writes new_rows after the first `rows` rows of the .npy file on path (anything after them,
+    from an append that didn't finish, is overwritten), and updates its shape in place.
+    np.save leaves room in the header for the number of rows to grow, so nothing else moves
+    and the cost only depends on new_rows.
+    """
+    with open(path, "r+b") as file:
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+        header_length = file.tell()
+        if (
+            fortran_order
+            or dtype != new_rows.dtype
+            or tuple(shape[1:]) != new_rows.shape[1:]
+        ):
+            raise ValueError(
+                f"Can't append rows of {new_rows.dtype} {new_rows.shape[1:]} to {path}"
+            )
+        header = io.BytesIO()
+        header_fields = {
+            "descr": np.lib.format.dtype_to_descr(dtype),
+            "fortran_order": False,
+            "shape": (rows + len(new_rows), *shape[1:]),
+        }
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, header_fields)
+        else:
+            np.lib.format.write_array_header_2_0(header, header_fields)
+        if len(header.getvalue()) != header_length:
+            raise ValueError(f"The header of {path} can't grow to {rows} rows")
+        row_bytes = dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64))
+        file.seek(header_length + rows * row_bytes)
+        file.truncate()
+        file.write(np.ascontiguousarray(new_rows).tobytes())
+        file.seek(0)
+        file.write(header.getvalue())
+
+
+def categorical_codes_dtype(num_categories: int) -> np.dtype[np.signedinteger[Any]]:
+    """
+    Smallest integer type that can hold the codes of num_categories values
+    """
+    for dtype in (np.int8, np.int16):
+        if num_categories <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    return np.dtype(np.int32)
+
+
+@dataclass(frozen=True)
+class TracksDataset:
+    """
+    Columnar representation of the tracks dataset:
+        - track_ids: fixed width ascii track ids (one per row)
+        - numerical: float32 matrix with the NUMERICAL_FEATURES of every row
+        - categorical: matrix with the code of every CATEGORICAL_FEATURES value of every row,
+          with the smallest integer type that fits all the features (int8 for our dataset)
+        - categories: for every categorical feature, the values of its codes (sorted when
+          converted from the csv, the values of ingested tracks are appended at the end)
+
+    It's saved as a directory of .npy files, so we can open it with memory mapping: startup is
+    instant, and all the workers of a machine share the same pages via the OS page cache.
+    """
+
+    track_ids: np.ndarray[Any, np.dtype[np.bytes_]]
+    numerical: np.ndarray[Any, np.dtype[np.float32]]
+    categorical: np.ndarray[Any, np.dtype[np.signedinteger[Any]]]
+    categories: Dict[str, List[Any]]
+
+    def __len__(self) -> int:
+        return len(self.track_ids)
+
+    @property
+    def max_categories(self) -> int:
+        return max(len(values) for values in self.categories.values())
+
+    def track_id(self, position: int) -> str:
+        return bytes(self.track_ids[position]).decode()
+
+    def iter_track_ids(self) -> Iterator[str]:
+        return (bytes(track_id).decode() for track_id in self.track_ids)
+
+    @staticmethod
+    def from_dataframe(data: "pd.DataFrame") -> "TracksDataset":
+        categories: Dict[str, List[Any]] = {}
+        columns = []
+        for feature in CATEGORICAL_FEATURES:
+            values, codes = np.unique(data[feature].values, return_inverse=True)
+            categories[feature] = values.tolist()
+            columns.append(codes)
+        dtype = categorical_codes_dtype(
+            max(len(values) for values in categories.values())
+        )
+        return TracksDataset(
+            track_ids=data["track_id"].values.astype(np.bytes_),
+            numerical=data[NUMERICAL_FEATURES].values.astype(np.float32),
+            categorical=np.stack(columns, axis=1).astype(dtype),
+            categories=categories,
+        )
+
+    @staticmethod
+    def from_csv(path: str) -> "TracksDataset":
+        # pandas is slow to import, and the server only needs it to convert the csv
+        import pandas as pd
+
+        return TracksDataset.from_dataframe(pd.read_csv(path))
+
+    def save(self, directory: str) -> None:
+        # Write everything to a temporary directory and rename it, so a running server never
+        # opens a half written dataset
+        temporary_directory = f"{directory.rstrip(os.sep)}.{os.getpid()}.tmp"
+        os.makedirs(temporary_directory, exist_ok=True)
+        # By rows (C order), so new rows can be appended to the files (see append)
+        for file_name, columns in (
+            (TRACK_IDS_FILE, self.track_ids),
+            (NUMERICAL_FILE, self.numerical),
+            (CATEGORICAL_FILE, self.categorical),
+        ):
+            np.save(
+                os.path.join(temporary_directory, file_name),
+                np.ascontiguousarray(columns),
+            )
+        TracksDataset._save_metadata(temporary_directory, len(self), self.categories)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.replace(temporary_directory, directory)
+
+    @staticmethod
+    def _save_metadata(
+        directory: str, rows: int, categories: Dict[str, List[Any]]
+    ) -> None:
+        # Renamed over the old one, it's what makes the rows appended to the files visible
+        temporary_path = os.path.join(directory, f"{METADATA_FILE}.{os.getpid()}.tmp")
+        with open(temporary_path, "w") as file:
+            json.dump(
+                {
+                    "version": DATASET_VERSION,
+                    "numerical_features": NUMERICAL_FEATURES,
+                    "categorical_features": CATEGORICAL_FEATURES,
+                    "categories": categories,
+                    "rows": rows,
+                },
+                file,
+            )
+        os.replace(temporary_path, os.path.join(directory, METADATA_FILE))
+
+    def can_append(self, new_tracks: "TracksDataset") -> bool:
+        """
+        If new_tracks fit in the files of this dataset: they are saved by rows, and the ids and
+        categorical codes of new_tracks aren't wider
+        """
+        return (
+            self.numerical.flags.c_contiguous
+            and self.categorical.flags.c_contiguous
+            and new_tracks.track_ids.dtype.itemsize <= self.track_ids.dtype.itemsize
+            and new_tracks.categorical.dtype.itemsize <= self.categorical.dtype.itemsize
+        )
+
+    def append(self, directory: str, new_tracks: "TracksDataset") -> "TracksDataset":
+        """
+        Adds new_tracks at the end of this dataset, that was opened from directory. They have to
+        use the categories of this dataset (with the new values at the end), and fit in its files
+        (see can_append). The rows are appended to the files in place, and the metadata is
+        renamed last, so a server opening the dataset meanwhile gets the rows it had.
+
+        Returns:
+            TracksDataset: The dataset with new_tracks, opened from directory.
+        """
+        assert self.can_append(new_tracks), "They have to be written again, see save"
+        rows = len(self)
+        for file_name, columns, new_columns in (
+            (TRACK_IDS_FILE, self.track_ids, new_tracks.track_ids),
+            (NUMERICAL_FILE, self.numerical, new_tracks.numerical),
+            (CATEGORICAL_FILE, self.categorical, new_tracks.categorical),
+        ):
+            append_rows(
+                os.path.join(directory, file_name),
+                rows,
+                new_columns.astype(columns.dtype),
+            )
+        TracksDataset._save_metadata(
+            directory, rows + len(new_tracks), new_tracks.categories
+        )
+        return TracksDataset.open(directory)
+
+    @staticmethod
+    def open(directory: str) -> "TracksDataset":
+        with open(os.path.join(directory, METADATA_FILE)) as file:
+            metadata = json.load(file)
+        if (
+            metadata["version"] != DATASET_VERSION
+            or metadata["numerical_features"] != NUMERICAL_FEATURES
+            or metadata["categorical_features"] != CATEGORICAL_FEATURES
+        ):
+            raise ValueError(
+                f"The dataset on {directory} was built with another version or features. Convert it again"
+            )
+        # The files can have rows of an append that hasn't finished yet
+        rows = slice(metadata.get("rows"))
+        return TracksDataset(
+            track_ids=np.load(os.path.join(directory, TRACK_IDS_FILE), mmap_mode="r")[
+                rows
+            ],
+            numerical=np.load(os.path.join(directory, NUMERICAL_FILE), mmap_mode="r")[
+                rows
+            ],
+            categorical=np.load(
+                os.path.join(directory, CATEGORICAL_FILE), mmap_mode="r"
+            )[rows],
+            categories=metadata["categories"],
+        )
+
+    @staticmethod
+    def load(path: str, csv_path: Optional[str] = None) -> "TracksDataset":
+        """
+        Opens the converted dataset if path is a directory. If it isn't converted yet but we
+        have the csv_path, we convert the csv to path first (so the next workers can memory map
+        it). Otherwise, path is parsed as a csv.
+        """
+        if os.path.isdir(path):
+            return TracksDataset.open(path)
+        if csv_path is not None and os.path.isfile(csv_path):
+            dataset = TracksDataset.from_csv(csv_path)
+            try:
+                dataset.save(path)
+            except OSError:
+                # Read only disk, or another worker converted it at the same time
+                return dataset
+            return TracksDataset.open(path)
+        return TracksDataset.from_csv(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Convert the tracks csv to the binary format the server memory maps"
+    )
+    parser.add_argument("--csv", default="./data/spotify_tracks_dataset.csv")
+    parser.add_argument("--output", default="./data/spotify_tracks")
+    args = parser.parse_args()
+    dataset = TracksDataset.from_csv(args.csv)
+    dataset.save(args.output)
+    print(f"Saved {len(dataset)} tracks on {args.output}")
+
+
+if __name__ == "__main__":
+    main()
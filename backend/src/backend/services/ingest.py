@@ -0,0 +1,449 @@
+import argparse
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.backend.services.antirecommender import (
+    AntiRecommenderService,
+    DEFAULT_NUMBER_CLUSTERS,
+    DEFAULT_DATA_PATH,
+    DEFAULT_MODEL_PATH,
+)
+from src.backend.services.clustering import (
+    CLUSTERING_BACKENDS,
+    ClusteringModel,
+    ClusterLayout,
+    IngestedClusters,
+    clustering_backend,
+    dataset_fingerprint,
+    ingested_directory,
+    layout_directory,
+)
+from src.backend.services.dataset import (
+    TracksDataset,
+    CATEGORICAL_FEATURES,
+    categorical_codes_dtype,
+)
+
+# If the new tracks are this many times further from their centers than the tracks of the
+# last fit were, the clusters don't describe the catalog anymore and we should refit them
+DEFAULT_REFIT_THRESHOLD = 1.25
+# Rows whose distance to their center we compute at once
+DISTANCES_CHUNK_ROWS = 65_536
+
+
+def drift_path(model_path: str) -> str:
+    """
+    Where we save the DriftStats of the clustering saved on model_path
+    """
+    return f"{os.path.splitext(model_path)[0]}_drift.json"
+
+
+def _distances_to_centers(
+    numerical: np.ndarray[Any, Any],
+    labels: np.ndarray[Any, np.dtype[np.int32]],
+    centers: np.ndarray[Any, np.dtype[np.float64]],
+) -> np.ndarray[Any, np.dtype[np.float64]]:
+    distances = np.empty(len(numerical), dtype=np.float64)
+    for start in range(0, len(numerical), DISTANCES_CHUNK_ROWS):
+        end = start + DISTANCES_CHUNK_ROWS
+        distances[start:end] = np.linalg.norm(
+            numerical[start:end].astype(np.float64) - centers[labels[start:end]],
+            axis=1,
+        )
+    return distances
+
+
+@dataclass(frozen=True)
+class DriftStats:
+    """
+    How well the clusters describe the tracks ingested since the last fit:
+        - fitted_rows, fitted_mean_distance: tracks of the last fit, and their mean distance to
+          their center
+        - ingested_rows, ingested_mean_distance: the same, for the tracks ingested since then
+        - max_center_shift: how far the centers moved since the fit (only if we nudge them)
+    """
+
+    fitted_rows: int
+    fitted_mean_distance: float
+    ingested_rows: int = 0
+    ingested_mean_distance: float = 0.0
+    max_center_shift: float = 0.0
+
+    @property
+    def drift(self) -> float:
+        """
+        How many times further the ingested tracks are from their centers than the fitted ones
+        """
+        if self.ingested_rows == 0 or self.fitted_mean_distance == 0:
+            return 1.0
+        return self.ingested_mean_distance / self.fitted_mean_distance
+
+    def needs_refit(self, threshold: float = DEFAULT_REFIT_THRESHOLD) -> bool:
+        return self.drift > threshold
+
+    @staticmethod
+    def after_fit(
+        numerical: np.ndarray[Any, Any], model: ClusteringModel
+    ) -> "DriftStats":
+        distances = _distances_to_centers(numerical, model.labels, model.centers)
+        return DriftStats(
+            fitted_rows=len(numerical),
+            fitted_mean_distance=float(distances.mean()) if len(distances) else 0.0,
+        )
+
+    def save(self, path: str) -> None:
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(asdict(self), file)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load(path: str) -> Optional["DriftStats"]:
+        try:
+            with open(path) as file:
+                return DriftStats(**json.load(file))
+        except (OSError, ValueError, TypeError):
+            return None
+
+
+@dataclass(frozen=True)
+class IngestResult:
+    added: int
+    duplicated: int
+    drift: DriftStats
+    needs_refit: bool
+
+
+def _merge_categories(
+    dataset: TracksDataset, new_tracks: TracksDataset
+) -> tuple[Dict[str, List[Any]], np.ndarray[Any, np.dtype[np.signedinteger[Any]]]]:
+    """
+    Categories of the dataset with the new values of new_tracks at the end (the codes we
+    already have don't change), and the codes of new_tracks with those categories.
+    """
+    categories: Dict[str, List[Any]] = {}
+    columns = []
+    for column, feature in enumerate(CATEGORICAL_FEATURES):
+        values = list(dataset.categories[feature])
+        codes = {value: code for code, value in enumerate(values)}
+        for value in new_tracks.categories[feature]:
+            if value not in codes:
+                codes[value] = len(values)
+                values.append(value)
+        categories[feature] = values
+        new_codes = np.array(
+            [codes[value] for value in new_tracks.categories[feature]], dtype=np.int64
+        )
+        columns.append(new_codes[new_tracks.categorical[:, column]])
+    dtype = categorical_codes_dtype(max(len(values) for values in categories.values()))
+    return categories, np.stack(columns, axis=1).astype(dtype)
+
+
+def _append(
+    service: AntiRecommenderService,
+    dataset: TracksDataset,
+    model: ClusteringModel,
+    new_tracks: TracksDataset,
+    new_labels: np.ndarray[Any, np.dtype[np.int32]],
+    centers: np.ndarray[Any, np.dtype[np.float64]],
+) -> None:
+    assert service.model_path is not None, "ingest_tracks checks it"
+    layout = service.build_layout(model)
+    appended = dataset.append(service.data_path, new_tracks)
+    new_rows = slice(len(dataset), None)
+    # Hashed as they were saved, like the server does when it loads them
+    new_track_ids = appended.track_ids[new_rows]
+    new_numerical = appended.numerical[new_rows]
+    new_categorical = appended.categorical[new_rows]
+    directory = ingested_directory(service.model_path)
+    if model.ingested_rows == 0:
+        ingested = IngestedClusters.start(
+            directory,
+            model,
+            new_labels,
+            centers,
+            new_track_ids,
+            new_numerical,
+            new_categorical,
+        )
+    else:
+        previous = IngestedClusters.open(directory)
+        assert previous is not None, "build_model just read them"
+        ingested = previous.append(
+            directory,
+            new_labels,
+            centers,
+            new_track_ids,
+            new_numerical,
+            new_categorical,
+        )
+    layout_path = layout_directory(service.model_path)
+    if (
+        layout.append(
+            layout_path,
+            new_labels,
+            len(dataset),
+            new_numerical,
+            new_categorical,
+            ingested.fingerprint,
+        )
+        is None
+    ):
+        # A cluster ran out of free space
+        ClusterLayout.write(
+            ClusteringModel(
+                labels=np.concatenate([model.labels, new_labels]),
+                centers=centers,
+                fingerprint=ingested.fingerprint,
+                ingested_rows=model.ingested_rows + len(new_labels),
+            ),
+            service.num_clusters,
+            appended.numerical,
+            appended.categorical,
+            layout_path,
+        )
+
+
+def _rewrite(
+    service: AntiRecommenderService,
+    dataset: TracksDataset,
+    model: ClusteringModel,
+    new_tracks: TracksDataset,
+    new_labels: np.ndarray[Any, np.dtype[np.int32]],
+    centers: np.ndarray[Any, np.dtype[np.float64]],
+) -> None:
+    """
+    Saves everything again, for new tracks that don't fit on the dataset files. Wider track ids
+    change the fingerprint of the fitted rows too, so the fitted clustering is saved with it.
+    """
+    assert service.model_path is not None, "ingest_tracks checks it"
+    appended = TracksDataset(
+        track_ids=np.concatenate([dataset.track_ids, new_tracks.track_ids]),
+        numerical=np.concatenate([dataset.numerical, new_tracks.numerical]),
+        categorical=np.concatenate(
+            [
+                dataset.categorical.astype(new_tracks.categorical.dtype),
+                new_tracks.categorical,
+            ]
+        ),
+        categories=new_tracks.categories,
+    )
+    appended.save(service.data_path)
+    appended = TracksDataset.open(service.data_path)
+    fitted = ClusteringModel.load(service.model_path)
+    assert fitted is not None, "The service just loaded it or fitted it"
+    fitted_rows = slice(model.fitted_rows)
+    fitted = ClusteringModel(
+        labels=fitted.labels,
+        centers=fitted.centers,
+        fingerprint=dataset_fingerprint(
+            track_ids=appended.track_ids[fitted_rows],
+            numerical_data=appended.numerical[fitted_rows],
+            numerical_features=service.numerical_features,
+            num_clusters=service.num_clusters,
+            backend=service.clustering_backend,
+        ),
+    )
+    fitted.save(service.model_path)
+    ingested_rows = slice(model.fitted_rows, None)
+    ingested = IngestedClusters.start(
+        ingested_directory(service.model_path),
+        fitted,
+        np.concatenate([model.labels[ingested_rows], new_labels]),
+        centers,
+        appended.track_ids[ingested_rows],
+        appended.numerical[ingested_rows],
+        appended.categorical[ingested_rows],
+    )
+    ClusterLayout.write(
+        ClusteringModel(
+            labels=np.concatenate([fitted.labels, ingested.labels]),
+            centers=centers,
+            fingerprint=ingested.fingerprint,
+            ingested_rows=ingested.rows,
+        ),
+        service.num_clusters,
+        appended.numerical,
+        appended.categorical,
+        layout_directory(service.model_path),
+    )
+
+
+def ingest_tracks(
+    service: AntiRecommenderService,
+    new_tracks: TracksDataset,
+    nudge_centers: bool = False,
+    refit_threshold: float = DEFAULT_REFIT_THRESHOLD,
+) -> IngestResult:
+    """
+    Appends new_tracks (the ones that aren't on the catalog yet) to the dataset of service,
+    and assigns each one to the cluster of its nearest center, without refitting the clusters.
+    They are appended to the dataset files, their clusters to the IngestedClusters of the
+    clustering and their features to the free space of the layout, so only the new tracks are
+    written (unless their ids or codes don't fit on the dataset files, or their clusters on
+    the layout). The servers load them on their next start (service keeps the dataset it had
+    loaded).
+
+    Args:
+        service (AntiRecommenderService): Its dataset has to be converted, and it needs a model_path.
+        new_tracks (TracksDataset): Tracks to add.
+        nudge_centers (bool): Move every center to the mean of its tracks, the new ones included
+            (the tracks we already had keep their cluster).
+        refit_threshold (float): Drift (see DriftStats) from which we should refit the clusters.
+
+    Returns:
+        IngestResult: How many tracks we added, and the drift since the last fit.
+    """
+    if service.model_path is None or not os.path.isdir(service.data_path):
+        raise ValueError(
+            "Ingesting needs a converted dataset and a model path, see build_model"
+        )
+    dataset = service.data
+    model = service.build_model()
+    stats = DriftStats.load(drift_path(service.model_path))
+    if (
+        stats is None
+        or service.model_fitted
+        or stats.fitted_rows + stats.ingested_rows != len(dataset)
+    ):
+        # The clusters were fitted after the last ingest (or there wasn't any)
+        stats = DriftStats.after_fit(dataset.numerical, model)
+
+    new_ids = [bytes(track_id).decode() for track_id in new_tracks.track_ids]
+    existing = set(service.filter_existing_tracks(new_ids))
+    first_seen = {track_id: row for row, track_id in reversed(list(enumerate(new_ids)))}
+    rows = np.array(
+        sorted(row for track_id, row in first_seen.items() if track_id not in existing),
+        dtype=np.intp,
+    )
+    new_tracks = TracksDataset(
+        track_ids=new_tracks.track_ids[rows],
+        numerical=new_tracks.numerical[rows],
+        categorical=new_tracks.categorical[rows],
+        categories=new_tracks.categories,
+    )
+    if len(rows) == 0:
+        return IngestResult(
+            added=0,
+            duplicated=len(new_ids),
+            drift=stats,
+            needs_refit=stats.needs_refit(refit_threshold),
+        )
+
+    # scipy is slow to import, and only the ingest needs it here
+    from scipy.spatial.distance import cdist
+
+    new_numerical = new_tracks.numerical.astype(np.float64)
+    new_labels = cdist(new_numerical, model.centers).argmin(axis=1).astype(np.int32)
+    centers = model.centers
+    if nudge_centers:
+        # The online kmeans update: every center moves to the mean of all its tracks
+        sizes = np.bincount(model.labels, minlength=len(centers)).astype(np.float64)
+        new_sizes = np.bincount(new_labels, minlength=len(centers)).astype(np.float64)
+        new_sums = np.zeros_like(centers)
+        np.add.at(new_sums, new_labels, new_numerical)
+        totals = np.maximum(sizes + new_sizes, 1)
+        centers = (centers * sizes[:, None] + new_sums) / totals[:, None]
+    new_distances = _distances_to_centers(new_numerical, new_labels, centers)
+    ingested_rows = stats.ingested_rows + len(rows)
+    stats = DriftStats(
+        fitted_rows=stats.fitted_rows,
+        fitted_mean_distance=stats.fitted_mean_distance,
+        ingested_rows=ingested_rows,
+        ingested_mean_distance=(
+            stats.ingested_mean_distance * stats.ingested_rows
+            + float(new_distances.sum())
+        )
+        / ingested_rows,
+        max_center_shift=max(
+            stats.max_center_shift,
+            float(np.linalg.norm(centers - model.centers, axis=1).max()),
+        ),
+    )
+
+    categories, new_categorical = _merge_categories(dataset, new_tracks)
+    new_tracks = TracksDataset(
+        track_ids=new_tracks.track_ids,
+        numerical=new_tracks.numerical,
+        categorical=new_categorical,
+        categories=categories,
+    )
+    if dataset.can_append(new_tracks):
+        _append(service, dataset, model, new_tracks, new_labels, centers)
+    else:
+        _rewrite(service, dataset, model, new_tracks, new_labels, centers)
+    stats.save(drift_path(service.model_path))
+    return IngestResult(
+        added=len(rows),
+        duplicated=len(new_ids) - len(rows),
+        drift=stats,
+        needs_refit=stats.needs_refit(refit_threshold),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Add tracks to the dataset, assigning them to the clusters we already have"
+    )
+    parser.add_argument("--csv", required=True, help="The new tracks")
+    parser.add_argument("--data", default=DEFAULT_DATA_PATH)
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--clusters", type=int, default=DEFAULT_NUMBER_CLUSTERS)
+    parser.add_argument(
+        "--backend", choices=list(CLUSTERING_BACKENDS), default="kmeans"
+    )
+    parser.add_argument(
+        "--nudge-centers",
+        action="store_true",
+        help="Move the centers to the mean of their tracks, the new ones included",
+    )
+    parser.add_argument(
+        "--refit-threshold", type=float, default=DEFAULT_REFIT_THRESHOLD
+    )
+    parser.add_argument(
+        "--refit",
+        action="store_true",
+        help="Refit the clusters if the drift passes the threshold",
+    )
+    args = parser.parse_args()
+
+    def service() -> AntiRecommenderService:
+        AntiRecommenderService.reset()
+        return AntiRecommenderService(
+            data_path=args.data,
+            num_clusters=args.clusters,
+            model_path=args.model,
+            clustering_backend=clustering_backend(args.backend),
+        )
+
+    result = ingest_tracks(
+        service(),
+        TracksDataset.from_csv(args.csv),
+        nudge_centers=args.nudge_centers,
+        refit_threshold=args.refit_threshold,
+    )
+    print(
+        json.dumps(
+            {
+                **asdict(result),
+                "drift": {**asdict(result.drift), "drift": result.drift.drift},
+            }
+        )
+    )
+    if result.needs_refit and args.refit:
+        os.remove(args.model)
+        refitted = service()
+        model = refitted.build_model()
+        refitted.build_layout(model)
+        DriftStats.after_fit(refitted.data.numerical, model).save(
+            drift_path(args.model)
+        )
+        print(f"Clusters refitted and saved on {args.model}")
+
+
+if __name__ == "__main__":
+    main()
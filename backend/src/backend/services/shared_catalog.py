@@ -0,0 +1,148 @@
+import json
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from src.backend.services.clustering import ClusteringModel, ClusterLayout
+from src.backend.services.dataset import TracksDataset
+
+# Name of the shared catalog that the workers attach to (if any), see src.backend.serve
+SHARED_CATALOG_ENV = "SHARED_CATALOG"
+# The segment starts with the length of the metadata (json), then the metadata and the arrays
+_HEADER_BYTES = 8
+_ALIGNMENT = 64
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+@dataclass(frozen=True)
+class SharedCatalog:
+    """
+    The dataset, the clustering and its layout on a single shared memory segment, so the
+    workers of a machine load (and fit) them once: a parent process publishes them, and every
+    worker attaches to the segment by name. Its arrays are read only views of the segment,
+    attaching doesn't copy anything.
+
+    Keep it alive while the arrays are used: they point to its memory.
+    """
+
+    dataset: TracksDataset
+    model: ClusteringModel
+    layout: ClusterLayout
+    segment: SharedMemory
+
+    @staticmethod
+    def _arrays(
+        dataset: TracksDataset, model: ClusteringModel, layout: ClusterLayout
+    ) -> Dict[str, np.ndarray[Any, Any]]:
+        return {
+            "track_ids": dataset.track_ids,
+            "numerical": dataset.numerical,
+            "categorical": dataset.categorical,
+            "labels": model.labels,
+            "centers": model.centers,
+            "layout_rows": layout.rows,
+            "layout_offsets": layout.offsets,
+            "layout_ends": layout.ends,
+            "layout_numerical": layout.numerical,
+            "layout_categorical": layout.categorical,
+        }
+
+    @staticmethod
+    def publish(
+        name: str,
+        dataset: TracksDataset,
+        model: ClusteringModel,
+        layout: ClusterLayout,
+    ) -> "SharedCatalog":
+        """
+        Copies everything to a new segment called name. Who publishes it has to unlink it.
+        """
+        arrays = SharedCatalog._arrays(dataset, model, layout)
+        # Offsets of the arrays from the start of the data, which goes after the metadata
+        shapes: Dict[str, Tuple[int, str, Tuple[int, ...]]] = {}
+        size = 0
+        for array_name, array in arrays.items():
+            shapes[array_name] = (size, array.dtype.str, array.shape)
+            size = _aligned(size + array.nbytes)
+        metadata = json.dumps(
+            {
+                "arrays": shapes,
+                "categories": dataset.categories,
+                "model_fingerprint": model.fingerprint,
+                "model_ingested_rows": model.ingested_rows,
+                "layout_fingerprint": layout.fingerprint,
+                "layout_categorical_digest": layout.categorical_digest,
+            }
+        ).encode()
+        start = _aligned(_HEADER_BYTES + len(metadata))
+
+        segment = SharedMemory(name=name, create=True, size=start + size)
+        buffer = segment.buf
+        assert buffer is not None, "We just created the segment"
+        buffer[:_HEADER_BYTES] = len(metadata).to_bytes(_HEADER_BYTES, "little")
+        buffer[_HEADER_BYTES : _HEADER_BYTES + len(metadata)] = metadata
+        for array_name, array in arrays.items():
+            offset, dtype, shape = shapes[array_name]
+            np.ndarray(shape, dtype=dtype, buffer=buffer, offset=start + offset)[
+                ...
+            ] = array
+        return SharedCatalog._from_segment(segment)
+
+    @staticmethod
+    def attach(name: str) -> "SharedCatalog":
+        # Not tracked: only the process that published it unlinks it
+        return SharedCatalog._from_segment(SharedMemory(name=name, track=False))
+
+    @staticmethod
+    def _from_segment(segment: SharedMemory) -> "SharedCatalog":
+        buffer = segment.buf
+        assert buffer is not None, f"The segment {segment.name} is closed"
+        length = int.from_bytes(buffer[:_HEADER_BYTES], "little")
+        metadata = json.loads(bytes(buffer[_HEADER_BYTES : _HEADER_BYTES + length]))
+        start = _aligned(_HEADER_BYTES + length)
+        arrays: Dict[str, np.ndarray[Any, Any]] = {}
+        for array_name, (offset, dtype, shape) in metadata["arrays"].items():
+            array: np.ndarray[Any, Any] = np.ndarray(
+                tuple(shape), dtype=dtype, buffer=buffer, offset=start + offset
+            )
+            array.flags.writeable = False
+            arrays[array_name] = array
+        return SharedCatalog(
+            dataset=TracksDataset(
+                track_ids=arrays["track_ids"],
+                numerical=arrays["numerical"],
+                categorical=arrays["categorical"],
+                categories=metadata["categories"],
+            ),
+            model=ClusteringModel(
+                labels=arrays["labels"],
+                centers=arrays["centers"],
+                fingerprint=metadata["model_fingerprint"],
+                ingested_rows=metadata["model_ingested_rows"],
+            ),
+            layout=ClusterLayout(
+                rows=arrays["layout_rows"],
+                offsets=arrays["layout_offsets"],
+                ends=arrays["layout_ends"],
+                numerical=arrays["layout_numerical"],
+                categorical=arrays["layout_categorical"],
+                fingerprint=metadata["layout_fingerprint"],
+                categorical_digest=metadata["layout_categorical_digest"],
+            ),
+            segment=segment,
+        )
+
+    @property
+    def name(self) -> str:
+        return self.segment.name
+
+    def unlink(self) -> None:
+        """
+        Removes the segment: the processes attached to it keep it until they exit
+        """
+        self.segment.unlink()
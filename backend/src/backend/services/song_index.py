@@ -0,0 +1,312 @@
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from typing import Any, Callable, List, Literal, Mapping, Optional
+
+import numpy as np
+
+from src.backend.services.clustering import ClusterLayout
+
+# exact or approximate, without it we score every song of the cluster
+SONG_INDEX_ENV = "SONG_INDEX"
+SONG_INDEX_CANDIDATES_ENV = "SONG_INDEX_CANDIDATES"
+DEFAULT_CANDIDATES = 64
+# Songs of every leaf of the index (at most)
+DEFAULT_LEAF_SIZE = 128
+# The numerical distances of the tree and the scores aren't computed the same way, so we
+# widen the radius a bit to never miss a song because of rounding
+_RADIUS_SLACK = 1e-9
+
+SONG_INDEX_POSITIONS_FILE = "positions.npy"
+SONG_INDEX_LEAF_OFFSETS_FILE = "leaf_offsets.npy"
+SONG_INDEX_CLUSTER_LEAVES_FILE = "cluster_leaves.npy"
+SONG_INDEX_LOWER_FILE = "lower.npy"
+SONG_INDEX_UPPER_FILE = "upper.npy"
+SONG_INDEX_METADATA_FILE = "metadata.json"
+
+SongIndexMode = Literal["exact", "approximate"]
+Scores = Callable[
+    [np.ndarray[Any, np.dtype[np.intp]]], np.ndarray[Any, np.dtype[np.float64]]
+]
+Positions = np.ndarray[Any, np.dtype[np.intp]]
+
+
+def song_index_directory(model_path: str) -> str:
+    """
+    Where we save the SongIndex of the layout of the clustering saved on model_path
+    """
+    return f"{os.path.splitext(model_path)[0]}_song_index"
+
+
+@dataclass(frozen=True)
+class SongIndexConfig:
+    """
+    mode:
+        - exact: the recommendations are the same as scoring every song of the cluster
+        - approximate: we only score the candidates nearest songs (by the numerical features),
+          so a song with a closer categorical profile but further numerically can be missed
+    candidates: songs we get from the tree before scoring them (at least k)
+    """
+
+    mode: SongIndexMode = "exact"
+    candidates: int = DEFAULT_CANDIDATES
+
+    @staticmethod
+    def from_env(
+        environment: Mapping[str, str] = os.environ,
+    ) -> Optional["SongIndexConfig"]:
+        mode = environment.get(SONG_INDEX_ENV, "").lower()
+        if not mode:
+            return None
+        if mode not in ("exact", "approximate"):
+            raise ValueError(
+                f"Unknown {SONG_INDEX_ENV} {mode}, use exact or approximate"
+            )
+        return SongIndexConfig(
+            mode="exact" if mode == "exact" else "approximate",
+            candidates=int(
+                environment.get(SONG_INDEX_CANDIDATES_ENV, DEFAULT_CANDIDATES)
+            ),
+        )
+
+
+@dataclass(frozen=True)
+class SongIndex:
+    """
+    A KD-tree over the numerical features of every cluster of the layout, to find the songs of
+    a cluster that can be the most similar to a profile without scoring all of them.
+
+    The score of a song is alpha * numerical distance + (1 - alpha) * categorical distance,
+    and the categorical distance is between 0 and 1. So, once we know the k-th best score s of
+    the nearest songs, only the songs with a numerical distance up to s / alpha can beat it:
+    the exact mode scores those, the approximate mode only the nearest ones.
+
+    Only the leaves of the tree are kept, as arrays: the songs of leaf l are the positions of
+    the layout positions[leaf_offsets[l]:leaf_offsets[l + 1]], between the corners lower[l] and
+    upper[l], and the leaves of cluster c go from cluster_leaves[c] to cluster_leaves[c + 1].
+    Like the layout, it's saved next to the clustering and opened with memory mapping, and the
+    distances are computed from the features of the layout, so the workers of a machine don't
+    have their own copy of anything.
+    """
+
+    layout: ClusterLayout
+    config: SongIndexConfig
+    positions: Positions
+    leaf_offsets: Positions
+    cluster_leaves: Positions
+    lower: np.ndarray[Any, np.dtype[np.float64]]
+    upper: np.ndarray[Any, np.dtype[np.float64]]
+
+    @staticmethod
+    def _leaves(layout: ClusterLayout, cluster: int, leaf_size: int) -> List[Positions]:
+        # Every node splits its songs in halves, by the median of its widest feature
+        cluster_songs = layout.cluster(cluster)
+        pending = [np.arange(cluster_songs.start, cluster_songs.stop)]
+        leaves = []
+        while pending:
+            positions = pending.pop()
+            if len(positions) <= leaf_size:
+                if len(positions):
+                    leaves.append(positions)
+                continue
+            points = layout.numerical[positions]
+            feature = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+            half = len(positions) // 2
+            order = np.argpartition(points[:, feature], half)
+            pending.append(positions[order[half:]])
+            pending.append(positions[order[:half]])
+        return leaves
+
+    @staticmethod
+    def build(
+        layout: ClusterLayout,
+        config: SongIndexConfig,
+        leaf_size: int = DEFAULT_LEAF_SIZE,
+    ) -> "SongIndex":
+        """
+        The index in memory, see write to save it
+        """
+        leaves: List[Positions] = []
+        cluster_leaves = [0]
+        for cluster in range(len(layout.offsets) - 1):
+            leaves.extend(SongIndex._leaves(layout, cluster, leaf_size))
+            cluster_leaves.append(len(leaves))
+        features = layout.numerical.shape[1]
+        bounds = [layout.numerical[leaf] for leaf in leaves]
+        leaf_offsets = np.zeros(len(leaves) + 1, dtype=np.intp)
+        np.cumsum([len(leaf) for leaf in leaves], out=leaf_offsets[1:])
+        return SongIndex(
+            layout=layout,
+            config=config,
+            positions=(
+                np.concatenate(leaves) if leaves else np.empty(0, dtype=np.intp)
+            ),
+            leaf_offsets=leaf_offsets,
+            cluster_leaves=np.array(cluster_leaves, dtype=np.intp),
+            lower=np.array(
+                [points.min(axis=0) for points in bounds], dtype=np.float64
+            ).reshape(len(leaves), features),
+            upper=np.array(
+                [points.max(axis=0) for points in bounds], dtype=np.float64
+            ).reshape(len(leaves), features),
+        )
+
+    @staticmethod
+    def write(
+        layout: ClusterLayout,
+        config: SongIndexConfig,
+        directory: str,
+        leaf_size: int = DEFAULT_LEAF_SIZE,
+    ) -> "SongIndex":
+        """
+        Same as build(...), but saved on directory and returned opened from it
+        """
+        song_index = SongIndex.build(layout, config, leaf_size)
+        # Same as the layout: write a temporary directory and rename it
+        temporary_directory = f"{directory.rstrip(os.sep)}.{os.getpid()}.tmp"
+        os.makedirs(temporary_directory, exist_ok=True)
+        for file_name, array in (
+            (SONG_INDEX_POSITIONS_FILE, song_index.positions),
+            (SONG_INDEX_LEAF_OFFSETS_FILE, song_index.leaf_offsets),
+            (SONG_INDEX_CLUSTER_LEAVES_FILE, song_index.cluster_leaves),
+            (SONG_INDEX_LOWER_FILE, song_index.lower),
+            (SONG_INDEX_UPPER_FILE, song_index.upper),
+        ):
+            np.save(os.path.join(temporary_directory, file_name), array)
+        # The metadata goes last, an index without it can't be opened
+        with open(
+            os.path.join(temporary_directory, SONG_INDEX_METADATA_FILE), "w"
+        ) as file:
+            json.dump({"layout_fingerprint": layout.fingerprint}, file)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.replace(temporary_directory, directory)
+        opened = SongIndex.open(directory, layout, config)
+        assert opened is not None, f"We just saved the song index on {directory}"
+        return opened
+
+    @staticmethod
+    def open(
+        directory: str, layout: ClusterLayout, config: SongIndexConfig
+    ) -> Optional["SongIndex"]:
+        """
+        The index saved on directory, None if it wasn't built from this layout
+        """
+        try:
+            with open(os.path.join(directory, SONG_INDEX_METADATA_FILE)) as file:
+                if json.load(file)["layout_fingerprint"] != layout.fingerprint:
+                    return None
+            arrays = {
+                file_name: np.load(os.path.join(directory, file_name), mmap_mode="r")
+                for file_name in (
+                    SONG_INDEX_POSITIONS_FILE,
+                    SONG_INDEX_LEAF_OFFSETS_FILE,
+                    SONG_INDEX_CLUSTER_LEAVES_FILE,
+                    SONG_INDEX_LOWER_FILE,
+                    SONG_INDEX_UPPER_FILE,
+                )
+            }
+        except (OSError, KeyError, ValueError):
+            return None
+        return SongIndex(
+            layout=layout,
+            config=config,
+            positions=arrays[SONG_INDEX_POSITIONS_FILE],
+            leaf_offsets=arrays[SONG_INDEX_LEAF_OFFSETS_FILE],
+            cluster_leaves=arrays[SONG_INDEX_CLUSTER_LEAVES_FILE],
+            lower=arrays[SONG_INDEX_LOWER_FILE],
+            upper=arrays[SONG_INDEX_UPPER_FILE],
+        )
+
+    def _distances(
+        self, positions: Positions, numerical_profile: np.ndarray[Any, Any]
+    ) -> np.ndarray[Any, np.dtype[np.float64]]:
+        distances: np.ndarray[Any, np.dtype[np.float64]] = np.linalg.norm(
+            self.layout.numerical[positions] - numerical_profile, axis=1
+        )
+        return distances
+
+    def _leaf_distances(
+        self, cluster: int, numerical_profile: np.ndarray[Any, Any]
+    ) -> np.ndarray[Any, np.dtype[np.float64]]:
+        # The closest that a song of every leaf of the cluster can be to the profile
+        leaves = slice(
+            int(self.cluster_leaves[cluster]), int(self.cluster_leaves[cluster + 1])
+        )
+        gaps = np.maximum(self.lower[leaves] - numerical_profile, 0) + np.maximum(
+            numerical_profile - self.upper[leaves], 0
+        )
+        distances: np.ndarray[Any, np.dtype[np.float64]] = np.linalg.norm(gaps, axis=1)
+        return distances
+
+    def _leaf(self, cluster: int, leaf: int) -> Positions:
+        leaf = int(self.cluster_leaves[cluster]) + leaf
+        return self.positions[self.leaf_offsets[leaf] : self.leaf_offsets[leaf + 1]]
+
+    def _nearest(
+        self, cluster: int, numerical_profile: np.ndarray[Any, Any], count: int
+    ) -> Positions:
+        # The leaves by how close they can be, until the next one can't have a closer song
+        leaf_distances = self._leaf_distances(cluster, numerical_profile)
+        nearest = np.empty(0, dtype=np.intp)
+        distances = np.empty(0, dtype=np.float64)
+        for leaf in np.argsort(leaf_distances):
+            if len(nearest) == count and leaf_distances[leaf] > distances.max():
+                break
+            positions = self._leaf(cluster, int(leaf))
+            nearest = np.concatenate([nearest, positions])
+            distances = np.concatenate(
+                [distances, self._distances(positions, numerical_profile)]
+            )
+            if len(nearest) > count:
+                kept = np.argpartition(distances, count - 1)[:count]
+                nearest, distances = nearest[kept], distances[kept]
+        return nearest
+
+    def _within(
+        self, cluster: int, numerical_profile: np.ndarray[Any, Any], radius: float
+    ) -> Positions:
+        leaf_distances = self._leaf_distances(cluster, numerical_profile)
+        positions = np.concatenate(
+            [
+                self._leaf(cluster, int(leaf))
+                for leaf in np.flatnonzero(leaf_distances <= radius)
+            ]
+            or [np.empty(0, dtype=np.intp)]
+        )
+        within: Positions = positions[
+            self._distances(positions, numerical_profile) <= radius
+        ]
+        return within
+
+    def candidates(
+        self,
+        cluster: int,
+        numerical_profile: np.ndarray[Any, np.dtype[np.float64]],
+        alpha: float,
+        k: int,
+        scores: Scores,
+    ) -> Positions:
+        """
+        Positions of the layout (sorted) that we have to score to get the k best songs of the
+        cluster. scores gives the scores of some positions of the layout.
+        """
+        cluster_songs = self.layout.cluster(cluster)
+        songs = cluster_songs.stop - cluster_songs.start
+        if songs == 0:
+            return np.empty(0, dtype=np.intp)
+        nearest_count = min(songs, max(k, self.config.candidates))
+        nearest = np.sort(self._nearest(cluster, numerical_profile, nearest_count))
+        if self.config.mode == "approximate" or nearest_count == songs:
+            return nearest
+        if alpha <= 0:
+            # Only the categorical features matter, so the tree doesn't help
+            return np.arange(cluster_songs.start, cluster_songs.stop)
+        kth_score = np.partition(scores(nearest), k - 1)[k - 1]
+        radius = kth_score / alpha
+        return np.sort(
+            self._within(
+                cluster, numerical_profile, radius * (1 + _RADIUS_SLACK) + _RADIUS_SLACK
+            )
+        )
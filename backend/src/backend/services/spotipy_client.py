@@ -8,12 +8,31 @@ from src.backend.schemas.recommend import Song
 from src.backend.schemas.spotify import RecentlyPlayed
 
 from src.backend.schemas.spotify import Track
+from src.backend.spotify.infra.http import get_http_pool
+
+
+class _SharedSessionSpotify(Spotify):  # type: ignore[misc]
+    """
+    spotipy closes its requests session when the client is garbage collected,
+    but ours is the session shared by the whole backend.
+    """
+
+    def __del__(self) -> None:
+        pass
 
 
 class SpotifyClient:
     def __init__(self, access_token: str):
+        http = get_http_pool()
         try:
-            self.sp = Spotify(auth=access_token)
+            self.sp = _SharedSessionSpotify(
+                auth=access_token,
+                requests_session=http.session,
+                requests_timeout=(
+                    http.config.connect_timeout,
+                    http.config.read_timeout,
+                ),
+            )
         except SpotifyException as e:
             raise HTTPException(
                 status_code=400,
@@ -0,0 +1,75 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Literal
+
+from pydantic import BaseModel
+from starlette.requests import Request
+
+from src.backend.services.antirecommender import AntiRecommenderService
+
+# Tracks of the fake user that we recommend to while warming up
+WARM_UP_TRACKS = 20
+
+
+class WarmUpState(BaseModel):
+    """
+    status: warming_up (loading the dataset and the clusters), ready or failed
+    durations: seconds of every step of the warm up (load_dataset, load_model, ...)
+    model_fitted: if we had to fit the clusters (instead of loading the saved ones)
+    """
+
+    status: Literal["warming_up", "ready", "failed"] = "warming_up"
+    started_at: float | None = None
+    ready_at: float | None = None
+    durations: Dict[str, float] = {}
+    model_fitted: bool | None = None
+    error: str | None = None
+
+
+@dataclass
+class WarmUp:
+    """
+    Loads the antirecommender in the background when the server starts, and recommends some
+    songs with it, so the first requests don't pay for the lazy loading (reading the dataset,
+    fitting the clusters, importing scipy, faulting in the memory mapped pages...).
+    The server is only ready when it's done.
+    """
+
+    anti_recommender: AntiRecommenderService
+    time_now: Callable[[], float] = lambda: time.time()
+    state: WarmUpState = field(default_factory=WarmUpState)
+
+    @property
+    def ready(self) -> bool:
+        return self.state.status == "ready"
+
+    async def run(self) -> None:
+        self.state.started_at = self.time_now()
+        try:
+            # It's cpu bound, so it goes to a thread and the server can answer meanwhile
+            await asyncio.to_thread(self._warm_up)
+        except Exception as e:
+            self.state.status = "failed"
+            self.state.error = f"{type(e).__name__}: {e}"
+            return
+        self.state.durations = dict(self.anti_recommender.load_durations)
+        self.state.model_fitted = self.anti_recommender.model_fitted
+        self.state.ready_at = self.time_now()
+        self.state.status = "ready"
+
+    def _warm_up(self) -> None:
+        anti_recommender = self.anti_recommender
+        anti_recommender.load()
+        start = time.perf_counter()
+        tracks = anti_recommender.get_random_tracks(WARM_UP_TRACKS)
+        anti_recommender.antirecommend(tracks)
+        anti_recommender.antirecommend_many([tracks], [0.6])
+        anti_recommender.load_durations["first_recommendation"] = (
+            time.perf_counter() - start
+        )
+
+
+async def get_warm_up(request: Request) -> WarmUp:
+    warm_up: WarmUp = request.app.state.warm_up
+    return warm_up
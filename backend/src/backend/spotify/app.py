@@ -1,16 +1,18 @@
+import threading
 import time
-from dataclasses import dataclass
-from typing import List, Callable
+from dataclasses import dataclass, field
+from typing import Callable, Optional
 
 from pydantic import ValidationError
 
+from src.backend import metrics
 from src.backend.spotify.result import Result, Error
 from src.backend.spotify.domain.token_repository import (
     TokenRepository,
     Token,
 )
 from src.backend.spotify.domain.user_repository import (
-    UserRepository,
+    QueryableUserRepository,
     User,
     Mail,
 )
@@ -24,10 +26,6 @@ class FetchUsersError(Error):
     pass
 
 
-class DuplicatedUserInDatabaseError(Error):
-    pass
-
-
 class DeletingUserError(Error):
     pass
 
@@ -48,40 +46,75 @@ class SpotifyApp:
 
     We reverse engineered the code for posting and deleting users (which is just calls with your token
     to some spotify endpoints). This will eventually break the day spotify changes his API's.
+
+    The token is kept in memory (the repository is only used for durability), and when it expires
+    only one caller refreshes it: the rest of them wait for its result.
     """
 
-    users: UserRepository
+    users: QueryableUserRepository
     tokens: TokenRepository
     users_threshold: int = 20
     time_now: Callable[[], float] = lambda: time.time()
-
-    @staticmethod
-    def _found_user(user: List[User]) -> Result[User, DuplicatedUserInDatabaseError]:
-        if len(user) == 1:
-            return Result.success(user[0])
-        return Result.failure(
-            DuplicatedUserInDatabaseError(
-                message=f"We have {len(user)} of your user in our database. Should be impossible"
-            )
-        )
+    _token: Optional[Token] = field(default=None, init=False)
+    _token_lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+    _token_updates: int = field(default=0, init=False)
+    _last_token_update: Optional[Result[Token, Error]] = field(default=None, init=False)
 
     def _is_token_expired(self, token: Token) -> bool:
         is_expired = token.expires_at <= self.time_now()
         assert isinstance(is_expired, bool), "Impossible! The time library has a bug"
         return is_expired
 
-    def _get_token(self) -> Result[Token, Error]:
-        result_token = self.tokens.get_token()
-        if result_token.is_error or (
-            not self._is_token_expired(result_token.success_value)
-        ):
+    def get_token(self) -> Result[Token, Error]:
+        """
+        Current token, it's only refreshed if it's already expired
+        """
+        token = self._token
+        if token is not None and not self._is_token_expired(token):
+            return Result.success(token)
+        return self._update_token(updates_seen=self._token_updates)
+
+    def refresh_token(self) -> Result[Token, Error]:
+        """
+        Refreshes the token even if it hasn't expired yet, so we can do it before any request needs it
+        """
+        return self._update_token(updates_seen=self._token_updates, force=True)
+
+    def _update_token(
+        self, updates_seen: int, force: bool = False
+    ) -> Result[Token, Error]:
+        """
+        Loads the token from the repository, refreshing it if it's expired (or if we force it).
+        If somebody updated the token while we were waiting for the lock, we return its result
+        instead of refreshing it again.
+        """
+        with self._token_lock:
+            last_update = self._last_token_update
+            if self._token_updates != updates_seen and last_update is not None:
+                return last_update
+            result_token = (
+                Result.success(self._token)
+                if self._token is not None
+                else self.tokens.get_token()
+            )
+            if not result_token.is_error and (
+                force or self._is_token_expired(result_token.success_value)
+            ):
+                with metrics.TOKEN_REFRESH_SECONDS.time():
+                    result_token = self.tokens.refresh_token()
+                metrics.TOKEN_REFRESHES.inc(
+                    result="failure" if result_token.is_error else "success"
+                )
+            if not result_token.is_error:
+                self._token = result_token.success_value
+            self._token_updates += 1
+            self._last_token_update = result_token
             return result_token
-        return self.tokens.refresh_token()
 
     def _create_user(
         self, mail: Mail
     ) -> Result[User, CreatingUserError | TokenExpired]:
-        result_token = self._get_token()
+        result_token = self.get_token()
         if result_token.is_error:
             return Result.failure(
                 TokenExpired(message=result_token.error_value.message)
@@ -95,20 +128,26 @@ class SpotifyApp:
             )
         return result_creating  # type: ignore
 
-    def _delete_first_user(
-        self, users: List[User]
-    ) -> Result[None, DeletingUserError | TokenExpired]:
-        first_user: User = min(users, key=lambda user: user.creation_date)
-        token = self._get_token()
+    def _delete_oldest_user(
+        self,
+    ) -> Result[None, FetchUsersError | DeletingUserError | TokenExpired]:
+        oldest_user = self.users.oldest_user()
+        if oldest_user.is_error:
+            return Result.failure(FetchUsersError(oldest_user.error_value.message))
+        if oldest_user.success_value is None:
+            return Result.success(None)
+        token = self.get_token()
         if token.is_error:
             return Result.failure(TokenExpired(message=token.error_value.message))
-        result = self.users.delete_user(first_user.mail, token.success_value)
+        result = self.users.delete_user(
+            oldest_user.success_value.mail, token.success_value
+        )
         if result.is_error:
             return Result.failure(DeletingUserError(message=result.error_value.message))
         return Result.success(None)
 
     @staticmethod
-    def _get_mail(mail: str) -> Result[Mail, MailError]:
+    def get_mail(mail: str) -> Result[Mail, MailError]:
         try:
             return Result.success(Mail(address=mail))
         except ValidationError:
@@ -120,24 +159,24 @@ class SpotifyApp:
         User,
         MailError
         | FetchUsersError
-        | DuplicatedUserInDatabaseError
         | DeletingUserError
         | CreatingUserError
         | TokenExpired,
     ]:
-        result_mail = SpotifyApp._get_mail(mail)
+        result_mail = SpotifyApp.get_mail(mail)
         if result_mail.is_error:
             return result_mail  # type: ignore
         _mail = result_mail.success_value
-        users = self.users.users()
-        if users.is_error:
-            return Result.failure(FetchUsersError(users.error_value.message))
-        user_list: List[User] = users.success_value
-        user = list(filter(lambda usr: usr.mail.address == mail, user_list))
-        if user:
-            return SpotifyApp._found_user(user)  # type: ignore
-        if len(user_list) >= self.users_threshold:
-            delete_status = self._delete_first_user(user_list)
+        user = self.users.find_by_mail(_mail)
+        if user.is_error:
+            return Result.failure(FetchUsersError(user.error_value.message))
+        if user.success_value is not None:
+            return Result.success(user.success_value)
+        users_count = self.users.count()
+        if users_count.is_error:
+            return Result.failure(FetchUsersError(users_count.error_value.message))
+        if users_count.success_value >= self.users_threshold:
+            delete_status = self._delete_oldest_user()
             if delete_status.is_error:
                 return delete_status  # type: ignore
         return self._create_user(_mail)  # type: ignore
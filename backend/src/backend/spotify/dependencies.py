@@ -1,16 +1,26 @@
 import os
+from dataclasses import dataclass
 from functools import wraps
 from typing import TypeVar, Callable, Any
 
+from starlette.requests import Request
+
 from src.backend.spotify.app import SpotifyApp
 from src.backend.spotify.infra.repository_implementation import (
     RepositoryImplementation,
 )
+from src.backend.spotify.infra.sqlite.jobs import SqliteWhitelistJobRepository
+from src.backend.spotify.whitelist_worker import WhitelistWorker
+from src.backend.spotify.token_refresher import (
+    TokenRefresher,
+    DEFAULT_REFRESH_MARGIN_SECONDS,
+)
 
 APP_ID_ENV = "APP_ID"
 USER_ID_ENV = "USER_ID"
 SQLITE_PATH_ENV = "SQLITE_PATH"
 INITIAL_TOKEN_ENV = "INITIAL_TOKEN"
+TOKEN_REFRESH_MARGIN_ENV = "TOKEN_REFRESH_MARGIN_SECONDS"
 
 T = TypeVar("T", bound=Callable[..., Any])
 
@@ -62,6 +72,12 @@ def get_initial_token_env() -> str | None:
     pass
 
 
+def get_token_refresh_margin() -> float:
+    return float(
+        os.environ.get(TOKEN_REFRESH_MARGIN_ENV, DEFAULT_REFRESH_MARGIN_SECONDS)
+    )
+
+
 def get_sqlite_repo() -> RepositoryImplementation:
     app_id = get_app_id()
     user_id = get_user_id()
@@ -75,10 +91,53 @@ def get_sqlite_repo() -> RepositoryImplementation:
     )
 
 
-sqlite_repo = get_sqlite_repo()
+@dataclass
+class SpotifyDependencies:
+    """
+    Everything the spotify app needs, wired together. It's created on the startup of the server
+    (opening the database and loading the token), not when it's imported.
+    """
+
+    repository: RepositoryImplementation
+    spotify_app: SpotifyApp
+    token_refresher: TokenRefresher
+    whitelist_worker: WhitelistWorker
+
+    def close(self) -> None:
+        self.repository.close()
+
+
+def create_spotify_dependencies() -> SpotifyDependencies:
+    sqlite_repo = get_sqlite_repo()
+    spotify_app = SpotifyApp(users=sqlite_repo, tokens=sqlite_repo)
+    return SpotifyDependencies(
+        repository=sqlite_repo,
+        spotify_app=spotify_app,
+        token_refresher=TokenRefresher(
+            app=spotify_app, margin=get_token_refresh_margin()
+        ),
+        whitelist_worker=WhitelistWorker(
+            app=spotify_app,
+            jobs=SqliteWhitelistJobRepository(
+                sqlite_path=sqlite_repo.sqlite_path,
+                connections=sqlite_repo.sqlite_connections,
+            ),
+        ),
+    )
+
+
+def _spotify_dependencies(request: Request) -> SpotifyDependencies:
+    dependencies: SpotifyDependencies = request.app.state.spotify
+    return dependencies
+
+
+async def get_spotify_app(request: Request) -> SpotifyApp:
+    return _spotify_dependencies(request).spotify_app
+
 
-_spotify_app = SpotifyApp(users=sqlite_repo, tokens=sqlite_repo)
+async def get_token_refresher(request: Request) -> TokenRefresher:
+    return _spotify_dependencies(request).token_refresher
 
 
-async def get_spotify_app() -> SpotifyApp:
-    return _spotify_app
+async def get_whitelist_worker(request: Request) -> WhitelistWorker:
+    return _spotify_dependencies(request).whitelist_worker
@@ -1,6 +1,8 @@
 from src.backend.spotify.domain.user_repository import (
     User,
     UserRepository,
+    UserQueries,
+    QueryableUserRepository,
     Mail,
 )
 
@@ -10,4 +12,20 @@ from src.backend.spotify.domain.token_repository import (
     SpotifyToken,
 )
 
-__all__ = ["Token", "TokenRepository", "SpotifyToken", "User", "UserRepository", "Mail"]
+from src.backend.spotify.domain.whitelist_job_repository import (
+    WhitelistJob,
+    WhitelistJobRepository,
+)
+
+__all__ = [
+    "Token",
+    "TokenRepository",
+    "SpotifyToken",
+    "User",
+    "UserRepository",
+    "UserQueries",
+    "QueryableUserRepository",
+    "Mail",
+    "WhitelistJob",
+    "WhitelistJobRepository",
+]
@@ -1,5 +1,5 @@
 from abc import abstractmethod, ABC
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, EmailStr
 
@@ -28,3 +28,28 @@ class UserRepository(ABC):
     @abstractmethod
     def add_user(self, mail: Mail, token: Token) -> Result[User, Error]:
         raise NotImplementedError("Abstract class should implement add_user")
+
+
+class UserQueries(ABC):
+    """
+    Lookups of the users we have saved, that only our database can answer (spotify doesn't
+    have an api for them)
+    """
+
+    @abstractmethod
+    def find_by_mail(self, mail: Mail) -> Result[Optional[User], Error]:
+        raise NotImplementedError("Abstract class should implement find_by_mail")
+
+    @abstractmethod
+    def count(self) -> Result[int, Error]:
+        raise NotImplementedError("Abstract class should implement count")
+
+    @abstractmethod
+    def oldest_user(self) -> Result[Optional[User], Error]:
+        raise NotImplementedError("Abstract class should implement oldest_user")
+
+
+class QueryableUserRepository(UserRepository, UserQueries, ABC):
+    """
+    A user repository that can also look up the users it saved
+    """
@@ -0,0 +1,49 @@
+from abc import ABC, abstractmethod
+from typing import Literal, Optional
+
+from pydantic import BaseModel
+
+from src.backend.spotify.result import Result, Error
+
+JobStatus = Literal["pending", "running", "done", "failed"]
+
+
+class WhitelistJob(BaseModel):
+    """
+    Adding mail to the whitelist of the app, done in the background.
+    attempts is how many times we tried to add it, and error the error of the last one.
+    """
+
+    id: str
+    mail: str
+    status: JobStatus
+    attempts: int = 0
+    error: str | None = None
+    created_at: float
+    updated_at: float
+
+
+class WhitelistJobRepository(ABC):
+    @abstractmethod
+    def enqueue(self, mail: str) -> Result[WhitelistJob, Error]:
+        raise NotImplementedError("Abstract class should implement enqueue")
+
+    @abstractmethod
+    def job(self, job_id: str) -> Result[Optional[WhitelistJob], Error]:
+        raise NotImplementedError("Abstract class should implement job")
+
+    @abstractmethod
+    def claim_next_job(self, owner: str) -> Result[Optional[WhitelistJob], Error]:
+        """
+        Claims the oldest job that isn't finished (done or failed) yet for owner. Nobody else
+        can claim it (or the jobs after it, so they're done in order) until owner finishes it
+        or its claim expires (because owner died). None if there's no job we can claim.
+        """
+        raise NotImplementedError("Abstract class should implement claim_next_job")
+
+    @abstractmethod
+    def update(self, job: WhitelistJob, owner: str) -> Result[WhitelistJob, Error]:
+        """
+        Saves the job if owner has claimed it, renewing the claim (or releasing it if the job is finished)
+        """
+        raise NotImplementedError("Abstract class should implement update")
@@ -0,0 +1,263 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Mapping, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+
+from src.backend import metrics
+
+HTTP_POOL_SIZE_ENV = "HTTP_POOL_SIZE"
+HTTP_CONNECT_TIMEOUT_ENV = "HTTP_CONNECT_TIMEOUT"
+HTTP_READ_TIMEOUT_ENV = "HTTP_READ_TIMEOUT"
+HTTP_MAX_RETRIES_ENV = "HTTP_MAX_RETRIES"
+
+# Responses that request_with_retries tries again
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+@dataclass(frozen=True)
+class HttpConfig:
+    """
+    pool_size: connections we keep alive for every host
+    pool_hosts: how many hosts we keep a pool for
+    max_retries: how many times we try again a connection that couldn't be opened, or a
+                 call of request_with_retries
+    retry_backoff: seconds we wait before the first retry (it doubles on every retry)
+    retry_backoff_max: max seconds we wait between retries, even if the server asks for more
+    """
+
+    pool_size: int = 100
+    pool_hosts: int = 10
+    connect_timeout: float = 5.0
+    read_timeout: float = 10.0
+    max_retries: int = 3
+    retry_backoff: float = 0.3
+    retry_backoff_max: float = 2.0
+
+    @staticmethod
+    def from_env(environment: Mapping[str, str] = os.environ) -> "HttpConfig":
+        default = HttpConfig()
+        return HttpConfig(
+            pool_size=int(environment.get(HTTP_POOL_SIZE_ENV, default.pool_size)),
+            connect_timeout=float(
+                environment.get(HTTP_CONNECT_TIMEOUT_ENV, default.connect_timeout)
+            ),
+            read_timeout=float(
+                environment.get(HTTP_READ_TIMEOUT_ENV, default.read_timeout)
+            ),
+            max_retries=int(environment.get(HTTP_MAX_RETRIES_ENV, default.max_retries)),
+        )
+
+
+@dataclass
+class ConnectionStats:
+    requests: int = 0
+    new_connections: int = 0
+
+    @property
+    def reused_connections(self) -> int:
+        return self.requests - self.new_connections
+
+
+def _count_response(response: requests.Response, *args: Any, **kwargs: Any) -> None:
+    metrics.UPSTREAM_RESPONSES.inc(
+        host=urlsplit(response.url).hostname or "", status=str(response.status_code)
+    )
+
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    requests doesn't have a default timeout, so we add it to every request
+    """
+
+    def __init__(self, timeout: Tuple[float, float], **kwargs: Any):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> Any:  # type: ignore[override]
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+@dataclass
+class HttpPool:
+    """
+    The only place where we create http clients: a requests session (for the sync code and spotipy)
+    and an httpx client (for the async code), both with keep-alive pools for every host, the same
+    timeouts, and counters of how many connections we opened and reused.
+
+    By default we only retry opening a connection (the request never reached the server). Calls
+    that are safe to repeat can opt in to retry errors too with request_with_retries.
+    """
+
+    config: HttpConfig = field(default_factory=HttpConfig.from_env)
+    sleep: Callable[[float], None] = time.sleep
+    _session: requests.Session | None = field(default=None, init=False)
+    _async_clients: Dict[str, httpx.AsyncClient] = field(
+        default_factory=dict, init=False
+    )
+    _async_stats: Dict[str, ConnectionStats] = field(default_factory=dict, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                self._session = self._build_session()
+            return self._session
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = _TimeoutHTTPAdapter(
+            timeout=(self.config.connect_timeout, self.config.read_timeout),
+            pool_connections=self.config.pool_hosts,
+            pool_maxsize=self.config.pool_size,
+            max_retries=Retry(
+                total=self.config.max_retries,
+                connect=self.config.max_retries,
+                read=False,
+                status=0,
+                other=0,
+                respect_retry_after_header=False,
+            ),
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.hooks["response"].append(_count_response)
+        return session
+
+    def request_with_retries(
+        self, method: str, url: str, **kwargs: Any
+    ) -> requests.Response:
+        """
+        Same as session.request, but the errors of RETRY_STATUSES and the connection errors are
+        tried again (up to max_retries times) with exponential backoff. Only use it for calls
+        that are safe to repeat.
+        When we run out of retries, we return the last response (or raise the last connection error).
+        """
+        for attempt in range(self.config.max_retries):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError:
+                self.sleep(self._backoff(attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            response.close()
+            self.sleep(self._backoff(attempt, response.headers.get("Retry-After")))
+        return self.session.request(method, url, **kwargs)
+
+    def _backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        wait = self.config.retry_backoff * 2.0**attempt
+        if retry_after is not None and retry_after.isdigit():
+            wait = float(retry_after)
+        return min(wait, self.config.retry_backoff_max)
+
+    def async_client(self, base_url: str) -> httpx.AsyncClient:
+        """
+        Shared async client for base_url, it's created the first time we ask for it
+        """
+        with self._lock:
+            client = self._async_clients.get(base_url)
+            if client is None or client.is_closed:
+                client = self._build_async_client(base_url)
+                self._async_clients[base_url] = client
+            return client
+
+    def _build_async_client(self, base_url: str) -> httpx.AsyncClient:
+        stats = self._async_stats.setdefault(
+            urlsplit(base_url).netloc, ConnectionStats()
+        )
+
+        async def on_connection_event(event_name: str, _: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                stats.new_connections += 1
+
+        async def on_request(request: httpx.Request) -> None:
+            stats.requests += 1
+            request.extensions["trace"] = on_connection_event
+
+        async def on_response(response: httpx.Response) -> None:
+            metrics.UPSTREAM_RESPONSES.inc(
+                host=response.request.url.host, status=str(response.status_code)
+            )
+
+        return httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(
+                self.config.read_timeout, connect=self.config.connect_timeout
+            ),
+            transport=httpx.AsyncHTTPTransport(
+                retries=self.config.max_retries,
+                limits=httpx.Limits(
+                    max_connections=self.config.pool_size,
+                    max_keepalive_connections=self.config.pool_size,
+                ),
+            ),
+            event_hooks={"request": [on_request], "response": [on_response]},
+        )
+
+    def stats(self) -> Dict[str, ConnectionStats]:
+        """
+        Requests and new connections for every host. Requests that didn't open a connection
+        reused one from the pool.
+        """
+        stats = {
+            host: ConnectionStats(**vars(s)) for host, s in self._async_stats.items()
+        }
+        if self._session is not None:
+            adapters = {
+                id(adapter): adapter for adapter in self._session.adapters.values()
+            }
+            for adapter in adapters.values():
+                if not isinstance(adapter, HTTPAdapter):
+                    continue
+                for key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    host_stats = stats.setdefault(pool.host, ConnectionStats())
+                    host_stats.requests += pool.num_requests
+                    host_stats.new_connections += pool.num_connections
+        return stats
+
+    async def aclose(self) -> None:
+        for client in self._async_clients.values():
+            await client.aclose()
+        self._async_clients.clear()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+def pool_metrics(pool: HttpPool) -> List[metrics.Metric]:
+    """
+    Requests and new connections of every host of pool, to add it as a collector
+    """
+    requests_counter = metrics.Counter(
+        "http_pool_requests_total", "Requests to every host we call", ("host",)
+    )
+    connections_counter = metrics.Counter(
+        "http_pool_new_connections_total",
+        "Connections we opened to every host (the rest of requests reused one)",
+        ("host",),
+    )
+    for host, stats in pool.stats().items():
+        requests_counter.inc(stats.requests, host=host)
+        connections_counter.inc(stats.new_connections, host=host)
+    return [requests_counter, connections_counter]
+
+
+_http_pool = HttpPool()
+metrics.REGISTRY.add_collector("http_pool", lambda: pool_metrics(_http_pool))
+
+
+def get_http_pool() -> HttpPool:
+    return _http_pool
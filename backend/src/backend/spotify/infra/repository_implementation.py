@@ -1,5 +1,7 @@
+import time
+import uuid
 from dataclasses import dataclass, field
-from typing import List
+from typing import Callable, List, Optional
 
 from src.backend.spotify.infra.spotify.token import (
     SpotifyToken as SpotifyTokenService,
@@ -10,18 +12,27 @@ from src.backend.spotify.result import Result, Error
 from src.backend.spotify.domain import (
     TokenRepository,
     Token,
-    UserRepository,
+    QueryableUserRepository,
     User,
     Mail,
 )
+from src.backend.spotify.infra.sqlite.connection import SqliteConnectionManager
 from src.backend.spotify.infra.sqlite.token import SqliteTokenRepository
 from src.backend.spotify.infra.sqlite.users import SqliteUsersRepository
 
+# Longer than a refresh with all its retries, so the lease only expires if its owner died
+TOKEN_REFRESH_LEASE_SECONDS = 60.0
+TOKEN_REFRESH_LEASE_POLL_SECONDS = 0.1
+
 
 @dataclass
-class RepositoryImplementation(TokenRepository, UserRepository):
+class RepositoryImplementation(TokenRepository, QueryableUserRepository):
     """
     It's a cache for our users, and a database for our tokens.
+
+    Every worker of a host uses the same database, and every refresh changes the refresh token,
+    so only one process refreshes the token at once (the one with the refresh lease), and the
+    rest use the token it saved instead of refreshing it again.
     """
 
     app_id: str
@@ -30,14 +41,25 @@ class RepositoryImplementation(TokenRepository, UserRepository):
     sqlite_path: str
     spotify_token: SpotifyTokenService = field(init=False)
     spotify_user: SpotifyUser = field(init=False)
+    sqlite_connections: SqliteConnectionManager = field(init=False)
     sqlite_token: SqliteTokenRepository = field(init=False)
     sqlite_user: SqliteUsersRepository = field(init=False)
+    time_now: Callable[[], float] = lambda: time.time()
+    sleep: Callable[[float], None] = lambda seconds: time.sleep(seconds)
+    lease_seconds: float = TOKEN_REFRESH_LEASE_SECONDS
+    owner: str = field(default_factory=lambda: uuid.uuid4().hex, init=False)
 
     def __post_init__(self) -> None:
+        # Both repositories use the same database, so they share its connections
+        self.sqlite_connections = SqliteConnectionManager(sqlite_path=self.sqlite_path)
         self.sqlite_token = SqliteTokenRepository(
-            sqlite_path=self.sqlite_path, initial_token=self.initial_token
+            sqlite_path=self.sqlite_path,
+            initial_token=self.initial_token,
+            connections=self.sqlite_connections,
+        )
+        self.sqlite_user = SqliteUsersRepository(
+            sqlite_path=self.sqlite_path, connections=self.sqlite_connections
         )
-        self.sqlite_user = SqliteUsersRepository(sqlite_path=self.sqlite_path)
         initial_token = self.sqlite_token.get_token()
         if initial_token.is_error:
             raise ValueError(
@@ -63,11 +85,64 @@ class RepositoryImplementation(TokenRepository, UserRepository):
     def users(self) -> Result[List[User], Error]:
         return self.sqlite_user.users()
 
+    def find_by_mail(self, mail: Mail) -> Result[Optional[User], Error]:
+        return self.sqlite_user.find_by_mail(mail)
+
+    def count(self) -> Result[int, Error]:
+        return self.sqlite_user.count()
+
+    def oldest_user(self) -> Result[Optional[User], Error]:
+        return self.sqlite_user.oldest_user()
+
     def refresh_token(self) -> Result[Token, Error]:
-        refreshed_token_result = self.spotify_token.refresh_token()
-        if refreshed_token_result.is_error:
-            return refreshed_token_result
-        return self.sqlite_token.add_token(refreshed_token_result.success_value)
+        known_token = self.spotify_token.token
+        while True:
+            saved_token = self._saved_token_if_refreshed(known_token)
+            if saved_token is not None:
+                return saved_token
+            lease = self.sqlite_token.acquire_refresh_lease(
+                self.owner, self.time_now(), self.lease_seconds
+            )
+            if lease.is_error:
+                return lease  # type: ignore
+            if lease.success_value:
+                break
+            # Another process is refreshing it, we wait for its token
+            self.sleep(TOKEN_REFRESH_LEASE_POLL_SECONDS)
+        try:
+            # It could have been refreshed before we took the lease
+            saved_token = self._saved_token_if_refreshed(known_token)
+            if saved_token is not None:
+                return saved_token
+            refreshed_token_result = self.spotify_token.refresh_token()
+            if refreshed_token_result.is_error:
+                return refreshed_token_result
+            return self.sqlite_token.add_token(refreshed_token_result.success_value)
+        finally:
+            self.sqlite_token.release_refresh_lease(self.owner)
+
+    def _saved_token_if_refreshed(
+        self, known_token: Token
+    ) -> Optional[Result[Token, Error]]:
+        """
+        The saved token if another process refreshed it since we saw known_token (and it hasn't
+        expired), None if we have to refresh it ourselves. The next refresh starts from the
+        saved token, because the refresh token of known_token may not work anymore.
+        """
+        saved_token = self.sqlite_token.get_token()
+        if saved_token.is_error:
+            return saved_token
+        token = saved_token.success_value
+        self.spotify_token.token = token
+        if (
+            token.access_token != known_token.access_token
+            and token.expires_at > self.time_now()
+        ):
+            return saved_token
+        return None
 
     def get_token(self) -> Result[Token, Error]:
         return self.sqlite_token.get_token()
+
+    def close(self) -> None:
+        self.sqlite_connections.close()
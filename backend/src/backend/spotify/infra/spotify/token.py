@@ -1,8 +1,7 @@
 import time
-from dataclasses import dataclass
-
-import requests
+from dataclasses import dataclass, field
 
+from src.backend.spotify.infra.http import HttpPool, get_http_pool
 from src.backend.spotify.result import Result, Error
 from src.backend.spotify.domain import TokenRepository, Token
 
@@ -18,6 +17,7 @@ class SpotifyToken(TokenRepository):
 
     user_id: str
     token: Token
+    http: HttpPool = field(default_factory=get_http_pool)
 
     def get_token(self) -> Result[Token, Error]:
         return Result.success(self.token)
@@ -30,7 +30,10 @@ class SpotifyToken(TokenRepository):
                 "client_id": self.user_id,
             }
             headers = {"Content-Type": "application/x-www-form-urlencoded"}
-            response = requests.post(OAUTH_TOKEN_URL, data=payload, headers=headers)
+            # Refreshing with the same refresh token is safe to repeat
+            response = self.http.request_with_retries(
+                "POST", OAUTH_TOKEN_URL, data=payload, headers=headers
+            )
             response.raise_for_status()
             token_info = response.json()
             token_info["expires_at"] = int(time.time()) + token_info["expires_in"]
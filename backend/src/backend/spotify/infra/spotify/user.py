@@ -1,22 +1,23 @@
 import time
 from typing import List, Dict
 
-import requests
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
+from src.backend.spotify.infra.http import HttpPool, get_http_pool
 from src.backend.spotify.result import Result, Error
 from src.backend.spotify.domain import Token, UserRepository, Mail, User
 
 
 class SpotifyUser(BaseModel, UserRepository):
     app_id: str
+    _http: HttpPool = PrivateAttr(default_factory=get_http_pool)
 
     def users(self) -> Result[List[User], Error]:
         return Result.failure(Error("TODO: Implement get users from spotify api"))
 
     def delete_user(self, mail: Mail, token: Token) -> Result[User, Error]:
         try:
-            response = requests.delete(
+            response = self._http.session.delete(
                 self._delete_user_url(mail), headers=self._headers_from_token(token)
             )
             if response.status_code == 200:
@@ -38,7 +39,7 @@ class SpotifyUser(BaseModel, UserRepository):
                 "email": mail.address,
                 "name": mail.address,
             }
-            response = requests.post(
+            response = self._http.session.post(
                 self.endpoint, json=data, headers=self._headers_from_token(token)
             )
             if response.status_code == 200:
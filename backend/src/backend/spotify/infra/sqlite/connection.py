@@ -0,0 +1,70 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, List
+
+# Negative values are KiB for sqlite
+DEFAULT_CACHE_SIZE_KIB = 8 * 1024
+DEFAULT_BUSY_TIMEOUT_MS = 5_000
+# Prepared statements that sqlite3 keeps for every connection
+DEFAULT_CACHED_STATEMENTS = 128
+
+
+@dataclass
+class SqliteConnectionManager:
+    """
+    One long lived connection per thread to the same database, shared by all the sqlite repositories:
+        - WAL journaling, so readers don't block the writer (and the other way around)
+        - synchronous=NORMAL, that with WAL is still safe against corruption, and only fsyncs on checkpoints
+        - a bigger page cache, and a busy timeout so concurrent writers wait instead of failing
+        - since the connections are reused, the statements we prepare are cached and reused too
+    """
+
+    sqlite_path: str
+    cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB
+    busy_timeout_ms: int = DEFAULT_BUSY_TIMEOUT_MS
+    cached_statements: int = DEFAULT_CACHED_STATEMENTS
+    _local: threading.local = field(default_factory=threading.local, init=False)
+    _connections: List[sqlite3.Connection] = field(default_factory=list, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False)
+
+    def connection(self) -> sqlite3.Connection:
+        connection: sqlite3.Connection | None = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.sqlite_path,
+            timeout=self.busy_timeout_ms / 1000,
+            cached_statements=self.cached_statements,
+            # It's only used by the thread that created it, but close() is called from another one
+            check_same_thread=False,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA cache_size=-{self.cache_size_kib}")
+        connection.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Cursor]:
+        """
+        Cursor of the connection of this thread. Everything done with it is committed at the end,
+        or rolled back if there's an exception.
+        """
+        connection = self.connection()
+        with connection:
+            yield connection.cursor()
+
+    def close(self) -> None:
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
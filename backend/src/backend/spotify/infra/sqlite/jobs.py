@@ -0,0 +1,179 @@
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, ContextManager, Optional, Tuple
+
+from src.backend.spotify.domain.whitelist_job_repository import (
+    WhitelistJob,
+    WhitelistJobRepository,
+)
+from src.backend.spotify.infra.sqlite.connection import SqliteConnectionManager
+from src.backend.spotify.result import Result, Error
+
+_JOB_COLUMNS = "id, mail, status, attempts, error, created_at, updated_at"
+# Longer than an attempt and its backoff, so a claim only expires if its worker died
+DEFAULT_LEASE_SECONDS = 5 * 60
+
+
+@dataclass
+class SqliteWhitelistJobRepository(WhitelistJobRepository):
+    """
+    Persistent queue of whitelist jobs, so they survive restarts. Every worker of the host
+    shares it: a worker claims a job (owner and lease_until) before doing it, and its claim
+    lasts lease_seconds after its last update.
+    """
+
+    sqlite_path: str
+    connections: SqliteConnectionManager | None = None
+    time_now: Callable[[], float] = lambda: time.time()
+    lease_seconds: float = DEFAULT_LEASE_SECONDS
+
+    def __post_init__(self) -> None:
+        if self.connections is None:
+            self.connections = SqliteConnectionManager(sqlite_path=self.sqlite_path)
+        self._ensure_jobs_table()
+
+    def _transaction(self) -> ContextManager[sqlite3.Cursor]:
+        assert self.connections is not None, "It's created on __post_init__"
+        return self.connections.transaction()
+
+    def _ensure_jobs_table(self) -> None:
+        try:
+            with self._transaction() as cursor:
+                # The rowid keeps the order of the jobs created on the same instant
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS whitelist_jobs (
+                        id TEXT PRIMARY KEY,
+                        mail TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        attempts INTEGER NOT NULL,
+                        error TEXT,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                    """)
+                columns = {
+                    row[1]
+                    for row in cursor.execute("PRAGMA table_info(whitelist_jobs)")
+                }
+                # Tables created before the jobs were claimed don't have them
+                if "owner" not in columns:
+                    cursor.execute("ALTER TABLE whitelist_jobs ADD COLUMN owner TEXT")
+                if "lease_until" not in columns:
+                    cursor.execute(
+                        "ALTER TABLE whitelist_jobs ADD COLUMN lease_until REAL"
+                    )
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS whitelist_jobs_status ON whitelist_jobs (status, created_at)"
+                )
+        except sqlite3.Error as e:
+            raise ValueError(f"Whitelist jobs Database initialization error: {e}")
+
+    @staticmethod
+    def _to_job(row: Tuple[Any, ...]) -> WhitelistJob:
+        return WhitelistJob(
+            id=row[0],
+            mail=row[1],
+            status=row[2],
+            attempts=row[3],
+            error=row[4],
+            created_at=row[5],
+            updated_at=row[6],
+        )
+
+    def enqueue(self, mail: str) -> Result[WhitelistJob, Error]:
+        now = self.time_now()
+        job = WhitelistJob(
+            id=uuid.uuid4().hex,
+            mail=mail,
+            status="pending",
+            created_at=now,
+            updated_at=now,
+        )
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(
+                    f"INSERT INTO whitelist_jobs ({_JOB_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job.id,
+                        job.mail,
+                        job.status,
+                        job.attempts,
+                        job.error,
+                        job.created_at,
+                        job.updated_at,
+                    ),
+                )
+            return Result.success(job)
+        except sqlite3.Error as e:
+            return Result.failure(Error(message=str(e)))
+
+    def job(self, job_id: str) -> Result[Optional[WhitelistJob], Error]:
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(
+                    f"SELECT {_JOB_COLUMNS} FROM whitelist_jobs WHERE id = ?",
+                    (job_id,),
+                )
+                row = cursor.fetchone()
+                return Result.success(None if row is None else self._to_job(row))
+        except sqlite3.Error as e:
+            return Result.failure(Error(message=str(e)))
+
+    def claim_next_job(self, owner: str) -> Result[Optional[WhitelistJob], Error]:
+        now = self.time_now()
+        try:
+            with self._transaction() as cursor:
+                # A single statement, so two workers can't claim the same job. A running job
+                # with an expired claim is one whose worker died, we do it again
+                cursor.execute(
+                    f"""
+                    UPDATE whitelist_jobs
+                    SET status = 'running', owner = ?, lease_until = ?, updated_at = ?
+                    WHERE id = (
+                        SELECT id FROM whitelist_jobs
+                        WHERE status IN ('pending', 'running')
+                        ORDER BY created_at, rowid
+                        LIMIT 1
+                    ) AND (owner IS NULL OR owner = ? OR lease_until < ?)
+                    RETURNING {_JOB_COLUMNS}
+                    """,
+                    (owner, now + self.lease_seconds, now, owner, now),
+                )
+                row = cursor.fetchone()
+                return Result.success(None if row is None else self._to_job(row))
+        except sqlite3.Error as e:
+            return Result.failure(Error(message=str(e)))
+
+    def update(self, job: WhitelistJob, owner: str) -> Result[WhitelistJob, Error]:
+        updated_job = job.model_copy(update={"updated_at": self.time_now()})
+        finished = updated_job.status in ("done", "failed")
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE whitelist_jobs
+                    SET status = ?, attempts = ?, error = ?, updated_at = ?, owner = ?, lease_until = ?
+                    WHERE id = ? AND owner = ?
+                    """,
+                    (
+                        updated_job.status,
+                        updated_job.attempts,
+                        updated_job.error,
+                        updated_job.updated_at,
+                        None if finished else owner,
+                        None
+                        if finished
+                        else updated_job.updated_at + self.lease_seconds,
+                        updated_job.id,
+                        owner,
+                    ),
+                )
+                if cursor.rowcount == 0:
+                    return Result.failure(
+                        Error(message="Job not found, or claimed by another worker")
+                    )
+            return Result.success(updated_job)
+        except sqlite3.Error as e:
+            return Result.failure(Error(message=str(e)))
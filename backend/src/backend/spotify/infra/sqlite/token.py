@@ -2,21 +2,30 @@ import json
 import sqlite3
 from dataclasses import dataclass
 from json import JSONDecodeError
+from typing import ContextManager
 
 from pydantic import ValidationError
 
 from src.backend.spotify.result import Result, Error
 from src.backend.spotify.domain.token_repository import Token
+from src.backend.spotify.infra.sqlite.connection import SqliteConnectionManager
 
 
 @dataclass
 class SqliteTokenRepository:
     sqlite_path: str
     initial_token: str | None
+    connections: SqliteConnectionManager | None = None
 
     def __post_init__(self) -> None:
+        if self.connections is None:
+            self.connections = SqliteConnectionManager(sqlite_path=self.sqlite_path)
         self._ensure_token()
 
+    def _transaction(self) -> ContextManager[sqlite3.Cursor]:
+        assert self.connections is not None, "It's created on __post_init__"
+        return self.connections.transaction()
+
     def _ensure_token(self) -> Token:
         self._ensure_token_database()
         token_from_db = self.get_token()
@@ -30,8 +39,7 @@ class SqliteTokenRepository:
 
     def _ensure_token_database(self) -> None:
         try:
-            with sqlite3.connect(self.sqlite_path) as connection:
-                cursor = connection.cursor()
+            with self._transaction() as cursor:
                 cursor.execute(
                     """
                     CREATE TABLE IF NOT EXISTS tokens (
@@ -45,7 +53,19 @@ class SqliteTokenRepository:
                     )
                     """
                 )
-                connection.commit()
+                # Only one process refreshes the token at once: the one that holds this lease
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS token_refresh_lease (
+                        id INTEGER PRIMARY KEY CHECK (id = 0),
+                        owner TEXT,
+                        lease_until REAL NOT NULL
+                    )
+                    """
+                )
+                cursor.execute(
+                    "INSERT OR IGNORE INTO token_refresh_lease (id, owner, lease_until) VALUES (0, NULL, 0)"
+                )
         except sqlite3.Error as e:
             raise ValueError(f"Token Database initialization error: {e}")
 
@@ -69,8 +89,7 @@ class SqliteTokenRepository:
 
     def add_token(self, token: Token) -> Result[Token, Error]:
         try:
-            with sqlite3.connect(self.sqlite_path) as connection:
-                cursor = connection.cursor()
+            with self._transaction() as cursor:
                 cursor.execute("DELETE FROM tokens")
                 cursor.execute(
                     """
@@ -88,7 +107,6 @@ class SqliteTokenRepository:
                         token.expires_at,
                     ),
                 )
-                connection.commit()
             return Result.success(token)
         except sqlite3.IntegrityError as e:
             return Result.failure(Error(f"Token already exists: {e}"))
@@ -97,8 +115,7 @@ class SqliteTokenRepository:
 
     def get_token(self) -> Result[Token, Error]:
         try:
-            with sqlite3.connect(self.sqlite_path) as connection:
-                cursor = connection.cursor()
+            with self._transaction() as cursor:
                 cursor.execute("SELECT * FROM tokens LIMIT 1")
                 row = cursor.fetchone()
                 if row:
@@ -118,3 +135,36 @@ class SqliteTokenRepository:
                 )
         except sqlite3.Error as e:
             return Result.failure(Error(f"Error retrieving token from sqlite: {e}"))
+
+    def acquire_refresh_lease(
+        self, owner: str, now: float, lease_seconds: float
+    ) -> Result[bool, Error]:
+        """
+        Takes the refresh lease for `owner` if nobody has it (or if it has expired, because its
+        owner died while refreshing). It's false if another owner has it.
+        """
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE token_refresh_lease SET owner = ?, lease_until = ?
+                    WHERE id = 0 AND (owner IS NULL OR owner = ? OR lease_until < ?)
+                    """,
+                    (owner, now + lease_seconds, owner, now),
+                )
+                return Result.success(cursor.rowcount == 1)
+        except sqlite3.Error as e:
+            return Result.failure(Error(f"Error taking the token refresh lease: {e}"))
+
+    def release_refresh_lease(self, owner: str) -> Result[None, Error]:
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "UPDATE token_refresh_lease SET owner = NULL, lease_until = 0 WHERE id = 0 AND owner = ?",
+                    (owner,),
+                )
+            return Result.success(None)
+        except sqlite3.Error as e:
+            return Result.failure(
+                Error(f"Error releasing the token refresh lease: {e}")
+            )
@@ -1,42 +1,50 @@
 import sqlite3
 from dataclasses import dataclass
-from typing import List
+from typing import ContextManager, List, Optional
 
 from src.backend.spotify.result import Result, Error
-from src.backend.spotify.domain.user_repository import User, Mail
+from src.backend.spotify.domain.user_repository import User, Mail, UserQueries
+from src.backend.spotify.infra.sqlite.connection import SqliteConnectionManager
 
 
 @dataclass
-class SqliteUsersRepository:
+class SqliteUsersRepository(UserQueries):
     """
     It's a cache for our users logged in
     """
 
     sqlite_path: str
+    connections: SqliteConnectionManager | None = None
 
     def __post_init__(self) -> None:
+        if self.connections is None:
+            self.connections = SqliteConnectionManager(sqlite_path=self.sqlite_path)
         self._ensure_user_table()
 
+    def _transaction(self) -> ContextManager[sqlite3.Cursor]:
+        assert self.connections is not None, "It's created on __post_init__"
+        return self.connections.transaction()
+
     def _ensure_user_table(self) -> None:
         try:
-            with sqlite3.connect(self.sqlite_path) as connection:
-                cursor = connection.cursor()
+            with self._transaction() as cursor:
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS users (
                         mail TEXT PRIMARY KEY,
                         creation_date REAL NOT NULL
                     )
                     """)
-                connection.commit()
+                # mail is the primary key, so it's already indexed
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS users_creation_date ON users (creation_date)"
+                )
         except sqlite3.Error as e:
             raise ValueError(f"Users Database initialization error: {e}")
 
     def delete_user(self, user: User) -> Result[User, Error]:
         try:
-            with sqlite3.connect(self.sqlite_path) as connection:
-                cursor = connection.cursor()
+            with self._transaction() as cursor:
                 cursor.execute("DELETE FROM users WHERE mail = ?", (user.mail.address,))
-                connection.commit()
                 if cursor.rowcount == 0:
                     return Result.failure(Error(message="User not found"))
                 return Result.success(user)
@@ -45,13 +53,11 @@ class SqliteUsersRepository:
 
     def add_user(self, user: User) -> Result[User, Error]:
         try:
-            with sqlite3.connect(self.sqlite_path) as connection:
-                cursor = connection.cursor()
+            with self._transaction() as cursor:
                 cursor.execute(
                     "INSERT INTO users (mail, creation_date) VALUES (?, ?)",
                     (user.mail.address, user.creation_date),
                 )
-                connection.commit()
                 return Result.success(user)
         except sqlite3.IntegrityError:
             return Result.failure(Error(message="User already exists"))
@@ -60,8 +66,7 @@ class SqliteUsersRepository:
 
     def users(self) -> Result[List[User], Error]:
         try:
-            with sqlite3.connect(self.sqlite_path) as connection:
-                cursor = connection.cursor()
+            with self._transaction() as cursor:
                 cursor.execute("SELECT mail, creation_date FROM users")
                 rows = cursor.fetchall()
                 return Result.success(
@@ -72,3 +77,42 @@ class SqliteUsersRepository:
                 )
         except sqlite3.Error as e:
             return Result.failure(Error(message=str(e)))
+
+    def find_by_mail(self, mail: Mail) -> Result[Optional[User], Error]:
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "SELECT mail, creation_date FROM users WHERE mail = ?",
+                    (mail.address,),
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    return Result.success(None)
+                return Result.success(
+                    User(mail=Mail(address=row[0]), creation_date=row[1])
+                )
+        except sqlite3.Error as e:
+            return Result.failure(Error(message=str(e)))
+
+    def count(self) -> Result[int, Error]:
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM users")
+                return Result.success(int(cursor.fetchone()[0]))
+        except sqlite3.Error as e:
+            return Result.failure(Error(message=str(e)))
+
+    def oldest_user(self) -> Result[Optional[User], Error]:
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "SELECT mail, creation_date FROM users ORDER BY creation_date LIMIT 1"
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    return Result.success(None)
+                return Result.success(
+                    User(mail=Mail(address=row[0]), creation_date=row[1])
+                )
+        except sqlite3.Error as e:
+            return Result.failure(Error(message=str(e)))
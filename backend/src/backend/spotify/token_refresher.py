@@ -0,0 +1,85 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Literal
+
+from pydantic import BaseModel
+
+from src.backend.spotify.app import SpotifyApp
+from src.backend.spotify.domain import Token
+from src.backend.spotify.result import Result, Error
+
+DEFAULT_REFRESH_MARGIN_SECONDS = 5 * 60
+DEFAULT_RETRY_BACKOFF_SECONDS = 5.0
+DEFAULT_RETRY_BACKOFF_MAX_SECONDS = 5 * 60
+# Even if the new token expires before the margin, we don't refresh it more often than this
+MIN_REFRESH_INTERVAL_SECONDS = 10.0
+
+
+class TokenRefresherState(BaseModel):
+    """
+    status: starting (no token yet), ok (last refresh worked) or retrying (last refresh failed)
+    """
+
+    status: Literal["starting", "ok", "retrying"] = "starting"
+    expires_at: float | None = None
+    last_success_at: float | None = None
+    next_refresh_at: float | None = None
+    consecutive_failures: int = 0
+    last_error: str | None = None
+
+
+@dataclass
+class TokenRefresher:
+    """
+    Refreshes the token of the app `margin` seconds before it expires, so no request has to wait
+    for a refresh. If a refresh fails, we try again with exponential backoff (requests keep using
+    the current token meanwhile, and refresh it themselves if it expires).
+    """
+
+    app: SpotifyApp
+    margin: float = DEFAULT_REFRESH_MARGIN_SECONDS
+    retry_backoff: float = DEFAULT_RETRY_BACKOFF_SECONDS
+    retry_backoff_max: float = DEFAULT_RETRY_BACKOFF_MAX_SECONDS
+    sleep: Callable[[float], Awaitable[None]] = asyncio.sleep
+    state: TokenRefresherState = field(default_factory=TokenRefresherState)
+
+    async def run(self) -> None:
+        """
+        Refreshes the token forever, run it as a background task (and cancel it to stop it)
+        """
+        token = await self._until_success(self.app.get_token)
+        while True:
+            wait = self._seconds_until_refresh(token)
+            self.state.next_refresh_at = self.app.time_now() + wait
+            await self.sleep(wait)
+            token = await self._until_success(self.app.refresh_token)
+
+    def _seconds_until_refresh(self, token: Token) -> float:
+        return max(
+            token.expires_at - self.margin - self.app.time_now(),
+            MIN_REFRESH_INTERVAL_SECONDS,
+        )
+
+    async def _until_success(
+        self, get_token: Callable[[], Result[Token, Error]]
+    ) -> Token:
+        while True:
+            # The repositories block (http calls and sqlite), so they go to a thread
+            result = await asyncio.to_thread(get_token)
+            if not result.is_error:
+                token = result.success_value
+                self.state.status = "ok"
+                self.state.expires_at = token.expires_at
+                self.state.last_success_at = self.app.time_now()
+                self.state.consecutive_failures = 0
+                self.state.last_error = None
+                return token
+            self.state.status = "retrying"
+            self.state.consecutive_failures += 1
+            self.state.last_error = result.error_value.message
+            wait = min(
+                self.retry_backoff * 2.0 ** (self.state.consecutive_failures - 1),
+                self.retry_backoff_max,
+            )
+            self.state.next_refresh_at = self.app.time_now() + wait
+            await self.sleep(wait)
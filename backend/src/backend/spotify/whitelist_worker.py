@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from src.backend.spotify.app import SpotifyApp, MailError
+from src.backend.spotify.domain import WhitelistJob, WhitelistJobRepository
+from src.backend.spotify.result import Result, Error
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BACKOFF_SECONDS = 2.0
+DEFAULT_RETRY_BACKOFF_MAX_SECONDS = 60.0
+# We check the queue at least this often, even if nobody tells us there's a new job
+DEFAULT_POLL_INTERVAL_SECONDS = 5.0
+
+
+@dataclass
+class WhitelistWorker:
+    """
+    Does the whitelist jobs of the queue one by one, in the order they were enqueued. The order
+    matters: adding a user can remove the oldest one from the whitelist.
+
+    A job that fails is tried again (with exponential backoff) before going to the next one,
+    up to max_attempts times. Invalid mails fail without retries.
+
+    Every process of the host runs a worker over the same queue: a worker claims the job before
+    doing it, and stops doing it if it loses the claim.
+    """
+
+    app: SpotifyApp
+    jobs: WhitelistJobRepository
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    retry_backoff: float = DEFAULT_RETRY_BACKOFF_SECONDS
+    retry_backoff_max: float = DEFAULT_RETRY_BACKOFF_MAX_SECONDS
+    poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS
+    sleep: Callable[[float], Awaitable[None]] = asyncio.sleep
+    owner: str = field(default_factory=lambda: uuid.uuid4().hex, init=False)
+    _new_jobs: Optional[asyncio.Event] = field(default=None, init=False)
+    _loop: Optional[asyncio.AbstractEventLoop] = field(default=None, init=False)
+
+    def enqueue(self, mail: str) -> Result[WhitelistJob, MailError | Error]:
+        """
+        Saves the job on the queue and wakes up the worker. It can be called from any thread.
+        """
+        result_mail = SpotifyApp.get_mail(mail)
+        if result_mail.is_error:
+            return result_mail  # type: ignore
+        result = self.jobs.enqueue(mail)
+        if (
+            not result.is_error
+            and self._loop is not None
+            and self._new_jobs is not None
+        ):
+            self._loop.call_soon_threadsafe(self._new_jobs.set)
+        return result
+
+    async def run(self) -> None:
+        """
+        Does jobs forever, run it as a background task (and cancel it to stop it)
+        """
+        new_jobs = asyncio.Event()
+        self._new_jobs = new_jobs
+        self._loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # Cleared before looking at the queue, so we don't miss jobs enqueued meanwhile
+                new_jobs.clear()
+                if not await self.run_next_job():
+                    with contextlib.suppress(TimeoutError):
+                        await asyncio.wait_for(new_jobs.wait(), self.poll_interval)
+        finally:
+            self._loop = None
+            self._new_jobs = None
+
+    async def run_next_job(self) -> bool:
+        """
+        Does the next job of the queue (with its retries).
+
+        Returns:
+            bool: If there was a job to do.
+        """
+        # The repositories block (http calls and sqlite), so they go to a thread
+        next_job = await asyncio.to_thread(self.jobs.claim_next_job, self.owner)
+        if next_job.is_error:
+            await self.sleep(self.poll_interval)
+            return False
+        job: Optional[WhitelistJob] = next_job.success_value
+        if job is None:
+            return False
+        while job is not None and job.status in ("pending", "running"):
+            job = await self._attempt(job)
+        return True
+
+    async def _attempt(self, job: WhitelistJob) -> Optional[WhitelistJob]:
+        """
+        The job after trying it once, None if we couldn't save it (then we leave it: somebody
+        does it again once our claim expires)
+        """
+        running = job.model_copy(
+            update={"status": "running", "attempts": job.attempts + 1}
+        )
+        saved = await asyncio.to_thread(self.jobs.update, running, self.owner)
+        if saved.is_error:
+            return None
+        result = await asyncio.to_thread(self.app.add_user, job.mail)
+        if not result.is_error:
+            finished = running.model_copy(update={"status": "done", "error": None})
+        else:
+            error = result.error_value
+            can_retry = (
+                not isinstance(error, MailError)
+                and running.attempts < self.max_attempts
+            )
+            finished = running.model_copy(
+                update={
+                    "status": "pending" if can_retry else "failed",
+                    "error": error.message,
+                }
+            )
+        saved = await asyncio.to_thread(self.jobs.update, finished, self.owner)
+        if saved.is_error:
+            return None
+        if finished.status == "pending":
+            await self.sleep(
+                min(
+                    self.retry_backoff * 2.0 ** (finished.attempts - 1),
+                    self.retry_backoff_max,
+                )
+            )
+        return finished
@@ -0,0 +1,33 @@
+from typing import Any
+
+import pytest
+
+from src.backend.services.antirecommender import AntiRecommenderService
+from test.mothers.tracks import get_tracks
+
+
+@pytest.fixture
+def tracks_csv(tmp_path):
+    path = str(tmp_path / "tracks.csv")
+    get_tracks(rows=500).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def new_service():
+    """
+    Creates the antirecommender (it's a singleton) with these arguments, and forgets it after
+    the test
+    """
+
+    def new(**kwargs: Any) -> AntiRecommenderService:
+        AntiRecommenderService.reset()
+        return AntiRecommenderService(**kwargs)
+
+    yield new
+    AntiRecommenderService.reset()
+
+
+@pytest.fixture
+def service(tracks_csv, new_service):
+    return new_service(data_path=tracks_csv, num_clusters=5)
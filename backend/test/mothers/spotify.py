@@ -0,0 +1,59 @@
+from typing import Any, Dict
+
+
+def get_track_json(track_id: str, name: str = "name") -> Dict[str, Any]:
+    external_urls = {"spotify": f"https://open.spotify.com/track/{track_id}"}
+    artist = {
+        "external_urls": external_urls,
+        "href": "href",
+        "id": "artist",
+        "name": "artist",
+        "type": "artist",
+        "uri": "uri",
+    }
+    return {
+        "album": {
+            "album_type": "album",
+            "artists": [artist],
+            "available_markets": [],
+            "external_urls": external_urls,
+            "href": "href",
+            "id": "album",
+            "images": [{"height": 64, "url": f"https://image/{track_id}", "width": 64}],
+            "name": "album",
+            "release_date": "2024",
+            "release_date_precision": "year",
+            "total_tracks": 1,
+            "type": "album",
+            "uri": "uri",
+        },
+        "artists": [artist],
+        "available_markets": [],
+        "disc_number": 1,
+        "duration_ms": 1000,
+        "explicit": False,
+        "external_ids": {"isrc": "isrc"},
+        "external_urls": external_urls,
+        "href": "href",
+        "id": track_id,
+        "is_local": False,
+        "name": name,
+        "popularity": 50,
+        "preview_url": None,
+        "track_number": 1,
+        "type": "track",
+        "uri": f"spotify:track:{track_id}",
+    }
+
+
+def get_recently_played_json(*track_ids: str) -> Dict[str, Any]:
+    return {
+        "items": [
+            {"track": get_track_json(track_id), "played_at": "now", "context": None}
+            for track_id in track_ids
+        ],
+        "next": None,
+        "cursors": None,
+        "limit": 50,
+        "href": "href",
+    }
@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+from src.backend.services.dataset import NUMERICAL_FEATURES
+
+
+def get_tracks(rows: int = 200, seed: int = 0) -> pd.DataFrame:
+    random = np.random.default_rng(seed)
+    tracks = pd.DataFrame(
+        {feature: random.random(rows) for feature in NUMERICAL_FEATURES}
+    )
+    tracks.insert(0, "track_id", [f"track{row:06d}" for row in range(rows)])
+    tracks["time_signature"] = random.integers(3, 6, rows)
+    tracks["mode"] = random.integers(0, 2, rows)
+    tracks["explicit"] = random.random(rows) < 0.2
+    tracks["key"] = random.integers(0, 12, rows)
+    tracks["track_genre"] = random.choice(["pop", "rock", "jazz", "techno"], rows)
+    return tracks
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from src.backend.services.antirecommender import top_k
+from src.backend.services.clustering import ClusteringModel, MiniBatchKMeansBackend
+
+
+def test_antirecommendation_is_on_the_dataset(service):
+    [track] = service.antirecommend(["track000001", "track000002"])
+    assert service.filter_existing_tracks([track.track_id]) == [track.track_id]
+
+
+def test_top_k_antirecommendations_are_sorted_by_score(service):
+    user = ["track000001", "track000002", "track000003"]
+    tracks = service.antirecommend(user, k=10)
+    assert len(tracks) == 10
+    assert len({track.track_id for track in tracks}) == 10
+    scores = [track.score for track in tracks]
+    assert scores == sorted(scores)
+    assert tracks[0] == service.antirecommend(user, k=1)[0]
+
+
+def test_antirecommend_many_is_the_same_as_one_by_one(service):
+    users = [
+        ["track000001", "track000002", "track000003"],
+        ["track000100"],
+        ["track000200", "track000201", "track000200", "unknown"],
+    ]
+    alphas = [0.6, 0.2, 1.0]
+    expected = [
+        service.antirecommend(ids, alpha)[0].track_id
+        for ids, alpha in zip(users, alphas)
+    ]
+    assert service.antirecommend_many(users, alphas) == expected
+
+
+def test_antirecommend_many_without_known_tracks_is_none(service):
+    assert service.antirecommend_many([["unknown"], []], [0.6, 0.6]) == [None, None]
+
+
+def test_top_k_is_the_same_as_sorting_all_the_scores():
+    scores = np.array([0.5, 0.1, 0.3, 0.1, 0.9, 0.2])
+    assert top_k(scores, 1).tolist() == [1]
+    assert top_k(scores, 3).tolist() == [1, 3, 5]
+    assert top_k(scores, 10).tolist() == [1, 3, 5, 2, 0, 4]
+
+
+def test_same_tracks_hit_the_recommendations_cache(service):
+    first = service.antirecommend(["track000001", "track000002"], k=3)
+    misses = service.recommendations_cache.misses
+    second = service.antirecommend(["track000002", "unknown", "track000001"], k=3)
+    assert second == first
+    assert service.recommendations_cache.misses == misses
+    assert service.recommendations_cache.hits == 1
+
+
+def test_recommendations_cache_is_cleared_when_clusters_change(service):
+    service.antirecommend(["track000001"])
+    assert len(service.recommendations_cache) == 1
+    service._model_fingerprint = "another dataset"
+    service._initialize_clusters()
+    assert len(service.recommendations_cache) == 0
+
+
+@pytest.fixture
+def service_with_model(tracks_csv, new_service, tmp_path):
+    return new_service(
+        data_path=tracks_csv, num_clusters=5, model_path=str(tmp_path / "clusters.npz")
+    )
+
+
+def _fail_if_fitted(*args, **kwargs):
+    raise AssertionError("The clusters shouldn't be fitted again")
+
+
+def test_matching_model_is_reused_without_fitting(service_with_model, monkeypatch):
+    saved = service_with_model.build_model()
+    monkeypatch.setattr(ClusteringModel, "fit", _fail_if_fitted)
+    loaded = service_with_model.build_model()
+    assert loaded.fingerprint == saved.fingerprint
+    assert np.array_equal(loaded.labels, saved.labels)
+
+
+def test_model_of_another_dataset_is_fitted_again_and_saved(service_with_model):
+    model = service_with_model.build_model()
+    ClusteringModel(
+        labels=np.zeros_like(model.labels),
+        centers=model.centers,
+        fingerprint="another dataset",
+    ).save(service_with_model.model_path)
+    refitted = service_with_model.build_model()
+    assert refitted.fingerprint == model.fingerprint
+    assert np.array_equal(refitted.labels, model.labels)
+    saved = ClusteringModel.load(service_with_model.model_path)
+    assert saved is not None and saved.fingerprint == model.fingerprint
+
+
+def test_layout_is_saved_and_memory_mapped_next_to_the_model(service_with_model):
+    service_with_model.load()
+    assert isinstance(service_with_model.layout.numerical, np.memmap)
+    saved = service_with_model.layout
+    opened = service_with_model.build_layout(service_with_model.build_model())
+    assert opened.fingerprint == saved.fingerprint
+    assert np.array_equal(opened.numerical, saved.numerical)
+
+
+def test_random_tracks_are_different_and_on_the_dataset(service):
+    tracks = service.get_random_tracks(20)
+    assert len(set(tracks)) == 20
+    assert service.filter_existing_tracks(tracks) == tracks
+    assert len(service.get_random_tracks(10_000)) == 500
+
+
+def test_minibatch_backend_recommends_from_its_own_clusters(tracks_csv, new_service):
+    service = new_service(
+        data_path=tracks_csv,
+        num_clusters=5,
+        clustering_backend=MiniBatchKMeansBackend(chunk_rows=100),
+    )
+    [track] = service.antirecommend(["track000001", "track000002"])
+    furthest = service._find_furthest_cluster(
+        service._get_cluster_of_tracks(["track000001", "track000002"])
+    )
+    assert service.clusters[service.catalog.positions([track.track_id])[0]] == furthest
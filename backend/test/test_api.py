@@ -0,0 +1,178 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.backend import main
+from src.backend.schemas.recommend import Song
+from src.backend.services import antirecommender
+from src.backend.services.warm_up import WarmUp
+from src.backend.spotify.infra.sqlite.jobs import SqliteWhitelistJobRepository
+from src.backend.spotify.whitelist_worker import WhitelistWorker
+
+USER_TOKEN = {
+    "access_token": "token",
+    "expires": 0,
+    "expires_in": 3600,
+    "refresh_token": "refresh",
+    "scope": "scope",
+    "token_type": "Bearer",
+}
+RECENTLY_PLAYED = ["track000001", "track000002", "unknown"]
+
+
+class FakeSpotifyClient:
+    def __init__(self, access_token: str) -> None:
+        self.access_token = access_token
+
+    async def recently_played(self) -> List[Song]:
+        return [Song(id=track_id, name=track_id) for track_id in RECENTLY_PLAYED]
+
+    async def get_songs_from_ids(self, song_ids: List[str]) -> List[Song | None]:
+        return [Song(id=song_id, name=f"song {song_id}") for song_id in song_ids]
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    repository = SqliteWhitelistJobRepository(sqlite_path=str(tmp_path / "jobs.db"))
+    yield repository
+    assert repository.connections is not None
+    repository.connections.close()
+
+
+@pytest.fixture
+def client(service, jobs, monkeypatch):
+    # The warm up doesn't run, the tests run it when they need it
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        app.state.anti_recommender = service
+        app.state.warm_up = WarmUp(anti_recommender=service)
+        app.state.spotify = MagicMock()
+        app.state.spotify.whitelist_worker = WhitelistWorker(app=MagicMock(), jobs=jobs)
+        yield
+
+    monkeypatch.setattr(main, "AsyncSpotifyClient", FakeSpotifyClient)
+    with TestClient(main.create_app(lifespan=lifespan)) as client:
+        yield client
+
+
+def test_recommend_gives_k_songs_from_the_recently_played(client):
+    response = client.post("/recommend?k=3", json=USER_TOKEN)
+    assert response.status_code == 200
+    body = response.json()
+    assert not body["isRandom"]
+    assert [song["id"] for song in body["fromSongs"]] == RECENTLY_PLAYED[:2]
+    recommendations = body["recommendations"]
+    assert len(recommendations) == 3
+    scores = [song["score"] for song in recommendations]
+    assert scores == sorted(scores)
+    assert body["recommended"]["id"] == recommendations[0]["id"]
+    assert recommendations[0]["name"] == f"song {recommendations[0]['id']}"
+
+
+def test_recommend_rejects_k_out_of_bounds(client):
+    assert client.post("/recommend?k=0", json=USER_TOKEN).status_code == 422
+
+
+def test_recommend_batch_gives_a_song_for_every_user(client, service):
+    response = client.post(
+        "/recommend/batch",
+        json={
+            "users": [
+                {"trackIds": ["track000001", "track000002"], "alpha": 0.3},
+                {"trackIds": ["unknown"]},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    known, unknown = response.json()["recommendations"]
+    assert known["isRandom"] is False
+    assert known["fromTracks"] == ["track000001", "track000002"]
+    [expected] = service.antirecommend(["track000001", "track000002"], alpha=0.3)
+    assert known["recommended"] == expected.track_id
+    assert unknown["isRandom"] is True
+    assert unknown["fromTracks"] == []
+    assert service.filter_existing_tracks([unknown["recommended"]]) == [
+        unknown["recommended"]
+    ]
+
+
+def test_queued_user_is_a_job_that_can_be_followed(client):
+    response = client.post("/user?queue=true", json={"mail": "test@test.com"})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["mail"] == "test@test.com"
+    assert job["status"] == "pending"
+
+    response = client.get(f"/user/jobs/{job['id']}")
+    assert response.status_code == 200
+    assert response.json() == job
+    assert client.get("/user/jobs/unknown").status_code == 404
+    invalid = client.post("/user?queue=true", json={"mail": "not a mail"})
+    assert invalid.status_code == 400
+
+
+def test_ready_only_after_the_warm_up(client):
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "warming_up"
+
+    asyncio.run(client.app.state.warm_up.run())
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert "first_recommendation" in response.json()["durations"]
+
+
+def test_metrics_have_the_latency_of_the_requests(client):
+    client.post("/recommend", json=USER_TOKEN)
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert (
+        'http_request_duration_seconds_count{method="POST",route="/recommend",status="200"}'
+        in response.text
+    )
+    assert 'recommend_stage_duration_seconds_count{stage="antirecommend"}' in (
+        response.text
+    )
+
+
+def test_recommend_before_the_warm_up_waits_for_a_single_load(
+    client, service, monkeypatch
+):
+    loading = threading.Event()
+    finish_loading = threading.Event()
+    loads = []
+    load_dataset = antirecommender.TracksDataset.load
+
+    def slow_load(*args, **kwargs):
+        loading.set()
+        # If the load blocked the event loop, nobody would release it before the timeout
+        loads.append(finish_loading.wait(timeout=5))
+        return load_dataset(*args, **kwargs)
+
+    monkeypatch.setattr(antirecommender.TracksDataset, "load", slow_load)
+    responses = []
+
+    def recommend() -> None:
+        responses.append(client.post("/recommend?k=2", json=USER_TOKEN))
+
+    requests = [threading.Thread(target=recommend) for _ in range(2)]
+    requests[0].start()
+    assert loading.wait(timeout=5), "The request should be loading the dataset"
+    requests[1].start()
+    # The server keeps answering while the dataset loads
+    assert client.get("/health/live").status_code == 200
+    assert client.get("/health/ready").status_code == 503
+    finish_loading.set()
+    for request in requests:
+        request.join(timeout=10)
+    assert loads == [True]
+    assert [response.status_code for response in responses] == [200, 200]
+    assert all(not response.json()["isRandom"] for response in responses)
@@ -0,0 +1,69 @@
+import asyncio
+
+import httpx
+
+from src.backend.services.async_spotify_client import (
+    AsyncSpotifyClient,
+    SPOTIFY_API_URL,
+)
+from src.backend.services.cache import TTLCache
+from test.mothers.spotify import get_track_json, get_recently_played_json
+
+
+def spotify_client(handler) -> AsyncSpotifyClient:
+    http = httpx.AsyncClient(
+        base_url=SPOTIFY_API_URL, transport=httpx.MockTransport(handler)
+    )
+    return AsyncSpotifyClient(
+        access_token="token", http=http, cache=TTLCache(max_size=10, ttl=10)
+    )
+
+
+def test_recently_played_songs_are_parsed():
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/v1/me/player/recently-played"
+        assert request.headers["Authorization"] == "Bearer token"
+        return httpx.Response(200, json=get_recently_played_json("a", "b"))
+
+    songs = asyncio.run(spotify_client(handler).recently_played())
+    assert [song.id for song in songs] == ["a", "b"]
+    assert songs[0].image == "https://image/a"
+
+
+def test_recently_played_is_empty_if_spotify_fails():
+    def handler(_: httpx.Request) -> httpx.Response:
+        return httpx.Response(401, json={"error": "expired token"})
+
+    assert asyncio.run(spotify_client(handler).recently_played()) == []
+
+
+def test_songs_that_cant_be_fetched_are_none():
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/v1/tracks"
+        assert request.url.params["ids"] == "a,b"
+        return httpx.Response(
+            200, json={"tracks": [get_track_json("a", name="song a"), None]}
+        )
+
+    songs = asyncio.run(spotify_client(handler).get_songs_from_ids(["a", "b"]))
+    assert songs[0] is not None and songs[0].name == "song a"
+    assert songs[1] is None
+
+
+def test_cached_songs_are_not_fetched_again():
+    requested_ids = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/v1/me/player/recently-played":
+            return httpx.Response(200, json=get_recently_played_json("a"))
+        ids = request.url.params["ids"].split(",")
+        requested_ids.append(ids)
+        return httpx.Response(200, json={"tracks": list(map(get_track_json, ids))})
+
+    async def fetch_songs(client: AsyncSpotifyClient) -> None:
+        await client.recently_played()
+        await client.get_songs_from_ids(["a", "b", "c", "b"])
+        await client.get_songs_from_ids(["c", "a"])
+
+    asyncio.run(fetch_songs(spotify_client(handler)))
+    assert requested_ids == [["b", "c"]]
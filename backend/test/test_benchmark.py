@@ -0,0 +1,51 @@
+import numpy as np
+
+from benchmark.catalog import synthetic_dataset, to_dataframe
+from benchmark.run import benchmark_size, compare
+from benchmark.song_index import benchmark_index
+from src.backend.services.dataset import TracksDataset
+
+
+def test_synthetic_dataset_matches_the_csv_schema(tmp_path):
+    dataset = synthetic_dataset(500, seed=0)
+    csv_path = tmp_path / "tracks.csv"
+    to_dataframe(dataset).to_csv(csv_path, index=False)
+    from_csv = TracksDataset.from_csv(str(csv_path))
+    assert len(from_csv.track_ids) == 500
+    np.testing.assert_allclose(from_csv.numerical, dataset.numerical, rtol=1e-5)
+
+
+def test_benchmark_times_every_stage(tmp_path):
+    stages = benchmark_size(2000, users=3, csv_max_rows=2000, directory=str(tmp_path))
+    assert set(stages) == {
+        "load_csv",
+        "load",
+        "_initialize_clusters",
+        "filter_existing_tracks",
+        "_calculate_profiles",
+        "_find_furthest_cluster",
+        "_get_most_similar_song_in_cluster",
+        "antirecommend",
+    }
+    assert stages["antirecommend"]["runs"] == 3
+
+
+def test_compare_only_reports_big_slowdowns():
+    baseline = {"1000": {"load": {"median_ms": 10.0}, "fit": {"median_ms": 0.01}}}
+    results = {
+        "1000": {"load": {"median_ms": 20.0}, "fit": {"median_ms": 0.05}},
+        "2000": {"load": {"median_ms": 50.0}},
+    }
+    regressions = compare(results, baseline, tolerance=0.25, min_delta_ms=0.1)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("load with 1000 rows")
+    assert compare(results, baseline, tolerance=1.5) == []
+
+
+def test_exact_song_index_has_full_recall(tmp_path):
+    results = benchmark_index(
+        3000, users=3, k=5, alpha=0.6, candidates=[4], directory=str(tmp_path)
+    )
+    assert set(results) == {"brute_force", "exact", "approximate_4"}
+    assert results["exact"]["recall"] == 1.0
+    assert 0 < results["approximate_4"]["recall"] <= 1.0
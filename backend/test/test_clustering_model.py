@@ -0,0 +1,196 @@
+import numpy as np
+import pytest
+
+from src.backend.services.clustering import (
+    DEFAULT_LAYOUT_SLACK,
+    ClusteringModel,
+    ClusterLayout,
+    KMeansBackend,
+    MiniBatchKMeansBackend,
+    clustering_backend,
+    dataset_fingerprint,
+)
+
+track_ids = np.array(["a", "b", "c", "d"])
+numerical_data = np.array([[0.0, 0.0], [0.1, 0.0], [5.0, 5.0], [5.1, 5.0]])
+features = ["energy", "valence"]
+
+
+def test_saved_model_is_loaded_back(tmp_path):
+    path = str(tmp_path / "clusters.npz")
+    fingerprint = dataset_fingerprint(track_ids, numerical_data, features, 2)
+    model = ClusteringModel.fit(numerical_data, 2, fingerprint)
+    model.save(path)
+    loaded = ClusteringModel.load(path)
+    assert loaded is not None
+    assert loaded.fingerprint == fingerprint
+    assert np.array_equal(loaded.labels, model.labels)
+    assert np.array_equal(loaded.centers, model.centers)
+
+
+def test_missing_model_is_none(tmp_path):
+    assert ClusteringModel.load(str(tmp_path / "nothing.npz")) is None
+
+
+def test_fingerprint_changes_with_the_clustering_inputs():
+    fingerprint = dataset_fingerprint(track_ids, numerical_data, features, 2)
+    assert fingerprint == dataset_fingerprint(track_ids, numerical_data, features, 2)
+    assert fingerprint != dataset_fingerprint(track_ids, numerical_data, features, 3)
+    assert fingerprint != dataset_fingerprint(
+        track_ids, numerical_data, ["energy", "tempo"], 2
+    )
+    assert fingerprint != dataset_fingerprint(
+        track_ids, numerical_data + 1, features, 2
+    )
+
+
+def test_corrupt_model_is_none(tmp_path):
+    path = str(tmp_path / "clusters.npz")
+    fingerprint = dataset_fingerprint(track_ids, numerical_data, features, 2)
+    ClusteringModel.fit(numerical_data, 2, fingerprint).save(path)
+    with open(path, "r+b") as file:
+        file.truncate(100)
+    assert ClusteringModel.load(path) is None
+
+
+def _layout_of(labels: np.ndarray, num_clusters: int) -> ClusterLayout:
+    model = ClusteringModel(
+        labels=labels.astype(np.int32),
+        centers=np.zeros((num_clusters, 1)),
+        fingerprint="model",
+    )
+    numerical = np.arange(len(labels), dtype=np.float32)[:, None]
+    categorical = (np.arange(len(labels)) % 3).astype(np.int8)[:, None]
+    return ClusterLayout.build(model, num_clusters, numerical, categorical)
+
+
+def test_layout_groups_the_rows_of_every_cluster():
+    # Cluster 1 is empty
+    labels = np.array([2, 0, 2, 3, 0, 2])
+    layout = _layout_of(labels, 4)
+    assert layout.offsets.tolist() == [0, 2, 2, 5, 6]
+    assert layout.rows.tolist() == [1, 4, 0, 2, 5, 3]
+    for cluster in range(4):
+        rows = layout.rows[layout.cluster(cluster)]
+        assert rows.tolist() == np.flatnonzero(labels == cluster).tolist()
+        assert layout.numerical[layout.cluster(cluster), 0].tolist() == rows.tolist()
+    assert len(layout.rows[layout.cluster(1)]) == 0
+
+
+def test_saved_layout_is_opened_memory_mapped(tmp_path):
+    directory = str(tmp_path / "layout")
+    layout = _layout_of(np.array([1, 0, 1, 0]), 2)
+    layout.save(directory)
+    opened = ClusterLayout.open(directory)
+    assert opened is not None
+    assert isinstance(opened.numerical, np.memmap)
+    assert isinstance(opened.categorical, np.memmap)
+    assert opened.fingerprint == layout.fingerprint
+    assert np.array_equal(opened.rows, layout.rows)
+    assert np.array_equal(opened.categorical, layout.categorical)
+
+
+def test_layout_written_by_chunks_is_the_same_as_the_built_one(tmp_path):
+    labels = np.random.default_rng(0).integers(0, 4, 1000)
+    layout = _layout_of(labels, 4)
+    model = ClusteringModel(
+        labels=labels.astype(np.int32), centers=np.zeros((4, 1)), fingerprint="model"
+    )
+    written = ClusterLayout.write(
+        model,
+        4,
+        np.arange(len(labels), dtype=np.float32)[:, None],
+        (np.arange(len(labels)) % 3).astype(np.int8)[:, None],
+        str(tmp_path / "layout"),
+        chunk_rows=64,
+    )
+    assert isinstance(written.numerical, np.memmap)
+    assert written.fingerprint == layout.fingerprint
+    for cluster in range(4):
+        expected, found = layout.cluster(cluster), written.cluster(cluster)
+        assert np.array_equal(written.rows[found], layout.rows[expected])
+        assert np.array_equal(written.numerical[found], layout.numerical[expected])
+        assert np.array_equal(written.categorical[found], layout.categorical[expected])
+        # Every cluster leaves free space for the ingested tracks
+        free = written.offsets[cluster + 1] - written.ends[cluster]
+        assert free == np.ceil((found.stop - found.start) * DEFAULT_LAYOUT_SLACK)
+    assert written.categorical.dtype == np.int8
+
+
+def test_appended_rows_go_to_the_free_space_of_their_cluster(tmp_path):
+    directory = str(tmp_path / "layout")
+    labels = np.array([1, 0, 1, 0, 1, 1, 0, 0, 1, 1, 0, 0, 0, 1, 1, 0, 0, 1, 1, 0])
+    numerical = np.arange(23, dtype=np.float32)[:, None]
+    categorical = (np.arange(23) % 3).astype(np.int8)[:, None]
+    model = ClusteringModel(
+        labels=labels.astype(np.int32), centers=np.zeros((2, 1)), fingerprint="model"
+    )
+    written = ClusterLayout.write(
+        model, 2, numerical[:20], categorical[:20], directory, slack=0.2
+    )
+    new_labels = np.array([1, 0, 1], dtype=np.int32)
+    appended = written.append(
+        directory, new_labels, 20, numerical[20:], categorical[20:], "ingested"
+    )
+    assert appended is not None
+    all_labels = np.concatenate([labels, new_labels])
+    for cluster in range(2):
+        rows = appended.rows[appended.cluster(cluster)]
+        assert rows.tolist() == np.flatnonzero(all_labels == cluster).tolist()
+        assert (
+            appended.numerical[appended.cluster(cluster), 0].tolist() == rows.tolist()
+        )
+    assert appended.categorical_digest == written.categorical_digest
+    assert appended.fingerprint == ClusterLayout.layout_fingerprint(
+        "ingested", written.categorical_digest
+    )
+    # Cluster 0 only has room for one more row
+    assert (
+        appended.append(
+            directory,
+            np.zeros(3, dtype=np.int32),
+            23,
+            numerical[:3],
+            categorical[:3],
+            "again",
+        )
+        is None
+    )
+
+
+def test_missing_layout_is_none(tmp_path):
+    assert ClusterLayout.open(str(tmp_path / "nothing")) is None
+
+
+def test_minibatch_backend_fits_by_chunks_of_a_memory_mapped_dataset(tmp_path):
+    generator = np.random.default_rng(0)
+    blobs = np.array([[0.0, 0.0], [10.0, 0.0], [0.0, 10.0]])
+    data = blobs[generator.integers(0, 3, 3000)] + generator.normal(size=(3000, 2))
+    np.save(tmp_path / "numerical.npy", data.astype(np.float32))
+    memory_mapped = np.load(tmp_path / "numerical.npy", mmap_mode="r")
+    labels, centers = MiniBatchKMeansBackend(chunk_rows=500).fit(memory_mapped, 3)
+    assert labels.dtype == np.int32 and labels.shape == (3000,)
+    assert centers.dtype == np.float64 and centers.shape == (3, 2)
+    # Every song is on the cluster of its closest center, like with KMeans
+    distances = np.linalg.norm(data[:, None, :] - centers[None, :, :], axis=2)
+    assert np.array_equal(labels, distances.argmin(axis=1))
+    assert np.allclose(np.sort(centers, axis=0), np.sort(blobs, axis=0), atol=0.2)
+
+
+def test_fingerprint_changes_with_the_backend():
+    assert dataset_fingerprint(
+        track_ids, numerical_data, features, 2, KMeansBackend()
+    ) != dataset_fingerprint(
+        track_ids, numerical_data, features, 2, MiniBatchKMeansBackend()
+    )
+    assert dataset_fingerprint(
+        track_ids, numerical_data, features, 2, MiniBatchKMeansBackend(epochs=1)
+    ) != dataset_fingerprint(
+        track_ids, numerical_data, features, 2, MiniBatchKMeansBackend(epochs=2)
+    )
+
+
+def test_backends_by_name():
+    assert clustering_backend("minibatch") == MiniBatchKMeansBackend()
+    with pytest.raises(ValueError):
+        clustering_backend("dbscan")
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.backend.spotify.infra.http import HttpConfig, HttpPool
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    unavailable_calls = 0
+
+    def do_GET(self) -> None:
+        if self.path == "/unavailable":
+            KeepAliveHandler.unavailable_calls += 1
+            self.send_response(503)
+            self.send_header("Retry-After", "3600")
+            self.send_header("Content-Length", "4")
+            self.end_headers()
+            self.wfile.write(b"busy")
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *_) -> None:
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    KeepAliveHandler.unavailable_calls = 0
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_config_is_read_from_env():
+    config = HttpConfig.from_env({"HTTP_POOL_SIZE": "3", "HTTP_READ_TIMEOUT": "1.5"})
+    assert config.pool_size == 3
+    assert config.read_timeout == 1.5
+    assert config.connect_timeout == HttpConfig().connect_timeout
+
+
+def test_session_reuses_connections(server_url):
+    pool = HttpPool(config=HttpConfig())
+    for _ in range(3):
+        assert pool.session.get(server_url).text == "ok"
+    [stats] = pool.stats().values()
+    assert stats.requests == 3
+    assert stats.new_connections == 1
+    assert stats.reused_connections == 2
+
+
+def test_async_client_reuses_connections(server_url):
+    pool = HttpPool(config=HttpConfig())
+
+    async def get_three_times() -> None:
+        client = pool.async_client(server_url)
+        for _ in range(3):
+            assert (await client.get("/")).text == "ok"
+        await pool.aclose()
+
+    asyncio.run(get_three_times())
+    [stats] = pool.stats().values()
+    assert stats.requests == 3
+    assert stats.new_connections == 1
+
+
+def test_session_does_not_retry_errors(server_url):
+    pool = HttpPool(config=HttpConfig())
+    response = pool.session.get(f"{server_url}/unavailable")
+    assert response.status_code == 503
+    assert KeepAliveHandler.unavailable_calls == 1
+
+
+def test_request_with_retries_caps_the_wait_and_returns_the_last_response(
+    server_url,
+):
+    waits = []
+    pool = HttpPool(config=HttpConfig(max_retries=2), sleep=waits.append)
+    response = pool.request_with_retries("GET", f"{server_url}/unavailable")
+    assert response.status_code == 503
+    assert response.text == "busy"
+    assert KeepAliveHandler.unavailable_calls == 3
+    assert waits == [HttpConfig().retry_backoff_max] * 2
@@ -0,0 +1,141 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.backend.services.clustering import ClusteringModel, layout_directory
+from src.backend.services.dataset import NUMERICAL_FILE, TracksDataset
+from src.backend.services.ingest import DriftStats, drift_path, ingest_tracks
+from test.mothers.tracks import get_tracks
+
+
+def _new_tracks(rows: int, seed: int = 1) -> TracksDataset:
+    tracks = get_tracks(rows=rows, seed=seed)
+    tracks["track_id"] = [f"new{row:06d}" for row in range(rows)]
+    return TracksDataset.from_dataframe(tracks)
+
+
+@pytest.fixture
+def paths(tmp_path, new_service):
+    data_path = str(tmp_path / "tracks")
+    model_path = str(tmp_path / "clusters.npz")
+    TracksDataset.from_dataframe(get_tracks(rows=500)).save(data_path)
+    new_service(data_path=data_path, num_clusters=5, model_path=model_path).load()
+    return data_path, model_path
+
+
+@pytest.fixture
+def ingest_service(paths, new_service):
+    """
+    A new antirecommender over the paths (like every run of the ingest)
+    """
+    data_path, model_path = paths
+    return lambda: new_service(
+        data_path=data_path, num_clusters=5, model_path=model_path
+    )
+
+
+def test_ingested_tracks_are_loaded_without_refitting(paths, ingest_service):
+    _, model_path = paths
+    centers = ClusteringModel.load(model_path).centers
+    result = ingest_tracks(ingest_service(), _new_tracks(50))
+    assert result.added == 50
+    assert result.duplicated == 0
+
+    service = ingest_service()
+    service.load()
+    assert service.model_fitted is False
+    assert len(service.data) == 550
+    assert service.filter_existing_tracks(["new000007"]) == ["new000007"]
+    assert np.array_equal(service._clusters_centers, centers)
+    # Every new track is on the cluster of its nearest center
+    new_numerical = service.data.numerical[500:].astype(np.float64)
+    distances = np.linalg.norm(new_numerical[:, None] - centers[None], axis=2)
+    assert np.array_equal(service.clusters[500:], distances.argmin(axis=1))
+    [track] = service.antirecommend(["new000001", "new000002"])
+    assert service.filter_existing_tracks([track.track_id]) == [track.track_id]
+
+
+def test_ingests_only_write_the_new_tracks(paths, ingest_service):
+    data_path, model_path = paths
+
+    def files():
+        return {
+            path: (os.stat(path).st_ino, os.stat(path).st_mtime_ns)
+            for path in (
+                model_path,
+                os.path.join(data_path, NUMERICAL_FILE),
+                os.path.join(layout_directory(model_path), "numerical.npy"),
+            )
+        }
+
+    before = files()
+    ingest_tracks(ingest_service(), _new_tracks(10))
+    # The first 10 are already on the catalog
+    ingest_tracks(ingest_service(), _new_tracks(30))
+    after = files()
+    # The fitted clusters aren't saved again, and the rest is appended in place
+    assert after[model_path] == before[model_path]
+    assert all(after[path][0] == before[path][0] for path in before)
+
+    service = ingest_service()
+    service.load()
+    assert service.model_fitted is False
+    assert len(service.data) == 530
+    for cluster in range(5):
+        rows = service.layout.rows[service.layout.cluster(cluster)]
+        assert (
+            sorted(rows.tolist())
+            == np.flatnonzero(service.clusters == cluster).tolist()
+        )
+
+
+def test_tracks_already_on_the_catalog_are_skipped(ingest_service):
+    tracks = get_tracks(rows=20, seed=1)
+    tracks["track_id"] = [f"track{row:06d}" for row in range(10)] + ["new000000"] * 10
+    result = ingest_tracks(ingest_service(), TracksDataset.from_dataframe(tracks))
+    assert result.added == 1
+    assert result.duplicated == 19
+    assert len(ingest_service().data) == 501
+
+
+def test_new_categories_are_appended(ingest_service):
+    tracks = get_tracks(rows=10, seed=1)
+    tracks["track_id"] = [f"new{row:06d}" for row in range(10)]
+    tracks["track_genre"] = ["ambient"] * 5 + ["pop"] * 5
+    ingest_tracks(ingest_service(), TracksDataset.from_dataframe(tracks))
+    data = ingest_service().data
+    genre = data.categories["track_genre"]
+    assert genre == ["jazz", "pop", "rock", "techno", "ambient"]
+    genres = [genre[code] for code in data.categorical[500:, -1]]
+    assert genres == tracks["track_genre"].tolist()
+
+
+def test_nudged_centers_move_to_the_mean_of_their_tracks(ingest_service):
+    result = ingest_tracks(ingest_service(), _new_tracks(200), nudge_centers=True)
+    assert result.drift.max_center_shift > 0
+
+    service = ingest_service()
+    service.load()
+    assert service.model_fitted is False
+    for cluster, center in enumerate(service._clusters_centers):
+        tracks = service.data.numerical[service.clusters == cluster]
+        assert np.allclose(center, tracks.mean(axis=0, dtype=np.float64))
+
+
+def test_drift_past_the_threshold_needs_a_refit(paths, ingest_service):
+    _, model_path = paths
+    result = ingest_tracks(ingest_service(), _new_tracks(50))
+    assert not result.needs_refit
+    far_away = _new_tracks(50, seed=2)
+    far_away = TracksDataset(
+        track_ids=np.char.add(far_away.track_ids, b"far"),
+        numerical=far_away.numerical + 3,
+        categorical=far_away.categorical,
+        categories=far_away.categories,
+    )
+    result = ingest_tracks(ingest_service(), far_away)
+    assert result.needs_refit
+    assert result.drift.ingested_rows == 100
+    assert result.drift.fitted_rows == 500
+    assert DriftStats.load(drift_path(model_path)) == result.drift
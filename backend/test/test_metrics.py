@@ -0,0 +1,52 @@
+import pytest
+
+from src.backend.metrics import Counter, Registry
+
+
+def test_render_counters_and_histograms():
+    registry = Registry()
+    responses = registry.counter("responses_total", "Responses", ("status",))
+    responses.inc(status="200")
+    responses.inc(2, status="500")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(3)
+    assert registry.render().splitlines() == [
+        "# HELP responses_total Responses",
+        "# TYPE responses_total counter",
+        'responses_total{status="200"} 1.0',
+        'responses_total{status="500"} 2.0',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1.0',
+        'latency_seconds_bucket{le="1.0"} 2.0',
+        'latency_seconds_bucket{le="+Inf"} 3.0',
+        "latency_seconds_sum 3.55",
+        "latency_seconds_count 3.0",
+    ]
+
+
+def test_collectors_of_the_same_metric_are_rendered_together():
+    registry = Registry()
+    for cache in ("songs", "recommendations"):
+
+        def collect(cache=cache):
+            hits = Counter("cache_hits_total", "Hits", ("cache",))
+            hits.inc(1, cache=cache)
+            return [hits]
+
+        registry.add_collector(cache, collect)
+    rendered = registry.render()
+    assert rendered.count("# TYPE cache_hits_total counter") == 1
+    assert 'cache_hits_total{cache="songs"} 1.0' in rendered
+    assert 'cache_hits_total{cache="recommendations"} 1.0' in rendered
+
+
+def test_labels_must_match_the_metric():
+    registry = Registry()
+    responses = registry.counter("responses_total", "Responses", ("status",))
+    with pytest.raises(ValueError):
+        responses.inc(host="spotify")
+    with pytest.raises(ValueError):
+        registry.counter("responses_total", "Responses again")
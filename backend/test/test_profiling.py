@@ -0,0 +1,67 @@
+import pstats
+
+from src.backend.profiling import ProfilingConfig, RequestProfiler
+
+
+def profiler_on(directory, profiles_kept=50) -> RequestProfiler:
+    return RequestProfiler(
+        config=ProfilingConfig(
+            enabled=True,
+            token="secret",
+            directory=str(directory),
+            profiles_kept=profiles_kept,
+        )
+    )
+
+
+def test_config_is_read_from_env():
+    config = ProfilingConfig.from_env(
+        {"PROFILING_ENABLED": "true", "PROFILING_TOKEN": "secret"}
+    )
+    assert config.enabled
+    assert config.token == "secret"
+    assert not ProfilingConfig.from_env({}).enabled
+
+
+def test_profiling_needs_to_be_enabled_and_the_token(tmp_path):
+    assert profiler_on(tmp_path).is_admin("secret")
+    assert not profiler_on(tmp_path).is_admin("wrong")
+    assert not profiler_on(tmp_path).is_admin(None)
+    disabled = RequestProfiler(config=ProfilingConfig(enabled=False, token="secret"))
+    assert not disabled.is_admin("secret")
+    without_token = RequestProfiler(config=ProfilingConfig(enabled=True))
+    assert not without_token.enabled
+
+
+def test_profile_is_saved_with_the_request_id(tmp_path):
+    profiler = profiler_on(tmp_path)
+    with profiler.profile("request-1") as profiled:
+        sorted(range(1000), key=lambda number: -number)
+    assert profiled
+    path = profiler.profile_path("request-1")
+    assert path is not None
+    assert pstats.Stats(path).total_calls > 0
+    assert [profile.id for profile in profiler.profiles()] == ["request-1"]
+
+
+def test_only_one_request_is_profiled_at_once(tmp_path):
+    profiler = profiler_on(tmp_path)
+    with profiler.profile("first"):
+        with profiler.profile("second") as profiled:
+            assert not profiled
+    assert profiler.profile_path("second") is None
+
+
+def test_old_profiles_are_removed(tmp_path):
+    profiler = profiler_on(tmp_path, profiles_kept=2)
+    for request in range(4):
+        with profiler.profile(f"request-{request}"):
+            pass
+    assert len(profiler.profiles()) == 2
+
+
+def test_unsafe_ids_are_not_used_as_paths(tmp_path):
+    profiler = profiler_on(tmp_path)
+    assert profiler.profile_id("../../etc/passwd") != "../../etc/passwd"
+    assert profiler.profile_id("abc-123") == "abc-123"
+    assert profiler.profile_path("../secret") is None
@@ -0,0 +1,27 @@
+import pytest
+from pydantic import ValidationError
+
+from src.backend.schemas.recommend import (
+    BatchRecommendPetition,
+    UserTracks,
+    MAX_BATCH_USERS,
+    MAX_TRACKS_PER_USER,
+)
+
+
+def test_batch_petition_has_a_maximum_number_of_users():
+    users = [UserTracks(trackIds=["track"])] * MAX_BATCH_USERS
+    assert len(BatchRecommendPetition(users=users).users) == MAX_BATCH_USERS
+    with pytest.raises(ValidationError):
+        BatchRecommendPetition(users=users + [UserTracks(trackIds=["track"])])
+
+
+def test_user_tracks_have_a_maximum_number_of_tracks():
+    with pytest.raises(ValidationError):
+        UserTracks(trackIds=["track"] * (MAX_TRACKS_PER_USER + 1))
+
+
+@pytest.mark.parametrize("alpha", [-0.1, 1.1])
+def test_alpha_is_between_zero_and_one(alpha):
+    with pytest.raises(ValidationError):
+        UserTracks(trackIds=["track"], alpha=alpha)
@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+import uuid
+
+import numpy as np
+import pytest
+
+from src.backend.services.shared_catalog import SharedCatalog
+
+ATTACH = """
+import json, sys
+from src.backend.services.shared_catalog import SharedCatalog
+catalog = SharedCatalog.attach(sys.argv[1])
+print(json.dumps({
+    "tracks": len(catalog.dataset),
+    "fingerprint": catalog.model.fingerprint,
+    "first_track": catalog.dataset.track_id(0),
+}))
+"""
+
+
+@pytest.fixture
+def published(service):
+    service.load()
+    model = service.build_model()
+    shared_catalog = SharedCatalog.publish(
+        f"test_{uuid.uuid4().hex[:16]}", service.data, model, service.layout
+    )
+    yield service, shared_catalog
+    shared_catalog.unlink()
+
+
+def test_attached_catalog_is_a_read_only_view_of_the_published_one(published):
+    service, shared_catalog = published
+    attached = SharedCatalog.attach(shared_catalog.name)
+    assert attached.dataset.categories == service.data.categories
+    assert np.array_equal(attached.dataset.track_ids, service.data.track_ids)
+    assert np.array_equal(attached.dataset.numerical, service.data.numerical)
+    assert np.array_equal(attached.model.labels, service.clusters)
+    assert attached.model.fingerprint == shared_catalog.model.fingerprint
+    assert np.array_equal(attached.layout.numerical, service.layout.numerical)
+    assert attached.layout.fingerprint == service.layout.fingerprint
+    assert not attached.dataset.numerical.flags.writeable
+    with pytest.raises(ValueError):
+        attached.model.labels[0] = 1
+
+
+def test_service_attached_to_the_catalog_recommends_without_loading(
+    published, new_service
+):
+    service, shared_catalog = published
+    user = ["track000001", "track000002", "track000003"]
+    expected = service.antirecommend(user, k=5)
+    expected_many = service.antirecommend_many([user, ["track000100"]], [0.6, 0.2])
+
+    attached = new_service(
+        data_path="nothing_here", num_clusters=5, shared_catalog=shared_catalog.name
+    )
+    assert attached.filter_existing_tracks(["track000001", "unknown"]) == [
+        "track000001"
+    ]
+    assert attached.model_fitted is False
+    assert "load_dataset" not in attached.load_durations
+    assert attached.antirecommend(user, k=5) == expected
+    assert (
+        attached.antirecommend_many([user, ["track000100"]], [0.6, 0.2])
+        == expected_many
+    )
+
+
+def test_other_processes_attach_to_the_catalog(published):
+    _, shared_catalog = published
+    backend_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", ATTACH, shared_catalog.name],
+        cwd=backend_directory,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert json.loads(result.stdout) == {
+        "tracks": 500,
+        "fingerprint": shared_catalog.model.fingerprint,
+        "first_track": "track000000",
+    }
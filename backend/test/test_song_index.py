@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.backend.services.antirecommender import AntiRecommenderService
+from src.backend.services.dataset import TracksDataset
+from src.backend.services.song_index import (
+    SongIndex,
+    SongIndexConfig,
+    song_index_directory,
+)
+from test.mothers.tracks import get_tracks
+
+USERS = [
+    ["track000001", "track000002", "track000003"],
+    ["track000100"],
+    ["track000200", "track000201", "track000300", "unknown"],
+]
+
+
+@pytest.fixture
+def loaded_service(tmp_path, new_service):
+    """
+    Loads an antirecommender over 2000 tracks, with this song index config
+    """
+    data_path = str(tmp_path / "tracks")
+    TracksDataset.from_dataframe(get_tracks(rows=2000)).save(data_path)
+
+    def load(
+        song_index: SongIndexConfig | None, model_path: str | None = None
+    ) -> AntiRecommenderService:
+        service = new_service(
+            data_path=data_path,
+            num_clusters=5,
+            model_path=model_path,
+            song_index=song_index,
+        )
+        service.load()
+        return service
+
+    return load
+
+
+def _recommendations(service: AntiRecommenderService):
+    return [
+        service.antirecommend(user, alpha, k)
+        for user in USERS
+        for alpha in (0.0, 0.3, 0.6, 1.0)
+        for k in (1, 5, 40)
+    ]
+
+
+def test_exact_index_recommends_the_same_as_scoring_every_song(loaded_service):
+    expected = _recommendations(loaded_service(None))
+    expected_many = loaded_service(None).antirecommend_many(USERS, [0.6, 0.2, 1.0])
+    service = loaded_service(SongIndexConfig(mode="exact", candidates=2))
+    assert "load_song_index" in service.load_durations
+    assert _recommendations(service) == expected
+    assert service.antirecommend_many(USERS, [0.6, 0.2, 1.0]) == expected_many
+
+
+def test_approximate_index_recommends_k_songs_of_the_furthest_cluster(loaded_service):
+    expected = loaded_service(None).antirecommend(USERS[0], k=5)
+    service = loaded_service(SongIndexConfig(mode="approximate", candidates=10))
+    tracks = service.antirecommend(USERS[0], k=5)
+    assert len(tracks) == 5
+    scores = [track.score for track in tracks]
+    assert scores == sorted(scores)
+    assert scores[0] >= expected[0].score
+    furthest_cluster = service._find_furthest_cluster(
+        service._get_cluster_of_tracks(USERS[0])
+    )
+    positions = service.catalog.positions([track.track_id for track in tracks])
+    assert set(service.clusters[positions]) == {furthest_cluster}
+
+
+def test_song_index_config_from_env():
+    assert SongIndexConfig.from_env({}) is None
+    assert SongIndexConfig.from_env({"SONG_INDEX": "exact"}) == SongIndexConfig()
+    assert SongIndexConfig.from_env(
+        {"SONG_INDEX": "approximate", "SONG_INDEX_CANDIDATES": "16"}
+    ) == SongIndexConfig(mode="approximate", candidates=16)
+    with pytest.raises(ValueError):
+        SongIndexConfig.from_env({"SONG_INDEX": "annoy"})
+
+
+def test_song_index_is_saved_next_to_the_layout(loaded_service, tmp_path, monkeypatch):
+    model_path = str(tmp_path / "clusters.npz")
+    config = SongIndexConfig(mode="exact", candidates=2)
+    expected = _recommendations(loaded_service(config, model_path))
+    assert os.path.isdir(song_index_directory(model_path))
+
+    def build(*args, **kwargs):
+        raise AssertionError("The saved index should be opened")
+
+    monkeypatch.setattr(SongIndex, "build", build)
+    opened = loaded_service(config, model_path)
+    assert isinstance(opened._song_index.positions, np.memmap)
+    assert _recommendations(opened) == expected
@@ -1,20 +1,27 @@
+import threading
+import time
 from unittest.mock import MagicMock, Mock
 
 from src.backend.spotify.result import Result, Error
 from src.backend.spotify.app import SpotifyApp
-from src.backend.spotify.domain import UserRepository, TokenRepository
+from src.backend.spotify.domain import QueryableUserRepository, TokenRepository
 
 from src.backend.spotify.domain.token_repository import Token
-from src.backend.spotify.domain.user_repository import Mail
+from src.backend.spotify.domain.user_repository import Mail, User
+from src.backend.spotify.infra.repository_implementation import (
+    RepositoryImplementation,
+)
 from test.mothers.token import get_token_that_expires_on
 from test.mothers.user import get_user
 
 
 def test_if_user_is_already_on_db_return_it():
     mail = "added@test.com"
-    user_repo: UserRepository = MagicMock()
+    user_repo: QueryableUserRepository = MagicMock()
     already_existing_user = get_user(mail)
-    user_repo.users = MagicMock(return_value=(Result.success([already_existing_user])))
+    user_repo.find_by_mail = MagicMock(
+        return_value=(Result.success(already_existing_user))
+    )
     token_repository = MagicMock()
     app = SpotifyApp(users=user_repo, tokens=token_repository)
     user = app.add_user(mail)
@@ -22,9 +29,36 @@ def test_if_user_is_already_on_db_return_it():
     assert user.success_value == already_existing_user
 
 
+def test_adding_a_saved_user_again_returns_it_without_whitelisting_it_twice(
+    tmp_path,
+):
+    initial_token = '{"access_token":"test","token_type":"test","expires_in":3600,"refresh_token":"test","scope":"test","id_token":"test"}'
+    repository = RepositoryImplementation(
+        app_id="app",
+        user_id="user",
+        initial_token=initial_token,
+        sqlite_path=str(tmp_path / "spotify.db"),
+    )
+    token = get_token_that_expires_on(time.time() + 3600)
+    repository.spotify_token.refresh_token = Mock(return_value=Result.success(token))
+    repository.spotify_user = MagicMock()
+    repository.spotify_user.add_user = Mock(
+        side_effect=lambda mail, _: Result.success(
+            User(mail=mail, creation_date=time.time())
+        )
+    )
+    app = SpotifyApp(users=repository, tokens=repository)
+    first = app.add_user("twice@test.com")
+    second = app.add_user("twice@test.com")
+    repository.close()
+    assert not first.is_error and not second.is_error
+    assert second.success_value == first.success_value
+    repository.spotify_user.add_user.assert_called_once()
+
+
 def test_if_cant_fetch_users_it_fails():
-    user_repo: UserRepository = MagicMock()
-    user_repo.users = MagicMock(return_value=(Result.failure(Error(""))))
+    user_repo: QueryableUserRepository = MagicMock()
+    user_repo.find_by_mail = MagicMock(return_value=(Result.failure(Error(""))))
     token_repository = MagicMock()
     app = SpotifyApp(users=user_repo, tokens=token_repository)
     user = app.add_user("test@test.com")
@@ -33,11 +67,11 @@ def test_if_cant_fetch_users_it_fails():
 
 def test_if_user_is_not_in_database_create_it():
     current_time = 100_000
-    already_existing_user = get_user("added@test.com")
     new_user = get_user("nonadded@test.com", creation_date=current_time)
 
-    user_repo: UserRepository = MagicMock()
-    user_repo.users = MagicMock(return_value=(Result.success([already_existing_user])))
+    user_repo: QueryableUserRepository = MagicMock()
+    user_repo.find_by_mail = MagicMock(return_value=(Result.success(None)))
+    user_repo.count = MagicMock(return_value=(Result.success(1)))
     user_repo.add_user = MagicMock(return_value=(Result.success(new_user)))
 
     def time():
@@ -55,10 +89,10 @@ def test_if_user_is_not_in_database_create_it():
 
 def test_if_repository_add_fails_we_dont_add_user():
     current_time = 100_000
-    already_existing_user = get_user("added@test.com")
 
-    user_repo: UserRepository = MagicMock()
-    user_repo.users = MagicMock(return_value=(Result.success([already_existing_user])))
+    user_repo: QueryableUserRepository = MagicMock()
+    user_repo.find_by_mail = MagicMock(return_value=(Result.success(None)))
+    user_repo.count = MagicMock(return_value=(Result.success(1)))
     user_repo.add_user = MagicMock(
         return_value=(Result.failure(Error("error adding user")))
     )
@@ -77,11 +111,11 @@ def test_if_repository_add_fails_we_dont_add_user():
 
 def test_if_token_is_invalidated_and_we_refresh_it_and_get_error_we_return_error():
     current_time = 100_000
-    already_existing_user = get_user("added@test.com")
     new_user = get_user("nonadded@test.com", creation_date=current_time)
 
-    user_repo: UserRepository = MagicMock()
-    user_repo.users = MagicMock(return_value=(Result.success([already_existing_user])))
+    user_repo: QueryableUserRepository = MagicMock()
+    user_repo.find_by_mail = MagicMock(return_value=(Result.success(None)))
+    user_repo.count = MagicMock(return_value=(Result.success(1)))
     user_repo.add_user = MagicMock(return_value=(Result.success(new_user)))
 
     def time() -> float:
@@ -101,11 +135,11 @@ def test_if_token_is_invalidated_and_we_refresh_it_and_get_error_we_return_error
 
 def test_if_token_is_invalidated_refresh_it_and_we_get_correct_we_add_user():
     current_time = 100_000
-    already_existing_user = get_user("added@test.com")
     new_user = get_user("nonadded@test.com", creation_date=current_time)
 
-    user_repo: UserRepository = MagicMock()
-    user_repo.users = MagicMock(return_value=(Result.success([already_existing_user])))
+    user_repo: QueryableUserRepository = MagicMock()
+    user_repo.find_by_mail = MagicMock(return_value=(Result.success(None)))
+    user_repo.count = MagicMock(return_value=(Result.success(1)))
     user_repo.add_user = MagicMock(return_value=(Result.success(new_user)))
 
     def time() -> float:
@@ -124,7 +158,7 @@ def test_if_token_is_invalidated_refresh_it_and_we_get_correct_we_add_user():
 
 
 def test_if_mail_is_invalid_return_error():
-    user_repo: UserRepository = MagicMock()
+    user_repo: QueryableUserRepository = MagicMock()
     token_repository: TokenRepository = MagicMock()
     app = SpotifyApp(users=user_repo, tokens=token_repository)
     user = app.add_user("notamail")
@@ -138,12 +172,11 @@ def test_if_user_threshold_is_bigger_then_delete_user():
         return current_time
 
     token = get_token_that_expires_on(current_time + 1000)
-    user_repo: UserRepository = MagicMock()
+    user_repo: QueryableUserRepository = MagicMock()
     token_repository: TokenRepository = MagicMock()
     token_repository.get_token = MagicMock(return_value=(Result.success(token)))
 
     user_1 = get_user("added@test.com", creation_date=current_time - 100)
-    user_2 = get_user("added2@test.com", creation_date=current_time - 50)
     created_user = get_user("added3@test.com", creation_date=current_time)
 
     def side_effect(mail: Mail, _: Token) -> Result:
@@ -152,7 +185,9 @@ def test_if_user_threshold_is_bigger_then_delete_user():
         ), "The user you're deleting isn't the correct"
         return Result.success(user_1)
 
-    user_repo.users = MagicMock(return_value=(Result.success([user_1, user_2])))
+    user_repo.find_by_mail = MagicMock(return_value=(Result.success(None)))
+    user_repo.count = MagicMock(return_value=(Result.success(2)))
+    user_repo.oldest_user = MagicMock(return_value=(Result.success(user_1)))
     user_repo.delete_user = Mock(side_effect=side_effect)
     user_repo.add_user = MagicMock(return_value=(Result.success(created_user)))
 
@@ -162,3 +197,90 @@ def test_if_user_threshold_is_bigger_then_delete_user():
     user = app.add_user(created_user.mail.address)
     assert not user.is_error, "We shouldn't have an user error"
     assert user.success_value == created_user
+
+
+def test_if_cant_count_users_it_fails():
+    user_repo: QueryableUserRepository = MagicMock()
+    user_repo.find_by_mail = MagicMock(return_value=(Result.success(None)))
+    user_repo.count = MagicMock(return_value=(Result.failure(Error(""))))
+    app = SpotifyApp(users=user_repo, tokens=MagicMock())
+    user = app.add_user("test@test.com")
+    assert user.is_error, "We shouldn't add a user if we can't count the users"
+    user_repo.add_user.assert_not_called()
+
+
+def test_token_is_kept_in_memory():
+    current_time = 1000
+    token_repository: TokenRepository = MagicMock()
+    token = get_token_that_expires_on(current_time + 1000)
+    token_repository.get_token = MagicMock(return_value=(Result.success(token)))
+    app = SpotifyApp(
+        users=MagicMock(), tokens=token_repository, time_now=lambda: current_time
+    )
+    assert app.get_token().success_value == token
+    assert app.get_token().success_value == token
+    token_repository.get_token.assert_called_once()
+
+
+class _CountingLock:
+    """Lock that counts how many callers tried to acquire it."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._condition = threading.Condition()
+        self.attempts = 0
+
+    def __enter__(self) -> bool:
+        with self._condition:
+            self.attempts += 1
+            self._condition.notify_all()
+        return self._lock.acquire()
+
+    def __exit__(self, *args: object) -> None:
+        self._lock.release()
+
+    def wait_for_attempts(self, attempts: int) -> bool:
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self.attempts >= attempts, timeout=5
+            )
+
+
+def test_concurrent_callers_wait_for_a_single_refresh():
+    current_time = 1000
+    expired_token = get_token_that_expires_on(current_time - 1)
+    new_token = get_token_that_expires_on(current_time + 1000)
+    callers = 8
+    refresh_started = threading.Event()
+    finish_refresh = threading.Event()
+
+    def slow_refresh() -> Result:
+        refresh_started.set()
+        finish_refresh.wait(timeout=5)
+        return Result.success(new_token)
+
+    token_repository: TokenRepository = MagicMock()
+    token_repository.get_token = MagicMock(return_value=Result.success(expired_token))
+    token_repository.refresh_token = Mock(side_effect=slow_refresh)
+    app = SpotifyApp(
+        users=MagicMock(), tokens=token_repository, time_now=lambda: current_time
+    )
+    lock = _CountingLock()
+    app._token_lock = lock  # type: ignore
+    results = []
+
+    def get_token() -> None:
+        results.append(app.get_token())
+
+    threads = [threading.Thread(target=get_token) for _ in range(callers)]
+    threads[0].start()
+    assert refresh_started.wait(timeout=5), "The refresh should have started"
+    for thread in threads[1:]:
+        thread.start()
+    # Every caller reached the lock while the refresh holds it
+    assert lock.wait_for_attempts(callers)
+    finish_refresh.set()
+    for thread in threads:
+        thread.join()
+    token_repository.refresh_token.assert_called_once()
+    assert [result.success_value for result in results] == [new_token] * callers
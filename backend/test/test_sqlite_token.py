@@ -1,10 +1,18 @@
 import json
 import os
+import time
+from typing import List
+from unittest.mock import Mock
 
 import pytest
 
 from src.backend.spotify.domain import Token
+from src.backend.spotify.infra.repository_implementation import (
+    RepositoryImplementation,
+)
 from src.backend.spotify.infra.sqlite.token import SqliteTokenRepository
+from src.backend.spotify.result import Result
+from test.mothers.token import get_token_that_expires_on
 
 sqlite_path = "./token-test.db"
 
@@ -12,7 +20,10 @@ sqlite_path = "./token-test.db"
 @pytest.fixture(autouse=True)
 def run_around_tests():
     yield
-    os.remove(sqlite_path)
+    # With WAL, sqlite also has the -wal and -shm files while connections are open
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(f"{sqlite_path}{suffix}"):
+            os.remove(f"{sqlite_path}{suffix}")
 
 
 def test_if_not_token_found_throws_error():
@@ -59,3 +70,64 @@ def test_updating_a_token():
     assert new_token == result_adding.success_value
     assert not result_getting.is_error, "Should not be an error"
     assert new_token == result_getting.success_value
+
+
+def _workers_sharing_the_database(count: int) -> List[RepositoryImplementation]:
+    initial_token = '{"access_token":"test","token_type":"test","expires_in":3600,"refresh_token":"test","scope":"test","id_token":"test"}'
+    return [
+        RepositoryImplementation(
+            app_id="app",
+            user_id="user",
+            initial_token=initial_token,
+            sqlite_path=sqlite_path,
+        )
+        for _ in range(count)
+    ]
+
+
+def test_workers_sharing_the_database_refresh_the_token_once():
+    first, second = _workers_sharing_the_database(2)
+    new_token = get_token_that_expires_on(time.time() + 3600)
+    first.spotify_token.refresh_token = Mock(return_value=Result.success(new_token))
+    second.spotify_token.refresh_token = Mock(return_value=Result.success(new_token))
+    assert first.refresh_token().success_value == new_token
+    assert second.refresh_token().success_value == new_token
+    first.spotify_token.refresh_token.assert_called_once()
+    second.spotify_token.refresh_token.assert_not_called()
+    # Its next refresh uses the refresh token that the first worker got
+    assert second.spotify_token.token == new_token
+
+
+def test_worker_waits_for_the_one_refreshing_the_token():
+    first, second = _workers_sharing_the_database(2)
+    new_token = get_token_that_expires_on(time.time() + 3600)
+    assert first.sqlite_token.acquire_refresh_lease(
+        first.owner, time.time(), 60
+    ).success_value
+    assert not second.sqlite_token.acquire_refresh_lease(
+        second.owner, time.time(), 60
+    ).success_value
+
+    def first_finishes_refreshing(seconds: float) -> None:
+        first.sqlite_token.add_token(new_token)
+        first.sqlite_token.release_refresh_lease(first.owner)
+
+    second.sleep = first_finishes_refreshing
+    second.spotify_token.refresh_token = Mock()
+    assert second.refresh_token().success_value == new_token
+    second.spotify_token.refresh_token.assert_not_called()
+
+
+def test_expired_refresh_lease_is_taken_over():
+    first, second = _workers_sharing_the_database(2)
+    new_token = get_token_that_expires_on(time.time() + 3600)
+    # The first worker died while refreshing
+    assert first.sqlite_token.acquire_refresh_lease(
+        first.owner, time.time() - 120, 60
+    ).success_value
+    second.spotify_token.refresh_token = Mock(return_value=Result.success(new_token))
+    assert second.refresh_token().success_value == new_token
+    second.spotify_token.refresh_token.assert_called_once()
+    assert first.sqlite_token.acquire_refresh_lease(
+        first.owner, time.time(), 60
+    ).success_value
@@ -1,7 +1,9 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
+from src.backend.spotify.domain import Mail
 from src.backend.spotify.infra.sqlite.users import SqliteUsersRepository
 from test.mothers.user import get_user
 
@@ -11,7 +13,10 @@ sqlite_path = "./users-test.db"
 @pytest.fixture(autouse=True)
 def run_around_tests():
     yield
-    os.remove(sqlite_path)
+    # With WAL, sqlite also has the -wal and -shm files while connections are open
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(f"{sqlite_path}{suffix}"):
+            os.remove(f"{sqlite_path}{suffix}")
 
 
 def test_empty_db_returns_empty_users():
@@ -31,3 +36,54 @@ def test_adding_a_user():
     assert not users_result.is_error
     assert len(users_result.success_value) == 1
     assert users_result.success_value[0] == user
+
+
+def test_connections_are_reused_and_use_wal():
+    user_repo = SqliteUsersRepository(sqlite_path=sqlite_path)
+    assert user_repo.connections is not None
+    connection = user_repo.connections.connection()
+    user_repo.add_user(get_user(mail="test@test.com"))
+    assert user_repo.connections.connection() is connection
+    assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    # NORMAL
+    assert connection.execute("PRAGMA synchronous").fetchone() == (1,)
+    user_repo.connections.close()
+
+
+def test_users_are_added_from_many_threads():
+    user_repo = SqliteUsersRepository(sqlite_path=sqlite_path)
+    users = [get_user(mail=f"test{number}@test.com") for number in range(20)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(user_repo.add_user, users))
+    assert not any(result.is_error for result in results)
+    assert len(user_repo.users().success_value) == len(users)
+    assert user_repo.connections is not None
+    user_repo.connections.close()
+
+
+def test_find_count_and_oldest_user():
+    user_repo = SqliteUsersRepository(sqlite_path=sqlite_path)
+    assert user_repo.count().success_value == 0
+    assert user_repo.oldest_user().success_value is None
+    newest = get_user(mail="newest@test.com", creation_date=3000)
+    oldest = get_user(mail="oldest@test.com", creation_date=1000)
+    for user in (newest, oldest):
+        user_repo.add_user(user)
+    assert user_repo.count().success_value == 2
+    assert user_repo.oldest_user().success_value == oldest
+    assert user_repo.find_by_mail(newest.mail).success_value == newest
+    assert user_repo.find_by_mail(Mail(address="nobody@test.com")).success_value is None
+
+
+def test_oldest_user_uses_the_creation_date_index():
+    user_repo = SqliteUsersRepository(sqlite_path=sqlite_path)
+    assert user_repo.connections is not None
+    plan = (
+        user_repo.connections.connection()
+        .execute(
+            "EXPLAIN QUERY PLAN SELECT mail, creation_date FROM users ORDER BY creation_date LIMIT 1"
+        )
+        .fetchall()
+    )
+    assert "users_creation_date" in str(plan)
+    user_repo.connections.close()
@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+
+# Importing main used to take ~2.6 s (pandas, sklearn and scipy), now it's ~0.7 s (mostly fastapi)
+IMPORT_BUDGET_SECONDS = 2.0
+HEAVY_MODULES = ["pandas", "sklearn", "scipy"]
+
+IMPORT_MAIN = f"""
+import json, sys, time
+start = time.perf_counter()
+import src.backend.main
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "heavy_modules": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def test_importing_main_is_fast_and_has_no_side_effects(tmp_path):
+    sqlite_path = tmp_path / "db.sqlite"
+    environment = {
+        name: value
+        for name, value in os.environ.items()
+        if name not in ("APP_ID", "USER_ID", "INITIAL_TOKEN")
+    }
+    environment["SQLITE_PATH"] = str(sqlite_path)
+    backend_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_MAIN],
+        cwd=backend_directory,
+        env=environment,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = json.loads(result.stdout.splitlines()[-1])
+    assert report["heavy_modules"] == []
+    assert report["seconds"] < IMPORT_BUDGET_SECONDS
+    assert not sqlite_path.exists()
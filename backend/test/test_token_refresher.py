@@ -0,0 +1,77 @@
+import asyncio
+from typing import List
+from unittest.mock import MagicMock, Mock
+
+import pytest
+
+from src.backend.spotify.app import SpotifyApp
+from src.backend.spotify.domain import TokenRepository
+from src.backend.spotify.result import Result, Error
+from src.backend.spotify.token_refresher import TokenRefresher
+from test.mothers.token import get_token_that_expires_on
+
+
+class StopRefreshing(Exception):
+    pass
+
+
+def sleep_until(calls: int, waits: List[float]):
+    async def sleep(seconds: float) -> None:
+        waits.append(seconds)
+        if len(waits) == calls:
+            raise StopRefreshing()
+
+    return sleep
+
+
+def test_token_is_refreshed_margin_seconds_before_it_expires():
+    current_time = 1000
+    token_repository: TokenRepository = MagicMock()
+    token_repository.get_token = MagicMock(
+        return_value=Result.success(get_token_that_expires_on(current_time + 3600))
+    )
+    token_repository.refresh_token = MagicMock(
+        return_value=Result.success(get_token_that_expires_on(current_time + 7200))
+    )
+    app = SpotifyApp(
+        users=MagicMock(), tokens=token_repository, time_now=lambda: current_time
+    )
+    waits: List[float] = []
+    refresher = TokenRefresher(app=app, margin=600, sleep=sleep_until(2, waits))
+    with pytest.raises(StopRefreshing):
+        asyncio.run(refresher.run())
+    assert waits == [3600 - 600, 7200 - 600]
+    token_repository.refresh_token.assert_called_once()
+    assert refresher.state.status == "ok"
+    assert refresher.state.expires_at == current_time + 7200
+    assert app.get_token().success_value.expires_at == current_time + 7200
+
+
+def test_failed_refreshes_are_retried_with_backoff():
+    current_time = 1000
+    new_token = get_token_that_expires_on(current_time + 3600)
+    token_repository: TokenRepository = MagicMock()
+    token_repository.get_token = MagicMock(
+        return_value=Result.success(get_token_that_expires_on(current_time - 1))
+    )
+    token_repository.refresh_token = Mock(
+        side_effect=[Result.failure(Error("spotify is down"))] * 3
+        + [Result.success(new_token)]
+    )
+    app = SpotifyApp(
+        users=MagicMock(), tokens=token_repository, time_now=lambda: current_time
+    )
+    waits: List[float] = []
+    refresher = TokenRefresher(
+        app=app,
+        margin=600,
+        retry_backoff=1,
+        retry_backoff_max=3,
+        sleep=sleep_until(3, waits),
+    )
+    with pytest.raises(StopRefreshing):
+        asyncio.run(refresher.run())
+    assert waits == [1, 2, 3]
+    assert refresher.state.status == "retrying"
+    assert refresher.state.consecutive_failures == 3
+    assert refresher.state.last_error == "spotify is down"
@@ -0,0 +1,24 @@
+from src.backend.services.catalog import TrackCatalog
+
+
+def test_membership_of_tracks():
+    catalog = TrackCatalog.from_track_ids(["a", "b", "c"])
+    assert "a" in catalog
+    assert "d" not in catalog
+    assert len(catalog) == 3
+
+
+def test_filter_existing_keeps_order_and_repetitions():
+    catalog = TrackCatalog.from_track_ids(["a", "b", "c"])
+    assert catalog.filter_existing(["c", "x", "a", "c"]) == ["c", "a", "c"]
+
+
+def test_positions_returns_all_rows_of_repeated_tracks():
+    catalog = TrackCatalog.from_track_ids(["a", "b", "a", "c", "a"])
+    assert catalog.positions(["a"]).tolist() == [0, 2, 4]
+    assert catalog.positions(["c", "b", "c"]).tolist() == [1, 3]
+
+
+def test_positions_of_unknown_tracks_is_empty():
+    catalog = TrackCatalog.from_track_ids(["a", "b"])
+    assert catalog.positions(["x", "y"]).tolist() == []
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+
+from src.backend.services.dataset import (
+    NUMERICAL_FILE,
+    TracksDataset,
+    append_rows,
+    categorical_codes_dtype,
+)
+from test.mothers.tracks import get_tracks
+
+
+def test_categorical_values_are_encoded_with_sorted_codes():
+    tracks = get_tracks()
+    dataset = TracksDataset.from_dataframe(tracks)
+    genres = dataset.categories["track_genre"]
+    assert genres == sorted(genres)
+    genre_column = dataset.categorical[:, -1]
+    decoded = [genres[code] for code in genre_column]
+    assert decoded == tracks["track_genre"].tolist()
+
+
+def test_saved_dataset_is_opened_memory_mapped(tmp_path):
+    tracks = get_tracks()
+    directory = str(tmp_path / "tracks")
+    TracksDataset.from_dataframe(tracks).save(directory)
+    dataset = TracksDataset.open(directory)
+    assert isinstance(dataset.numerical, np.memmap)
+    assert dataset.numerical.dtype == np.float32
+    assert len(dataset) == len(tracks)
+    assert list(dataset.iter_track_ids()) == tracks["track_id"].tolist()
+    assert dataset.track_id(3) == tracks["track_id"][3]
+
+
+def test_load_parses_csv_files(tmp_path):
+    tracks = get_tracks()
+    path = str(tmp_path / "tracks.csv")
+    tracks.to_csv(path, index=False)
+    dataset = TracksDataset.load(path)
+    assert list(dataset.iter_track_ids()) == tracks["track_id"].tolist()
+    assert dataset.categories["explicit"] == [False, True]
+
+
+def test_categorical_codes_use_the_smallest_integer_type():
+    assert TracksDataset.from_dataframe(get_tracks()).categorical.dtype == np.int8
+    assert categorical_codes_dtype(128) == np.int8
+    assert categorical_codes_dtype(129) == np.int16
+    assert categorical_codes_dtype(70_000) == np.int32
+
+
+def test_missing_dataset_is_converted_from_the_csv(tmp_path):
+    tracks = get_tracks()
+    csv_path = str(tmp_path / "tracks.csv")
+    directory = str(tmp_path / "tracks")
+    tracks.to_csv(csv_path, index=False)
+    dataset = TracksDataset.load(directory, csv_path=csv_path)
+    assert isinstance(dataset.numerical, np.memmap)
+    assert list(dataset.iter_track_ids()) == tracks["track_id"].tolist()
+    assert list(TracksDataset.open(directory).iter_track_ids()) == list(
+        dataset.iter_track_ids()
+    )
+
+
+def test_appended_rows_are_written_to_the_same_files(tmp_path):
+    directory = str(tmp_path / "tracks")
+    TracksDataset.from_dataframe(get_tracks(rows=20)).save(directory)
+    dataset = TracksDataset.open(directory)
+    numerical_inode = os.stat(os.path.join(directory, NUMERICAL_FILE)).st_ino
+    new_tracks = TracksDataset.from_dataframe(get_tracks(rows=5, seed=1))
+    appended = dataset.append(directory, new_tracks)
+    assert os.stat(os.path.join(directory, NUMERICAL_FILE)).st_ino == numerical_inode
+    assert len(appended) == 25
+    assert np.array_equal(appended.numerical[:20], dataset.numerical)
+    assert np.array_equal(appended.numerical[20:], new_tracks.numerical)
+    assert np.array_equal(appended.categorical[20:], new_tracks.categorical)
+    # The rows of an append that didn't get to save the metadata aren't opened
+    append_rows(os.path.join(directory, NUMERICAL_FILE), 25, new_tracks.numerical[:2])
+    assert len(TracksDataset.open(directory).numerical) == 25
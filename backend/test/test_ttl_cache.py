@@ -0,0 +1,35 @@
+from src.backend.services.cache import TTLCache
+
+
+def test_saved_values_are_returned_and_counted():
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=10)
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_value_is_evicted():
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_values_expire_after_ttl():
+    current_time = 100.0
+
+    def time() -> float:
+        return current_time
+
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=10, time_now=time)
+    cache.put("a", 1)
+    current_time = 109.0
+    assert cache.get("a") == 1
+    current_time = 110.0
+    assert cache.get("a") is None
+    assert len(cache) == 0
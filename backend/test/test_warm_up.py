@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.backend.services.warm_up import WarmUp
+
+
+@pytest.fixture
+def service(tracks_csv, new_service, tmp_path):
+    return new_service(
+        data_path=tracks_csv, num_clusters=5, model_path=str(tmp_path / "clusters.npz")
+    )
+
+
+def test_warm_up_is_ready_with_the_durations(service):
+    warm_up = WarmUp(anti_recommender=service)
+    assert not warm_up.ready
+    asyncio.run(warm_up.run())
+    assert warm_up.ready
+    assert warm_up.state.model_fitted
+    assert set(warm_up.state.durations) == {
+        "load",
+        "load_dataset",
+        "load_catalog",
+        "load_model",
+        "load_layout",
+        "first_recommendation",
+    }
+
+
+def test_warm_up_fails_without_dataset(new_service, tmp_path):
+    warm_up = WarmUp(anti_recommender=new_service(data_path=str(tmp_path / "nothing")))
+    asyncio.run(warm_up.run())
+    assert warm_up.state.status == "failed"
+    assert warm_up.state.error is not None
+
+
+def test_concurrent_loads_only_load_once(service, monkeypatch):
+    initializations = []
+    initialize_clusters = service._initialize_clusters
+
+    def count_initializations():
+        initializations.append(threading.get_ident())
+        initialize_clusters()
+
+    monkeypatch.setattr(service, "_initialize_clusters", count_initializations)
+    threads = [threading.Thread(target=service.load) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(initializations) == 1
@@ -0,0 +1,102 @@
+import asyncio
+from typing import List
+from unittest.mock import MagicMock, Mock
+
+import pytest
+
+from src.backend.spotify.app import SpotifyApp, CreatingUserError, MailError
+from src.backend.spotify.infra.sqlite.jobs import SqliteWhitelistJobRepository
+from src.backend.spotify.result import Result
+from src.backend.spotify.whitelist_worker import WhitelistWorker
+from test.mothers.user import get_user
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    repository = SqliteWhitelistJobRepository(sqlite_path=str(tmp_path / "jobs.db"))
+    yield repository
+    assert repository.connections is not None
+    repository.connections.close()
+
+
+def worker_with(jobs, add_user: Mock, waits: List[float]) -> WhitelistWorker:
+    app: SpotifyApp = MagicMock()
+    app.add_user = add_user
+
+    async def sleep(seconds: float) -> None:
+        waits.append(seconds)
+
+    return WhitelistWorker(
+        app=app, jobs=jobs, max_attempts=3, retry_backoff=1, sleep=sleep
+    )
+
+
+def test_jobs_are_done_in_order(jobs):
+    add_user = Mock(side_effect=lambda mail: Result.success(get_user(mail)))
+    worker = worker_with(jobs, add_user, [])
+    first = worker.enqueue("first@test.com").success_value
+    second = worker.enqueue("second@test.com").success_value
+    assert asyncio.run(worker.run_next_job())
+    assert asyncio.run(worker.run_next_job())
+    assert not asyncio.run(worker.run_next_job())
+    assert [call.args[0] for call in add_user.call_args_list] == [
+        "first@test.com",
+        "second@test.com",
+    ]
+    for job in (first, second):
+        assert jobs.job(job.id).success_value.status == "done"
+
+
+def test_failed_job_is_retried_with_backoff_until_max_attempts(jobs):
+    add_user = Mock(return_value=Result.failure(CreatingUserError("spotify is down")))
+    waits: List[float] = []
+    worker = worker_with(jobs, add_user, waits)
+    job = worker.enqueue("test@test.com").success_value
+    asyncio.run(worker.run_next_job())
+    saved_job = jobs.job(job.id).success_value
+    assert saved_job.status == "failed"
+    assert saved_job.attempts == 3
+    assert saved_job.error == "spotify is down"
+    assert waits == [1, 2]
+
+
+def test_invalid_mails_are_not_enqueued(jobs):
+    worker = worker_with(jobs, Mock(), [])
+    result = worker.enqueue("notamail")
+    assert result.is_error
+    assert isinstance(result.error_value, MailError)
+    assert jobs.claim_next_job("worker").success_value is None
+
+
+def test_jobs_of_a_dead_worker_are_done_again_when_its_claim_expires(jobs):
+    now = 1000.0
+    jobs.time_now = lambda: now
+    job = jobs.enqueue("test@test.com").success_value
+    claimed = jobs.claim_next_job("dead").success_value
+    jobs.update(claimed.model_copy(update={"attempts": 1}), "dead")
+    add_user = Mock(side_effect=lambda mail: Result.success(get_user(mail)))
+    worker = worker_with(jobs, add_user, [])
+    assert not asyncio.run(worker.run_next_job())
+    now += jobs.lease_seconds + 1
+    assert asyncio.run(worker.run_next_job())
+    saved_job = jobs.job(job.id).success_value
+    assert saved_job.status == "done"
+    assert saved_job.attempts == 2
+
+
+def test_workers_sharing_the_queue_claim_every_job_once(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    first = SqliteWhitelistJobRepository(sqlite_path=path)
+    second = SqliteWhitelistJobRepository(sqlite_path=path)
+    job = first.enqueue("first@test.com").success_value
+    first.enqueue("second@test.com")
+    assert first.claim_next_job("first").success_value.id == job.id
+    # Nobody gets the next job while the first one isn't done, to keep the order
+    assert second.claim_next_job("second").success_value is None
+    done = job.model_copy(update={"status": "done"})
+    assert second.update(done, "second").is_error
+    assert not first.update(done, "first").is_error
+    assert second.claim_next_job("second").success_value.mail == "second@test.com"
+    for repository in (first, second):
+        assert repository.connections is not None
+        repository.connections.close()